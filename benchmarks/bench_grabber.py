@@ -0,0 +1,259 @@
+"""Micro benchmarks for the crawler, parser and log storage hot paths
+
+Run from the repository root:
+
+    python benchmarks/bench_grabber.py --output results.json
+    python benchmarks/bench_grabber.py --quick --compare results.json
+
+Results are written as JSON (one record per benchmark with the median and best time in seconds), so two releases
+can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from source.grabber import Crawler, JobStorageOS, Log, BufferedLog, LogStorageOS, LogStorageSQLite, structured_price, \
+    COMPRESSION_GZIP, JOBS_FILENAME, HISTORY_JSON, HISTORY_SEGMENTED, CENTRAL_LOG_SINGLE, CENTRAL_LOG_SHARDED, \
+    LAST_EXECUTED_FILENAME, LAST_EXECUTED_PREFIX  # noqa: E402
+from source.pricegrabber import storage as storage_module  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'test-data')
+PRICE_QUERY = "//div[contains(@class, 'h-product-price')]/div/text()"
+PAGES = ('shirt', 'pullover')
+HISTORY_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+JOB_COUNTS = (10, 100, 1000, 10000)
+QUICK_HISTORY_SIZES = (10, 1000, 100000)
+QUICK_JOB_COUNTS = (10, 1000)
+JOB_LIST_SIZES = (100, 10000)
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source')
+HANDLERS = ('lambda_invoke_grabber', 'lambda_price_grabber', 'lambda_batch_grabber', 'lambda_compact_grabber')
+HEAVY_MODULES = ('boto3', 'botocore', 'lxml', 'requests', 'yaml')
+
+
+def measure(function, repeat, setup=None) -> dict:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {'median': statistics.median(timings), 'best': min(timings), 'repeat': repeat}
+
+
+def synthetic_history(size) -> list:
+    start = datetime(2018, 1, 1)
+    return [{'executed': (start + timedelta(hours=2 * i)).isoformat(), 'price': '%.2f' % (90 + i % 7)}
+            for i in range(size)]
+
+
+def bench_parse(repeat) -> list:
+    results = []
+    for name in PAGES:
+        with open(os.path.join(TEST_DATA, name + '.html'), 'rb') as page_file:
+            page = page_file.read()
+        for early_exit in (False, True):
+            result = measure(lambda: Crawler.parse_html(page, PRICE_QUERY, early_exit), repeat)
+            result.update({'name': 'parse_html', 'page': name, 'early_exit': early_exit, 'bytes': len(page),
+                           'pages_per_second': 1 / result['median']})
+            results.append(result)
+        result = measure(lambda: structured_price(page), repeat)
+        result.update({'name': 'structured_price', 'page': name, 'bytes': len(page),
+                       'pages_per_second': 1 / result['median']})
+        results.append(result)
+        value = Crawler.parse_html(page, PRICE_QUERY)
+        result = measure(lambda: [Crawler.parse_price(value) for _ in range(1000)], repeat)
+        result.update({'name': 'parse_price_x1000', 'page': name})
+        results.append(result)
+    return results
+
+
+def bench_history(folder, sizes, repeat) -> list:
+    results = []
+    storage = LogStorageOS(folder + '/')
+    for size in sizes:
+        history = synthetic_history(size)
+        for compression in (None, COMPRESSION_GZIP):
+            compressed = LogStorageOS(folder + '/', compression)
+            compressed.save('bench.json', history)
+            result = measure(lambda: compressed.load('bench.json'), repeat)
+            result.update({'name': 'storage_os_load', 'entries': size, 'compression': compression,
+                           'bytes': os.path.getsize(folder + '/bench.json')})
+            results.append(result)
+            result = measure(lambda: compressed.save('bench.json', history), repeat)
+            result.update({'name': 'storage_os_save', 'entries': size, 'compression': compression})
+            results.append(result)
+        storage.save('bench.json', history)
+
+        for history_format in (HISTORY_JSON, HISTORY_SEGMENTED):
+            log = Log(storage, history_format)
+            if history_format == HISTORY_SEGMENTED:
+                # an append only touches today's segment, the last 100 days stand in for the rest of the history
+                for day in range(max(0, size - 1200), size, 12):
+                    segment = history[day:day + 12]
+                    storage.append('bench/' + segment[0]['executed'][:10] + '.jsonl', segment)
+            result = measure(lambda: log._append_to_job_log('bench', '99.00'), repeat,
+                             lambda: storage.save('bench.json', history) if history_format == HISTORY_JSON else None)
+            result.update({'name': 'history_append', 'format': history_format, 'entries': size})
+            results.append(result)
+        storage.delete('bench.json')
+    return results
+
+
+def bench_sqlite_history(folder, sizes, repeat) -> list:
+    results = []
+    storage = LogStorageSQLite(os.path.join(folder, 'bench.db'))
+    log = Log(storage)
+    for size in sizes:
+        job_name = 'bench-%d' % size
+        with storage.transaction():
+            storage.append_history(job_name, synthetic_history(size))
+        result = measure(lambda: log._append_to_job_log(job_name, '99.00'), repeat)
+        result.update({'name': 'history_append', 'format': 'sqlite', 'entries': size})
+        results.append(result)
+        since = datetime(2018, 1, 1) + timedelta(hours=2 * (size - 12))  # the last day of synthetic_history
+        result = measure(lambda: log.history(job_name, since), repeat)
+        result.update({'name': 'history_since', 'format': 'sqlite', 'entries': size})
+        results.append(result)
+        result = measure(lambda: log.latest(job_name), repeat)
+        result.update({'name': 'history_latest', 'format': 'sqlite', 'entries': size})
+        results.append(result)
+    storage.close()
+    return results
+
+
+def log_run(log, jobs):
+    """
+    Logs one execution of every job like a batch run does, BufferedLog writes them when flushed
+    """
+    for job in jobs:
+        log.latest_execution(job['job_name'], '93.00')
+    if isinstance(log, BufferedLog):
+        log.flush()
+
+
+def bench_central_log(folder, job_counts, repeat) -> list:
+    results = []
+    storage = LogStorageOS(folder + '/')
+    now = datetime.utcnow().isoformat()
+    for count in job_counts:
+        jobs = [{'job_name': 'job-%d' % i, 'executed': now, 'price': '90.00'} for i in range(count)]
+        storage.save(LAST_EXECUTED_FILENAME, jobs)
+        for job in jobs:
+            storage.save(LAST_EXECUTED_PREFIX + job['job_name'] + '.json', job)
+        for central_log_format in (CENTRAL_LOG_SINGLE, CENTRAL_LOG_SHARDED):
+            log = Log(storage, central_log_format=central_log_format)
+            last_job = 'job-%d' % (count - 1)  # worst case for the linear scan
+            result = measure(lambda: log._update_central_job_log(last_job, '91.00'), repeat)
+            result.update({'name': 'central_log_update', 'format': central_log_format, 'jobs': count})
+            results.append(result)
+        result = measure(lambda: Log(storage).latest_execution('job-0', '92.00'), repeat)
+        result.update({'name': 'latest_execution', 'jobs': count})
+        results.append(result)
+        for change_only in (False, True):
+            # the same price every run: a full history grows by one entry per run, a change_only one doesn't
+            log = Log(storage, change_only=change_only)
+            result = measure(lambda: log.latest_execution('stable-%d' % change_only, '92.00'), repeat)
+            result.update({'name': 'latest_execution_stable', 'change_only': change_only, 'jobs': count})
+            results.append(result)
+        for log_class in (Log, BufferedLog):
+            result = measure(lambda: log_run(log_class(storage), jobs), repeat)
+            result.update({'name': 'log_run', 'log': log_class.__name__, 'jobs': count})
+            results.append(result)
+    return results
+
+
+def bench_imports(repeat) -> list:
+    """
+    Cold import of every lambda entry point in a fresh interpreter, like the first request of a new container
+    """
+    results = []
+    for handler in HANDLERS:
+        script = 'import sys, %s; print(",".join(m for m in %r if m in sys.modules))' % (handler, HEAVY_MODULES)
+        loaded = []
+        result = measure(lambda: loaded.append(subprocess.check_output([sys.executable, '-c', script], cwd=SOURCE)),
+                         repeat)
+        result.update({'name': 'cold_import', 'handler': handler,
+                       'loaded': [m for m in loaded[-1].decode().strip().split(',') if m]})
+        results.append(result)
+    return results
+
+
+def bench_job_list(folder, sizes, repeat) -> list:
+    results = []
+    for size in sizes:
+        with open(os.path.join(folder, JOBS_FILENAME), 'w') as outfile:
+            outfile.write('sites:\n')
+            for i in range(size):
+                outfile.write('  -\n    job_name: job-%d\n    bucket_name: "bucket"\n'
+                              '    site_url: "https://example.com/%d"\n    html_query: "%s"\n' % (i, i, PRICE_QUERY))
+        for name, manifest, clear in (('cold', False, True), ('manifest', True, True), ('warm', False, False)):
+            storage = JobStorageOS(folder + '/', manifest)
+            storage.load(JOBS_FILENAME)  # writes the manifest and fills the cache
+            result = measure(lambda: storage.load(JOBS_FILENAME), repeat,
+                             storage_module._job_manifests.clear if clear else None)
+            result.update({'name': 'job_list_load', 'load': name, 'jobs': size})
+            results.append(result)
+    return results
+
+
+def key(result) -> str:
+    return json.dumps({k: v for k, v in result.items() if k not in ('median', 'best', 'repeat', 'bytes',
+                                                                     'pages_per_second', 'loaded')}, sort_keys=True)
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, 'r') as infile:
+        baseline = {key(result): result for result in json.load(infile)['results']}
+    print('%-90s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+    for result in results:
+        before = baseline.get(key(result))
+        if before is None:
+            continue
+        print('%-90s %12.6f %12.6f %8.2f' % (key(result), before['median'], result['median'],
+                                             result['median'] / before['median']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast check')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    history_sizes = QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES
+    job_counts = QUICK_JOB_COUNTS if args.quick else JOB_COUNTS
+    results = bench_imports(args.repeat)
+    results.extend(bench_parse(args.repeat))
+    with tempfile.TemporaryDirectory() as folder:
+        results.extend(bench_job_list(folder, JOB_LIST_SIZES, args.repeat))
+    with tempfile.TemporaryDirectory() as folder:
+        results.extend(bench_history(folder, history_sizes, args.repeat))
+    with tempfile.TemporaryDirectory() as folder:
+        results.extend(bench_sqlite_history(folder, history_sizes, args.repeat))
+    with tempfile.TemporaryDirectory() as folder:
+        results.extend(bench_central_log(folder, job_counts, args.repeat))
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(),
+              'created': datetime.utcnow().isoformat(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
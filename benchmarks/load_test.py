@@ -0,0 +1,369 @@
+"""End to end load test of the crawl pipeline without AWS
+
+Runs the real lambda handlers in this process against local stand-ins:
+
+- MemoryS3, an in-memory S3 client for JobStorageS3 and LogStorageS3 counting every operation
+- FakeLambda, a lambda client dispatching grab-price and grab-batch invocations to their handlers on a worker pool
+  sized like the account's concurrency limit
+- ShopServer, local HTTP servers (one per shop, so per host limits apply like in production) serving templated
+  product pages with configurable latency and failure rate
+
+Run from the repository root:
+
+    python benchmarks/load_test.py --jobs 1000 --mode invoke --max-workers 50
+    python benchmarks/load_test.py --jobs 10000 --mode sharded --shard-size 500 --latency 0.2 --failure-rate 0.01
+
+The report (JSON) holds the throughput, latency percentiles per lambda function and per page request, the job
+statuses, the number of jobs in the central log and the S3 operation counts.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source')
+sys.path.insert(0, SOURCE)  # the handlers import pricegrabber like they do on lambda
+
+import lambda_batch_grabber  # noqa: E402
+import lambda_invoke_grabber  # noqa: E402
+import lambda_price_grabber  # noqa: E402
+from pricegrabber.common import aws_clients, JOBS_FILENAME, LAST_EXECUTED_FILENAME  # noqa: E402
+from pricegrabber.crawler import web_fetcher  # noqa: E402
+from pricegrabber.invoker import SHARD_FUNCTION  # noqa: E402
+from pricegrabber.log import LastExecutedStore  # noqa: E402
+from pricegrabber.storage import LogStorageS3, _job_manifests  # noqa: E402
+
+BUCKET = "load-test"
+PRICE_QUERY = "//div[contains(@class, 'h-product-price')]/div/text()"
+HANDLERS = {'grab-price': lambda_price_grabber.lambda_handler, SHARD_FUNCTION: lambda_batch_grabber.lambda_handler}
+PAGE_TEMPLATE = '''<html><head><title>Product %(id)d</title></head><body>
+<div class="h-product-title">Product %(id)d</div>
+<div class="h-product-price"><div>CHF %(price)s</div></div>
+%(padding)s
+</body></html>'''
+
+
+def percentiles(samples) -> dict:
+    if len(samples) == 0:
+        return {}
+    samples = sorted(samples)
+
+    def at(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    return {'count': len(samples), 'p50': at(50), 'p90': at(90), 'p99': at(99), 'max': samples[-1]}
+
+
+def client_error(code, operation):
+    """
+    The botocore ClientError S3 raises, the storages look at response['Error']['Code']
+    """
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class MemoryS3(object):
+    """
+    In-memory S3 client with the calls the storages make: get/put/head/delete_object and the list_objects_v2
+    paginator, ETags, IfNoneMatch/IfMatch conditions and Content-Encoding. latency (seconds) is added to every call.
+    """
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.objects = {}
+        self.operations = Counter()
+        self.bytes = Counter()
+        self._versions = 0
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.operations[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self._call('get_object')
+        with self._lock:
+            item = self.objects.get((Bucket, Key))
+        if item is None:
+            raise client_error('NoSuchKey', 'GetObject')
+        if IfNoneMatch is not None and IfNoneMatch == item['ETag']:
+            raise client_error('304', 'GetObject')
+        with self._lock:
+            self.bytes['read'] += len(item['Body'])
+        response = {'Body': io.BytesIO(item['Body']), 'ETag': item['ETag'], 'ContentLength': len(item['Body'])}
+        if item['ContentEncoding']:
+            response['ContentEncoding'] = item['ContentEncoding']
+        return response
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, ContentEncoding=None, **kwargs):
+        self._call('put_object')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with self._lock:
+            current = self.objects.get((Bucket, Key))
+            if IfNoneMatch == '*' and current is not None or \
+                    IfMatch is not None and (current is None or current['ETag'] != IfMatch):
+                raise client_error('PreconditionFailed', 'PutObject')
+            self._versions += 1
+            self.objects[(Bucket, Key)] = {'Body': Body, 'ETag': '"%d"' % self._versions,
+                                           'ContentEncoding': ContentEncoding}
+            self.bytes['written'] += len(Body)
+        return {'ETag': '"%d"' % self._versions}
+
+    def head_object(self, Bucket, Key):
+        self._call('head_object')
+        with self._lock:
+            item = self.objects.get((Bucket, Key))
+        if item is None:
+            raise client_error('404', 'HeadObject')
+        return {'ETag': item['ETag'], 'ContentLength': len(item['Body'])}
+
+    def delete_object(self, Bucket, Key):
+        self._call('delete_object')
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix='', StartAfter=''):
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix) and
+                          key > StartAfter)
+        for start in range(0, max(1, len(keys)), 1000):
+            self._call('list_objects_v2')
+            yield {'Contents': [{'Key': key} for key in keys[start:start + 1000]]}
+
+
+class FakeLambda(object):
+    """
+    Lambda client running the handlers of HANDLERS in process. At most concurrency invocations run at a time,
+    RequestResponse invocations wait for their slot, Event invocations are queued on the worker pool.
+    """
+
+    def __init__(self, concurrency: int = 100):
+        self.concurrency = concurrency
+        self.latencies = {}
+        self.errors = Counter()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        if InvocationType == 'Event':
+            with self._lock:
+                self._pending.append(self._pool.submit(self._run, FunctionName, Payload))
+            return {'StatusCode': 202, 'Payload': io.BytesIO(b'')}
+        return self._run(FunctionName, Payload)
+
+    def _run(self, function_name, payload):
+        with self._slots:
+            started = time.perf_counter()
+            response = {'StatusCode': 200}
+            try:
+                result = HANDLERS[function_name](json.loads(payload), None)
+                response['Payload'] = io.BytesIO(json.dumps(result).encode('utf-8'))
+            except Exception as e:
+                # lambda answers 200 for a failed function, the error is in FunctionError and the payload
+                response['FunctionError'] = 'Unhandled'
+                response['Payload'] = io.BytesIO(json.dumps({'errorMessage': str(e)}).encode('utf-8'))
+                with self._lock:
+                    self.errors[function_name] += 1
+            with self._lock:
+                self.latencies.setdefault(function_name, []).append(time.perf_counter() - started)
+        return response
+
+    def wait(self):
+        """
+        Waits until every Event invocation, including the ones they started, is done
+        """
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if len(pending) == 0:
+                return
+            for future in pending:
+                future.result()
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+class ShopHandler(BaseHTTPRequestHandler):
+    """
+    /product/<id> is a product page with a price derived from the id, padded to the page size of the server
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        shop = self.server.shop
+        started = time.perf_counter()
+        if shop.latency:
+            time.sleep(random.expovariate(1 / shop.latency))
+        if random.random() < shop.failure_rate:
+            status, body = 503, b'Service Unavailable'
+        else:
+            product = int(self.path.rsplit('/', 1)[-1])
+            status = 200
+            body = (PAGE_TEMPLATE % {'id': product, 'price': '%.2f' % (10 + product % 90),
+                                     'padding': '<p>review</p>\n' * shop.padding}).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+        shop.record(status, time.perf_counter() - started)
+
+    def log_message(self, *args):
+        pass
+
+
+class ShopServer(object):
+    """
+    One local shop: latency is the mean of an exponential delay in seconds, failure_rate the share of 503 answers
+    """
+
+    def __init__(self, latency: float = 0, failure_rate: float = 0, page_kb: int = 50):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.padding = page_kb * 1024 // len('<p>review</p>\n')
+        self.statuses = Counter()
+        self.latencies = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ShopHandler)
+        self.server.daemon_threads = True
+        self.server.shop = self
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def record(self, status, latency):
+        with self._lock:
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def job_list(shops, count, jobs_per_page: int = 1) -> str:
+    sites = []
+    for i in range(count):
+        product = i // jobs_per_page
+        sites.append({'job_name': 'job-%d' % i, 'bucket_name': BUCKET, 'html_query': PRICE_QUERY,
+                      'site_url': '%s/product/%d' % (shops[product % len(shops)].url, product)})
+    return json.dumps({'sites': sites})  # JSON is valid YAML
+
+
+def run(jobs: int, mode: str = 'invoke', shops: int = 20, latency: float = 0.05, failure_rate: float = 0,
+        page_kb: int = 50, jobs_per_page: int = 1, max_workers: int = 50, concurrency: int = 100,
+        shard_size: int = 500, s3_latency: float = 0, min_interval: float = 0, max_per_host: int = 8) -> dict:
+    """
+    Crawls jobs through the handlers in mode invoke (grab-invoke calling grab-price), batch (one grab-batch) or
+    sharded (grab-invoke fanning out grab-batch shards, then aggregating). Returns the report
+    """
+    servers = [ShopServer(latency, failure_rate, page_kb) for _ in range(shops)]
+    s3 = MemoryS3(s3_latency)
+    lambda_client = FakeLambda(concurrency)
+    aws_clients.override('s3', s3)
+    aws_clients.override('lambda', lambda_client)
+    _job_manifests.clear()
+    web_fetcher.min_interval = min_interval
+    web_fetcher.max_per_host = max_per_host
+    web_fetcher.pool_size = max(web_fetcher.pool_size, shops)
+    s3.put_object(Bucket=BUCKET, Key=JOBS_FILENAME, Body=job_list(servers, jobs, jobs_per_page))
+    s3.operations.clear()
+    try:
+        started = time.perf_counter()
+        event = {'bucket_name': BUCKET}
+        if mode == 'invoke':
+            event['max_workers'] = max_workers
+            result = json.loads(lambda_invoke_grabber.lambda_handler(event, None))
+        elif mode == 'batch':
+            event['fetch_workers'] = max_workers
+            result = json.loads(lambda_batch_grabber.lambda_handler(event, None))
+        elif mode == 'sharded':
+            event.update({'shard_size': shard_size, 'max_workers': max_workers})
+            run_id = json.loads(lambda_invoke_grabber.lambda_handler(event, None))['run_id']
+            lambda_client.wait()
+            result = json.loads(lambda_invoke_grabber.lambda_handler({'bucket_name': BUCKET, 'run_id': run_id},
+                                                                     None))['jobs']
+        else:
+            raise Exception("Unknown mode: " + mode)
+        seconds = time.perf_counter() - started
+        operations = dict(s3.operations)
+        # every job that was grabbed has to show up in the central log, concurrent writers must not lose entries
+        storage = LogStorageS3(BUCKET)
+        central_log = storage.load(LAST_EXECUTED_FILENAME) or LastExecutedStore(storage).aggregate()
+    finally:
+        aws_clients.override('s3', None)
+        aws_clients.override('lambda', None)
+        lambda_client.shutdown()
+        for server in servers:
+            server.shutdown()
+    statuses = Counter(str(item['status']) for item in result)
+    web_statuses = Counter()
+    page_latencies = []
+    for server in servers:
+        web_statuses.update(server.statuses)
+        page_latencies.extend(server.latencies)
+    return {
+        'mode': mode,
+        'jobs': jobs,
+        'seconds': seconds,
+        'jobs_per_second': jobs / seconds if seconds else None,
+        'statuses': dict(statuses),
+        'lambda': {name: percentiles(latencies) for name, latencies in lambda_client.latencies.items()},
+        'lambda_errors': dict(lambda_client.errors),
+        'pages': percentiles(page_latencies),
+        'page_statuses': {str(status): count for status, count in web_statuses.items()},
+        'central_log_entries': len(central_log),
+        'storage': {'operations': operations, 'read_bytes': s3.bytes['read'],
+                    'written_bytes': s3.bytes['written'], 'objects': len(s3.objects)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=1000)
+    parser.add_argument('--mode', choices=('invoke', 'batch', 'sharded'), default='invoke')
+    parser.add_argument('--shops', type=int, default=20, help='local shop servers, one host each')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean page latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of pages answered with 503')
+    parser.add_argument('--page-kb', type=int, default=50)
+    parser.add_argument('--jobs-per-page', type=int, default=1)
+    parser.add_argument('--max-workers', type=int, default=50, help='grab-invoke max_workers, grab-batch threads')
+    parser.add_argument('--concurrency', type=int, default=100, help='lambda concurrency limit')
+    parser.add_argument('--shard-size', type=int, default=500)
+    parser.add_argument('--s3-latency', type=float, default=0, help='seconds added to every S3 call')
+    parser.add_argument('--min-interval', type=float, default=0, help='seconds between two requests to a shop')
+    parser.add_argument('--max-per-host', type=int, default=8, help='requests in flight per shop')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    report = run(args.jobs, args.mode, args.shops, args.latency, args.failure_rate, args.page_kb,
+                 args.jobs_per_page, args.max_workers, args.concurrency, args.shard_size, args.s3_latency,
+                 args.min_interval, args.max_per_host)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
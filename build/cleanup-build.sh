@@ -4,7 +4,7 @@
 cd ../source
 shopt -s extglob
 sudo rm -- *.!(py|txt|yml)
-sudo rm -R -- */
+sudo rm -R -- !(pricegrabber)/
 sudo rm six.py
 cd ..
 rm template-export.yml
\ No newline at end of file
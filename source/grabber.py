@@ -1,278 +1,50 @@
 """Grabber web scrapper functions
 
-"""
-from abc import ABC, abstractmethod
-from urllib.request import urlopen
-import lxml.html
-import re
-import boto3
-from botocore.exceptions import ClientError
-from datetime import date, datetime
-import json
-import yaml
-from pathlib import Path
-
-JOBS_FILENAME: str = "website-monitor-list.yml"
-LAST_EXECUTED_FILENAME: str = "job-last-executed.json"
-AWS_REGION: str = "eu-central-1"
-
-class AbstractLogStorage(ABC):
-    """
-    Log storage can be implemented for S3 or local hard disk (JSON files)
-    """
-
-    @abstractmethod
-    def load(self, object_name: str) -> []:
-        pass
-
-    @abstractmethod
-    def save(self, object_name: str, logs: []):
-        pass
-
-    @abstractmethod
-    def check_exists(self, object_name: str) -> bool:
-        pass
-
-
-class AbstractJobsStorage(ABC):
-    """
-    Jobs can be loaded from S3 or local hard disk (YML files)
-    """
-
-    @abstractmethod
-    def load(self, object_name: str) -> dict:
-        pass
-
-
-class Invoker(object):
-    """
-    Calls web crawler using the list found in the JOBS_FILENAME
-    """
-
-    def __init__(self, storage: AbstractJobsStorage):
-        self.storage = storage
-
-    def get_website_monitor_list(self):
-        return self.storage.load(JOBS_FILENAME)
-
-    def grab(self) -> str:
-        """
-        Grabs prices from websites listed in the yaml file. Returns json list if job_name and HTTP status code
-        """
-        website_list = self.get_website_monitor_list()
-        result = []
-        for site in website_list['sites']:
-            events = {
-                'job_name': site['job_name'],
-                'site_url': site['site_url'],
-                'html_query': site['html_query'],
-                'bucket_name': site['bucket_name']
-            }
-            events_payload = json.dumps(events)
-            response = self._invoke_lambda(events_payload)
-            status = self._decode_status_code(response)
-            job_status = {
-                'job_name': site['job_name'],
-                'status': status
-            }
-            result.append(job_status)
-        return json.dumps(result)
-
-    @staticmethod
-    def _invoke_lambda(json_payload: str):
-        client = boto3.client('lambda', region_name=AWS_REGION)
-        return client.invoke(FunctionName='grab-price',
-                             InvocationType='RequestResponse',
-                             Payload=json_payload)
-
-    @staticmethod
-    def _decode_payload(response):
-        return response['Payload'].read().decode("utf-8")
-
-    @staticmethod
-    def _decode_status_code(response):
-        return response['StatusCode']
-
-
-class Crawler(object):
-    """
-    Gets a web page, parses using the lxml query you give, logs execution/price and returns a price
-    """
-
-    def __init__(self, storage: AbstractLogStorage):
-        self.storage = storage
-
-    def grab_price(self, job_name, url, query):
-        page = self.get_web_page(url)
-        data = self.parse_html(page, query)
-        price = self.parse_price(data)
-        Log(self.storage).latest_execution(job_name, price)
-        return price
-
-    @staticmethod
-    def get_web_page(url):
-        response = urlopen(url)
-        return response.read()
-
-    @staticmethod
-    def parse_html(page, find):
-        doc = lxml.html.document_fromstring(page)
-        result = doc.xpath(find)
-        if len(result) != 1:
-            raise Exception("Couldn't find string in HTML: " + find)
-        return result[0]
-
-    @staticmethod
-    def parse_price(value):
-        result = re.findall(r"\d+\.\d+", value)
-        if len(result) != 1:
-            raise Exception("Couldn't parse the price from value :" + value)
-        return result[0]
-
-
-class JobStorageS3(AbstractJobsStorage):
-    """
-    Load jobs from Amazon S3
-    """
-
-    def __init__(self, s3_bucket: str):
-        self.s3_bucket = s3_bucket
-
-    def load(self, object_name):
-        s3 = boto3.resource('s3', region_name=AWS_REGION)
-        obj = s3.Object(self.s3_bucket, object_name)
-        stream = obj.get()['Body'].read().decode('utf-8')
-        return yaml.load(stream)
-
+The code lives in the pricegrabber package, this module re-exports it for code importing source.grabber. The lambda
+entry points import the pricegrabber modules directly, so they only load what their path needs.
 
-class JobStorageOS(AbstractJobsStorage):
-    """
-    Load jobs from local hard disk
-    """
-
-    def __init__(self, filepath):
-        self.filepath = filepath
-
-    def load(self, object_name):
-        with open(self.filepath + object_name, 'r') as logfile:
-            return yaml.load(logfile)
-
-
-class LogStorageS3(AbstractLogStorage):
-    """
-    Load and save logs to Amazon S3
-    """
-
-    def __init__(self, s3_bucket: str):
-        self.s3_bucket = s3_bucket
-
-    def load(self, object_name):
-        if self.check_exists(object_name):
-            s3 = boto3.resource('s3', region_name=AWS_REGION)
-            obj = s3.Object(self.s3_bucket, object_name)
-            stream = obj.get()['Body'].read().decode('utf-8')
-            return json.loads(stream)
-        return []
-
-    def check_exists(self, object_name):
-        s3 = boto3.resource('s3', region_name=AWS_REGION)
-        try:
-            s3.Object(self.s3_bucket, object_name).load()
-            return True
-        except ClientError as e:
-            if e.response['Error']['Code'] == "404":
-                return False
-            raise
-
-    def save(self, object_name, logs):
-        s3 = boto3.resource('s3', region_name=AWS_REGION)
-        obj = s3.Object(self.s3_bucket, object_name)
-        obj.put(Body=json.dumps(logs))
-
-
-class LogStorageOS(AbstractLogStorage):
-    """
-    Load and save logs to local hard disk
-    """
-
-    def __init__(self, filepath):
-        self.filepath = filepath
-
-    def load(self, object_name):
-        if self.check_exists(object_name):
-            with open(self.filepath + object_name, 'r') as logfile:
-                return json.load(logfile)
-        return []
-
-    def check_exists(self, object_name):
-        my_file = Path(self.filepath + object_name)
-        return my_file.is_file()
-
-    def save(self, object_name, logs):
-        with open(self.filepath + object_name, 'w') as outfile:
-            json.dump(logs, outfile)
-
-
-class Log(object):
-    """
-    Stores latest execution information
-
-    Note: The central log file is not supposed to be kept forever. You need to aggregate the data and empty it. If
-    you don't, then your program will become slower and also cost more to run over the long term.
-    """
-
-    FEATURE_ENABLED = True  # can be removed once S3 bucket is integrated
-
-    def __init__(self, storage: AbstractLogStorage):
-        self.storage = storage
-
-    def latest_execution(self, job_name, price):
-        if not self.FEATURE_ENABLED:
-            return
-        self._append_to_job_log(job_name, price)  # each job gets its own file with price history
-        self._update_central_job_log(job_name, price)  # goes into the LAST_EXECUTED_FILENAME
-
-    def _append_to_job_log(self, job_name, price):
-        log_file = job_name + ".json"
-        jobs = self.storage.load(log_file)
-        jobs.append(self._create_job_executed_log(price))
-        self.storage.save(log_file, jobs)
-
-    def _update_central_job_log(self, job_name, price):
-        jobs = self.storage.load(LAST_EXECUTED_FILENAME)
-        self._update(jobs, job_name, price)
-        self.storage.save(LAST_EXECUTED_FILENAME, jobs)
-
-    def _update(self, jobs, job_name, price):
-        pos = self._find(jobs, 'job_name', job_name)
-        if pos == -1:
-            new_job = self._create_job_name_executed_log(job_name, price)
-            jobs.append(new_job)
-        else:
-            data = jobs[pos]
-            self._update_job_executed_log(data, price)
-
-    def _create_job_name_executed_log(self, job_name, price) -> dict:
-        return {'job_name': job_name, 'executed': self._json_serial(datetime.utcnow()), 'price': price}
-
-    def _create_job_executed_log(self, price) -> dict:
-        return {'executed': self._json_serial(datetime.utcnow()), 'price': price}
-
-    def _update_job_executed_log(self, data, price):
-        data['executed'] = self._json_serial(datetime.utcnow())
-        data['price'] = price
-
-    @staticmethod
-    def _json_serial(obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        raise TypeError("Type %s not serializable" % type(obj))
-
-    @staticmethod
-    def _find(job_list, key, value):
-        if len(job_list) == 0:
-            return -1
-        for i, dic in enumerate(job_list):
-            if dic[key] == value:
-                return i
-        return -1
+Only source.grabber is supported: from inside source/ (where the lambda handlers run) import pricegrabber instead.
+"""
+if not __package__:
+    raise ImportError("grabber re-exports the pricegrabber package relatively, import source.grabber or pricegrabber")
+
+from .pricegrabber.common import JOBS_FILENAME, LAST_EXECUTED_FILENAME, AWS_REGION, STATUS_OK, STATUS_ACCEPTED, \
+    STATUS_TIMEOUT, STATUS_ERROR, AWS_MAX_POOL_CONNECTIONS, HISTORY_JSON, HISTORY_SEGMENTED, HISTORY_INDEXED, \
+    CENTRAL_LOG_SINGLE, CENTRAL_LOG_SHARDED, LAST_EXECUTED_PREFIX, CAS_RETRIES, CAS_BACKOFF, CAS_MAX_BACKOFF, \
+    CAS_DEADLINE, METRICS_NAMESPACE, BATCH_FETCH_WORKERS, BATCH_PARSE_WORKERS, AwsClients, aws_clients, \
+    Metrics, metrics, timed, run_profiled, to_json_lines, from_json_lines, parse_time
+from .pricegrabber.storage import JOB_MANIFEST_SUFFIX, JOB_REQUIRED_FIELDS, COMPRESSION_GZIP, GZIP_MAGIC, GZIP_LEVEL, \
+    LOCK_SUFFIX, SQLITE_TIMEOUT, AbstractLogStorage, AbstractHistoryStorage, AbstractJobsStorage, JobStorageS3, \
+    JobStorageOS, manifest_name, parse_jobs, LogStorageS3, LogStorageOS, LogStorageSQLite
+from .pricegrabber.log import ROLLUP_PREFIX, LOG_FLUSH_WORKERS, LOG_MAX_PENDING, LOG_MAX_AGE, RAW_RETENTION_DAYS, \
+    HOURLY_RETENTION_DAYS, cas_backoff, LastExecutedStore, Log, BufferedLog, Compactor
+from .pricegrabber.alerts import ALERTS_FILENAME, AbstractNotifier, StdoutNotifier, FileNotifier, AlertEngine
+from .pricegrabber.structured import SOURCE_JSON_LD, SOURCE_OPEN_GRAPH, SOURCE_ITEMPROP, SOURCE_XPATH, structured_price
+from .pricegrabber.crawler import PAGE_CACHE_PREFIX, HOST_MAX_CONCURRENCY, HOST_MIN_INTERVAL, HOST_POOL_SIZE, \
+    PARSE_CHUNK_SIZE, FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT, FETCH_RETRIES, FETCH_BACKOFF, FETCH_BACKOFF_MAX, \
+    FETCH_DEADLINE, FETCH_RETRY_STATUSES, BREAKER_THRESHOLD, BREAKER_COOLDOWN, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, \
+    HEDGE_WINDOW, HEDGE_WORKERS, FETCH_MAX_BYTES, FETCH_CHUNK_SIZE, Fetcher, web_fetcher, Crawler, compiled_xpath, \
+    BatchCrawler
+from .pricegrabber.invoker import MAX_CONCURRENT_INVOCATIONS, INVOKE_TIMEOUT, SCHEDULE_FILENAME, \
+    SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL, SCHEDULE_TOLERANCE, SHARD_SIZE, SHARD_FUNCTION, RUNS_PREFIX, \
+    Invoker, Scheduler
+
+__all__ = ['JOBS_FILENAME', 'LAST_EXECUTED_FILENAME', 'AWS_REGION', 'STATUS_OK', 'STATUS_ACCEPTED', 'STATUS_TIMEOUT',
+           'STATUS_ERROR', 'AWS_MAX_POOL_CONNECTIONS', 'HISTORY_JSON', 'HISTORY_SEGMENTED', 'HISTORY_INDEXED',
+           'CENTRAL_LOG_SINGLE', 'CENTRAL_LOG_SHARDED', 'LAST_EXECUTED_PREFIX', 'CAS_RETRIES', 'CAS_BACKOFF',
+           'CAS_MAX_BACKOFF', 'CAS_DEADLINE', 'METRICS_NAMESPACE', 'BATCH_FETCH_WORKERS', 'BATCH_PARSE_WORKERS',
+           'AwsClients', 'aws_clients', 'Metrics', 'metrics', 'timed', 'run_profiled', 'to_json_lines',
+           'from_json_lines', 'parse_time', 'JOB_MANIFEST_SUFFIX', 'JOB_REQUIRED_FIELDS', 'COMPRESSION_GZIP',
+           'GZIP_MAGIC', 'GZIP_LEVEL', 'LOCK_SUFFIX', 'SQLITE_TIMEOUT', 'AbstractLogStorage', 'AbstractHistoryStorage',
+           'AbstractJobsStorage', 'JobStorageS3', 'JobStorageOS', 'manifest_name', 'parse_jobs', 'LogStorageS3',
+           'LogStorageOS', 'LogStorageSQLite', 'ROLLUP_PREFIX', 'LOG_FLUSH_WORKERS', 'LOG_MAX_PENDING', 'LOG_MAX_AGE',
+           'RAW_RETENTION_DAYS', 'HOURLY_RETENTION_DAYS', 'cas_backoff', 'LastExecutedStore', 'Log', 'BufferedLog',
+           'Compactor', 'ALERTS_FILENAME', 'AbstractNotifier', 'StdoutNotifier', 'FileNotifier', 'AlertEngine',
+           'SOURCE_JSON_LD', 'SOURCE_OPEN_GRAPH', 'SOURCE_ITEMPROP', 'SOURCE_XPATH', 'structured_price',
+           'PAGE_CACHE_PREFIX', 'HOST_MAX_CONCURRENCY', 'HOST_MIN_INTERVAL', 'HOST_POOL_SIZE', 'PARSE_CHUNK_SIZE',
+           'FETCH_CONNECT_TIMEOUT', 'FETCH_READ_TIMEOUT', 'FETCH_RETRIES', 'FETCH_BACKOFF', 'FETCH_BACKOFF_MAX',
+           'FETCH_DEADLINE', 'FETCH_RETRY_STATUSES', 'BREAKER_THRESHOLD', 'BREAKER_COOLDOWN', 'HEDGE_PERCENTILE',
+           'HEDGE_MIN_SAMPLES', 'HEDGE_WINDOW', 'HEDGE_WORKERS', 'FETCH_MAX_BYTES', 'FETCH_CHUNK_SIZE', 'Fetcher',
+           'web_fetcher', 'Crawler', 'compiled_xpath', 'BatchCrawler', 'MAX_CONCURRENT_INVOCATIONS', 'INVOKE_TIMEOUT',
+           'SCHEDULE_FILENAME', 'SCHEDULE_MIN_INTERVAL', 'SCHEDULE_MAX_INTERVAL', 'SCHEDULE_TOLERANCE', 'SHARD_SIZE',
+           'SHARD_FUNCTION', 'RUNS_PREFIX', 'Invoker', 'Scheduler']
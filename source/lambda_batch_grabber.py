@@ -0,0 +1,47 @@
+from pricegrabber.alerts import StdoutNotifier
+from pricegrabber.common import metrics, run_profiled, BATCH_FETCH_WORKERS, BATCH_PARSE_WORKERS
+from pricegrabber.invoker import Invoker
+from pricegrabber.storage import JobStorageS3, LogStorageS3
+import json
+
+
+def lambda_handler(event, context):
+    assert_required(event)
+    metrics.reset()  # warm lambdas keep the module
+    storage = JobStorageS3(event['bucket_name'], manifest=event.get('job_manifest', False))
+    job = Invoker(storage, schedule=bool(event.get('schedule', False)),
+                  notifier=StdoutNotifier() if event.get('alerts') else None)
+    fetch_workers = int(event.get('fetch_workers', BATCH_FETCH_WORKERS))
+    parse_workers = int(event.get('parse_workers', BATCH_PARSE_WORKERS))
+    if 'run_id' in event:
+        # one shard of a run started by grab-invoke with shard_size
+        result = job.grab_shard(LogStorageS3(event['bucket_name']), event['run_id'], int(event['shard']),
+                                fetch_workers=fetch_workers, parse_workers=parse_workers)
+    elif event.get('profile'):
+        result = run_profiled(job.grab_batch, fetch_workers=fetch_workers, parse_workers=parse_workers)
+    else:
+        result = job.grab_batch(fetch_workers=fetch_workers, parse_workers=parse_workers)
+    return with_metrics(event, result)
+
+
+def with_metrics(event, result):
+    if event.get('emit_metrics'):
+        print(json.dumps(metrics.emf(dimensions={'FunctionName': 'grab-batch'})))
+    if event.get('metrics'):
+        return json.dumps({'jobs': json.loads(result), 'metrics': metrics.snapshot()})
+    return result
+
+
+def assert_required(event):
+    if 'bucket_name' not in event:
+        raise Exception("The 'bucket_name' key is missing from the event dictionary.")
+
+
+if __name__ == '__main__':
+    events = {
+        "bucket_name": "aws-lambda-price-grabber"
+    }
+
+    result = lambda_handler(events, "")
+
+    print(result)
@@ -0,0 +1,30 @@
+from pricegrabber.common import JOBS_FILENAME
+from pricegrabber.log import Compactor, RAW_RETENTION_DAYS
+from pricegrabber.storage import JobStorageS3, LogStorageS3
+
+
+def lambda_handler(event, context):
+    assert_required(event)
+    storage = JobStorageS3(event['bucket_name'], manifest=event.get('job_manifest', False))
+    website_list = storage.load(JOBS_FILENAME)
+    retention_days = int(event.get('retention_days', RAW_RETENTION_DAYS))
+    result = []
+    for site in website_list['sites']:
+        compactor = Compactor(LogStorageS3(site['bucket_name']), retention_days)
+        result.append(compactor.compact(site['job_name']))
+    return result
+
+
+def assert_required(event):
+    if 'bucket_name' not in event:
+        raise Exception("The 'bucket_name' key is missing from the event dictionary.")
+
+
+if __name__ == '__main__':
+    events = {
+        "bucket_name": "aws-lambda-price-grabber"
+    }
+
+    result = lambda_handler(events, "")
+
+    print(result)
@@ -1,11 +1,36 @@
-from grabber import Invoker, JobStorageS3
+from pricegrabber.alerts import StdoutNotifier
+from pricegrabber.common import metrics, run_profiled
+from pricegrabber.invoker import Invoker, MAX_CONCURRENT_INVOCATIONS, INVOKE_TIMEOUT
+from pricegrabber.storage import JobStorageS3, LogStorageS3
+import json
 
 
 def lambda_handler(event, context):
     assert_required(event)
-    storage = JobStorageS3(event['bucket_name'])
-    job = Invoker(storage)
-    return job.grab()
+    metrics.reset()  # warm lambdas keep the module
+    storage = JobStorageS3(event['bucket_name'], manifest=event.get('job_manifest', False))
+    job = Invoker(storage,
+                  max_workers=int(event.get('max_workers', MAX_CONCURRENT_INVOCATIONS)),
+                  invoke_timeout=int(event.get('invoke_timeout', INVOKE_TIMEOUT)),
+                  schedule=bool(event.get('schedule', False)),
+                  notifier=StdoutNotifier() if event.get('alerts') else None)
+    if 'run_id' in event:
+        # final step of a sharded run
+        result = job.aggregate(LogStorageS3(event['bucket_name']), event['run_id'])
+    elif 'shard_size' in event:
+        shard_event = {key: event[key] for key in ('bucket_name', 'job_manifest', 'schedule') if key in event}
+        result = job.fan_out(LogStorageS3(event['bucket_name']), int(event['shard_size']), shard_event)
+    else:
+        result = run_profiled(job.grab) if event.get('profile') else job.grab()
+    return with_metrics(event, result)
+
+
+def with_metrics(event, result):
+    if event.get('emit_metrics'):
+        print(json.dumps(metrics.emf(dimensions={'FunctionName': 'grab-invoke'})))
+    if event.get('metrics'):
+        return json.dumps({'jobs': json.loads(result), 'metrics': metrics.snapshot()})
+    return result
 
 
 def assert_required(event):
@@ -15,7 +40,8 @@ def assert_required(event):
 
 if __name__ == '__main__':
     events = {
-        "bucket_name": "aws-lambda-price-grabber"
+        "bucket_name": "aws-lambda-price-grabber",
+        "max_workers": 10
     }
 
     result = lambda_handler(events, "")
@@ -1,22 +1,51 @@
-from grabber import Crawler, LogStorageS3
+from pricegrabber.common import metrics, run_profiled
+from pricegrabber.crawler import Crawler
+from pricegrabber.storage import LogStorageS3
 import json
 
 
 def lambda_handler(event, context):
     assert_required(event)
+    metrics.reset()  # warm lambdas keep the module
     storage = LogStorageS3(event['bucket_name'])
-    web = Crawler(storage)
-    price = web.grab_price(event['job_name'], event['site_url'], event['html_query'])
-    return json.dumps({'site_url': event['site_url'], 'price': price})
+    web = Crawler(storage, structured=event.get('structured'), stop_at=event.get('stop_at'))
+    if 'jobs' in event:
+        # several jobs watching the same page, fetched and parsed once
+        if event.get('profile'):
+            result = run_profiled(web.grab_page, event['site_url'], event['jobs'])
+        else:
+            result = web.grab_page(event['site_url'], event['jobs'])
+        jobs = [{'job_name': item['job_name'], 'price': item['price'], 'status': item['status'],
+                 'source': item['source'], 'error': None if item['error'] is None else str(item['error'])}
+                for item in result]
+        emit_metrics(event)
+        return json.dumps({'site_url': event['site_url'], 'jobs': jobs, 'metrics': metrics.snapshot()})
+    jobs = [{'job_name': event['job_name'], 'html_query': event['html_query']}]
+    if event.get('profile'):
+        result = run_profiled(web.grab_page, event['site_url'], jobs)[0]
+    else:
+        result = web.grab_page(event['site_url'], jobs)[0]
+    emit_metrics(event)
+    if result['error'] is not None:
+        raise result['error']
+    return json.dumps({'site_url': event['site_url'], 'price': result['price'], 'source': result['source'],
+                       'metrics': metrics.snapshot()})
+
+
+def emit_metrics(event):
+    if event.get('emit_metrics'):
+        print(json.dumps(metrics.emf(dimensions={'FunctionName': 'grab-price'})))
 
 
 def assert_required(event):
     if 'bucket_name' not in event:
         raise Exception("The 'bucket_name' key is missing from the event dictionary.")
-    if 'job_name' not in event:
-        raise Exception("The 'job_name' key is missing from the event dictionary.")
     if 'site_url' not in event:
         raise Exception("The 'site_url' key is missing from the event dictionary.")
+    if 'jobs' in event:
+        return
+    if 'job_name' not in event:
+        raise Exception("The 'job_name' key is missing from the event dictionary.")
     if 'html_query' not in event:
         raise Exception("The 'html_query' key is missing from the event dictionary.")
 
@@ -0,0 +1,5 @@
+"""Price grabber: crawls product pages for their price and logs it
+
+The modules only import what their own path needs, so each lambda entry point pays for as little as possible at
+cold start: grab-invoke doesn't load lxml or requests, grab-price doesn't load PyYAML.
+"""
@@ -0,0 +1,114 @@
+"""Price alerts for alert_whenever / difference in the jobs list
+
+"""
+from abc import ABC, abstractmethod
+import json
+
+from .common import to_json_lines, LAST_EXECUTED_FILENAME, CENTRAL_LOG_SHARDED
+from .log import LastExecutedStore, Log
+from .storage import AbstractLogStorage
+
+ALERTS_FILENAME: str = "job-alerts.json"
+
+
+class AbstractNotifier(ABC):
+    """
+    Sends the alerts of a run, e.g. by e-mail or SNS. StdoutNotifier and FileNotifier are local stand-ins
+    """
+
+    @abstractmethod
+    def notify(self, alerts: []):
+        pass
+
+
+class StdoutNotifier(AbstractNotifier):
+    """
+    Prints one JSON line per alert, which ends up in CloudWatch when running in lambda
+    """
+
+    def notify(self, alerts):
+        for alert in alerts:
+            print(json.dumps(alert))
+
+
+class FileNotifier(AbstractNotifier):
+    """
+    Appends one JSON line per alert to a local file
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def notify(self, alerts):
+        with open(self.filepath, 'a') as outfile:
+            outfile.write(to_json_lines(alerts))
+
+
+class AlertEngine(object):
+    """
+    Evaluates alert_whenever and difference (pct or val) of the jobs against their last executed record only.
+
+    Every job has a reference price in ALERTS_FILENAME: the price it was first seen or last alerted at, trailing the
+    price while it moves the other way (for a drop alert the reference follows rising prices). An alert fires when
+    the difference to the reference passes alert_whenever, which also resets the reference, so an alert isn't sent
+    again for the same move. An execution that was already evaluated is skipped.
+    """
+
+    def __init__(self, storage: AbstractLogStorage, central_log_format: str = None):
+        self.storage = storage
+        self.central_log_format = central_log_format or Log.CENTRAL_LOG_FORMAT
+
+    def evaluate(self, sites) -> []:
+        """
+        Returns the alerts of the given sites. Sites without alert_whenever are ignored
+        """
+        sites = [site for site in sites if site.get('alert_whenever') not in (None, '')]
+        if len(sites) == 0:
+            return []
+        last_executed = self._last_executed(sites)
+        state = self.storage.load(ALERTS_FILENAME) or {}
+        alerts = []
+        for site in sites:
+            record = last_executed.get(site['job_name'])
+            if record is None:
+                continue
+            alert = self._evaluate(site, record, state)
+            if alert is not None:
+                alerts.append(alert)
+        self.storage.save(ALERTS_FILENAME, state)
+        return alerts
+
+    @staticmethod
+    def _evaluate(site, record, state):
+        job_name = site['job_name']
+        price = float(record['price'])
+        threshold = float(site['alert_whenever'])
+        entry = state.get(job_name)
+        if entry is None:
+            state[job_name] = {'reference': price, 'executed': record['executed']}
+            return None
+        if entry['executed'] == record['executed']:
+            return None
+        entry['executed'] = record['executed']
+        reference = entry['reference']
+        difference = price - reference
+        if site.get('difference') == 'pct':
+            difference = difference / reference * 100 if reference else 0
+        if (threshold < 0 and difference <= threshold) or (threshold > 0 and difference >= threshold):
+            entry['reference'] = price
+            return {'job_name': job_name, 'site_url': site.get('site_url'), 'executed': record['executed'],
+                    'price': record['price'], 'reference': reference, 'difference': round(difference, 2),
+                    'unit': site.get('difference', 'val'), 'alert_whenever': site['alert_whenever']}
+        entry['reference'] = max(reference, price) if threshold < 0 else min(reference, price)
+        return None
+
+    def _last_executed(self, sites) -> dict:
+        if self.central_log_format == CENTRAL_LOG_SHARDED:
+            store = LastExecutedStore(self.storage)
+            records = {}
+            for site in sites:
+                record = store.get(site['job_name'])
+                if record is not None:
+                    records[site['job_name']] = record
+            return records
+        return {job['job_name']: job for job in self.storage.load(LAST_EXECUTED_FILENAME)}
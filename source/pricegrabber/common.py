@@ -0,0 +1,196 @@
+"""Settings and helpers shared by all price grabber modules
+
+Nothing heavy is imported here: boto3 is loaded the first time a client is needed.
+"""
+from datetime import datetime
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+
+JOBS_FILENAME: str = "website-monitor-list.yml"
+LAST_EXECUTED_FILENAME: str = "job-last-executed.json"
+AWS_REGION: str = "eu-central-1"
+STATUS_OK: int = 200
+STATUS_ACCEPTED: int = 202  # asynchronous invocation queued
+STATUS_TIMEOUT: int = 504
+STATUS_ERROR: int = 500
+AWS_MAX_POOL_CONNECTIONS: int = 10  # botocore default
+HISTORY_JSON: str = "json"  # one <job>.json array, rewritten on every execution
+HISTORY_SEGMENTED: str = "segmented"  # append-only <job>/<day>.jsonl segments
+HISTORY_INDEXED: str = "indexed"  # rows indexed by (job_name, executed) in an AbstractHistoryStorage
+CENTRAL_LOG_SINGLE: str = "single"  # all jobs in LAST_EXECUTED_FILENAME
+CENTRAL_LOG_SHARDED: str = "sharded"  # one object per job under LAST_EXECUTED_PREFIX
+LAST_EXECUTED_PREFIX: str = "last-executed/"
+CAS_RETRIES: int = 10
+CAS_BACKOFF: float = 0.01  # seconds before the first retry of a conflicting write, doubled on every retry
+CAS_MAX_BACKOFF: float = 0.25  # seconds
+CAS_DEADLINE: float = 1.0  # seconds a conflicting write keeps retrying, grab-price has 5 for the fetch and the logs
+METRICS_NAMESPACE: str = "PriceGrabber"
+BATCH_FETCH_WORKERS: int = 16
+BATCH_PARSE_WORKERS: int = 0  # 0 parses in the fetch threads, lambda has no /dev/shm for process pools
+
+
+class AwsClients(object):
+    """
+    Registry of boto3 clients keyed by service, region and config. It lives at module level, so a warm lambda
+    reuses its clients and their open connections instead of building new ones on every storage or invoke call.
+
+    Clients are thread safe, boto3 resources are not, which is why only clients are handed out. override puts a
+    stand-in in place of a service's clients, the load test runs the handlers against local S3 and lambda that way.
+    """
+
+    def __init__(self, max_pool_connections: int = AWS_MAX_POOL_CONNECTIONS):
+        self.max_pool_connections = max_pool_connections
+        self.created = 0
+        self.reused = 0
+        self._session = None
+        self._clients = {}
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    def client(self, service: str, region_name: str = AWS_REGION, **config):
+        override = self._overrides.get(service)
+        if override is not None:
+            return override
+        config.setdefault('max_pool_connections', self.max_pool_connections)
+        key = (service, region_name, json.dumps(config, sort_keys=True))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                import boto3
+                from botocore.config import Config
+                if self._session is None:
+                    self._session = boto3.session.Session()
+                client = self._session.client(service, region_name=region_name, config=Config(**config))
+                self._clients[key] = client
+                self.created += 1
+            else:
+                self.reused += 1
+            return client
+
+    def stats(self) -> dict:
+        return {'created': self.created, 'reused': self.reused}
+
+    def override(self, service: str, client):
+        """
+        Hands out client for every region and config of service until clear() or override(service, None)
+        """
+        with self._lock:
+            if client is None:
+                self._overrides.pop(service, None)
+            else:
+                self._overrides[service] = client
+
+    def clear(self):
+        with self._lock:
+            self._session = None
+            self._clients = {}
+            self._overrides = {}
+            self.created = 0
+            self.reused = 0
+
+
+aws_clients = AwsClients()
+
+
+class Metrics(object):
+    """
+    Per invocation timers and counters. The handlers reset it, attach a snapshot to their response and can print it
+    in CloudWatch embedded metric format, so a slow crawl shows whether fetching, parsing or storage took the time.
+    """
+
+    def __init__(self):
+        self._timers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            timer = self._timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += 1
+
+    def count(self, name: str, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timers = {name: {'seconds': round(seconds, 6), 'count': count}
+                      for name, (seconds, count) in self._timers.items()}
+            return {'timers': timers, 'counters': dict(self._counters)}
+
+    def reset(self):
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+    def emf(self, namespace: str = METRICS_NAMESPACE, dimensions: dict = None) -> dict:
+        """
+        Returns the metrics as a CloudWatch embedded metric format record, ready to be printed as one JSON line
+        """
+        dimensions = dimensions or {}
+        snapshot = self.snapshot()
+        record = dict(dimensions)
+        definitions = []
+        for name, timer in snapshot['timers'].items():
+            record[name] = timer['seconds'] * 1000
+            definitions.append({'Name': name, 'Unit': 'Milliseconds'})
+        for name, value in snapshot['counters'].items():
+            record[name] = value
+            definitions.append({'Name': name, 'Unit': 'Bytes' if name.endswith('bytes') else 'Count'})
+        record['_aws'] = {'Timestamp': int(time.time() * 1000),
+                          'CloudWatchMetrics': [{'Namespace': namespace, 'Dimensions': [sorted(dimensions)],
+                                                 'Metrics': definitions}]}
+        return record
+
+
+metrics = Metrics()
+
+
+def timed(name: str):
+    """
+    Decorator adding the run time of every call to the given timer
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.add_time(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def run_profiled(function, *args, **kwargs):
+    """
+    Runs a single call under cProfile and prints the 30 most expensive functions, e.g. into CloudWatch
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+        print(stream.getvalue())
+
+
+def to_json_lines(logs) -> str:
+    return ''.join(json.dumps(log) + '\n' for log in logs)
+
+
+def from_json_lines(stream) -> []:
+    return [json.loads(line) for line in stream.splitlines() if line]
+
+
+def parse_time(value) -> datetime:
+    # datetime.fromisoformat needs python 3.7
+    if '.' in value:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f')
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
@@ -0,0 +1,609 @@
+"""Fetching and parsing web pages
+
+lxml and requests are imported on first use, so importing the module stays cheap.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+import hashlib
+import random
+import re
+import threading
+import time
+
+from .common import metrics, timed, STATUS_OK, STATUS_ERROR, BATCH_FETCH_WORKERS, BATCH_PARSE_WORKERS
+from .log import BufferedLog, Log
+from .storage import AbstractLogStorage
+from .structured import structured_price, SOURCE_XPATH
+
+PAGE_CACHE_PREFIX: str = "page-cache/"
+HOST_MAX_CONCURRENCY: int = 2  # requests in flight per shop
+HOST_MIN_INTERVAL: float = 0.5  # seconds between the start of two requests to the same shop
+HOST_POOL_SIZE: int = 50  # number of hosts that keep their connections open
+PARSE_CHUNK_SIZE: int = 65536  # bytes fed to the parser between two lookups when parsing with early_exit
+FETCH_CONNECT_TIMEOUT: float = 1.0  # seconds, grab-price has 5 seconds in total
+FETCH_READ_TIMEOUT: float = 3.0  # seconds without a byte from the shop
+FETCH_RETRIES: int = 2  # retries of a transient error, after the first attempt
+FETCH_BACKOFF: float = 0.1  # seconds before the first retry, doubled for every retry and jittered
+FETCH_BACKOFF_MAX: float = 1.0
+FETCH_DEADLINE: float = 4.0  # seconds after which no retry is started
+FETCH_RETRY_STATUSES: tuple = (429, 500, 502, 503, 504)
+BREAKER_THRESHOLD: int = 5  # failed fetches in a row that open the circuit of a host
+BREAKER_COOLDOWN: float = 30.0  # seconds a host is skipped before one request may try it again
+HEDGE_PERCENTILE: float = 95  # a request slower than this latency percentile of its host gets a duplicate
+HEDGE_MIN_SAMPLES: int = 20  # latencies of a host needed before requests to it are hedged
+HEDGE_WINDOW: int = 100  # latest latencies kept per host
+HEDGE_WORKERS: int = 64
+FETCH_MAX_BYTES: int = 5 * 1024 * 1024  # decompressed bytes of one page, larger pages fail instead of filling memory
+FETCH_CHUNK_SIZE: int = 16384  # bytes decompressed at a time
+
+
+class Fetcher(object):
+    """
+    Fetch layer under Crawler. Connections are kept alive in one pool per host, and every host has a limit on
+    concurrent requests and a minimum delay between two requests, so a shop isn't hammered when a batch holds many
+    of its pages.
+
+    Requests have a connect and a read timeout. Connection errors, timeouts and FETCH_RETRY_STATUSES are retried
+    with jittered exponential backoff until retries or the deadline run out. A host failing threshold fetches in a
+    row is skipped for cooldown seconds (circuit breaker), then a single request tries it again. With hedging, a
+    request still running after the hedge_percentile latency of its host gets a duplicate and the first answer wins.
+
+    Bodies are requested compressed (gzip, deflate, and br when brotli is installed) and read as a stream, chunk by
+    chunk, so no more than max_bytes of a page are ever held. With stop_at reading ends at the chunk holding that
+    marker, the rest of the page isn't downloaded.
+    """
+
+    HEDGING_ENABLED = False
+
+    def __init__(self, max_per_host: int = HOST_MAX_CONCURRENCY, min_interval: float = HOST_MIN_INTERVAL,
+                 pool_size: int = HOST_POOL_SIZE, connect_timeout: float = FETCH_CONNECT_TIMEOUT,
+                 read_timeout: float = FETCH_READ_TIMEOUT, retries: int = FETCH_RETRIES,
+                 backoff: float = FETCH_BACKOFF, deadline: float = FETCH_DEADLINE,
+                 threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN, hedge: bool = None,
+                 hedge_percentile: float = HEDGE_PERCENTILE, max_bytes: int = FETCH_MAX_BYTES):
+        self.max_per_host = max(1, max_per_host)
+        self.min_interval = min_interval
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.hedge = self.HEDGING_ENABLED if hedge is None else hedge
+        self.hedge_percentile = hedge_percentile
+        self.max_bytes = max_bytes
+        self._session = None
+        self._executor = None
+        self._slots = {}
+        self._next_start = {}
+        self._circuits = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stop_at=None):
+        """
+        Returns the requests response. HTTP errors raise once the retries are used up, a 304 Not Modified is
+        returned. Raises right away while the circuit of the host is open. With stop_at (str or bytes) the content
+        ends with the chunk in which the marker was found
+        """
+        if isinstance(stop_at, str):
+            stop_at = stop_at.encode('utf-8')
+        host = self.host(url)
+        self._check_circuit(host)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = self._attempt(host, url, headers, stop_at)
+            except Exception as e:
+                if not self.is_transient(e):
+                    self._record_success(host)  # the shop answered, the request was wrong
+                    raise
+                delay = random.uniform(0, min(FETCH_BACKOFF_MAX, self.backoff * 2 ** attempt))  # full jitter
+                if attempt >= self.retries or time.monotonic() - started + delay > self.deadline:
+                    self._record_failure(host)
+                    raise
+                metrics.count('fetch.retries')
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._record_success(host)
+            metrics.count('fetch.bytes', len(response.content))
+            return response
+
+    @staticmethod
+    def is_transient(error) -> bool:
+        """
+        Whether a failed request is worth retrying: connection errors, timeouts and FETCH_RETRY_STATUSES
+        """
+        import requests
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return isinstance(error, requests.HTTPError) and response is not None and \
+            response.status_code in FETCH_RETRY_STATUSES
+
+    def _attempt(self, host, url, headers, stop_at):
+        delay = self._hedge_delay(host)
+        if delay is None:
+            return self._request(host, url, headers, stop_at)
+        primary = self.executor().submit(self._request, host, url, headers, stop_at)
+        if len(wait([primary], timeout=delay)[0]) > 0:
+            return primary.result()
+        metrics.count('fetch.hedged')
+        hedge = self.executor().submit(self._request, host, url, headers, stop_at, False)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                elif future.result() is not None:
+                    if future is hedge:
+                        metrics.count('fetch.hedge_won')
+                    return future.result()
+        raise error
+
+    def _request(self, host, url, headers, stop_at=None, blocking: bool = True):
+        """
+        One request within the limits of the host, the body is read before the slot is given back. Returns None
+        when blocking is False and the host is busy
+        """
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.max_per_host)
+        if not slot.acquire(blocking):
+            return None
+        try:
+            self._wait_turn(host)
+            started = time.monotonic()
+            response = self.session().get(url, headers=headers, timeout=self.timeout, stream=True)
+            self._read_body(response, stop_at)
+        finally:
+            slot.release()
+        response.raise_for_status()
+        with self._lock:
+            self._latencies.setdefault(host, deque(maxlen=HEDGE_WINDOW)).append(time.monotonic() - started)
+        return response
+
+    def _read_body(self, response, stop_at=None):
+        """
+        Reads the body into response.content, decompressing one chunk at a time. Raises once it grows over
+        max_bytes and stops after the chunk completing stop_at
+        """
+        length = response.headers.get('Content-Length', '')
+        if response.headers.get('Content-Encoding', 'identity') == 'identity' and length.isdigit() and \
+                int(length) > self.max_bytes:
+            response.close()
+            raise Exception("Page of %s bytes is larger than %d bytes: %s" % (length, self.max_bytes, response.url))
+        body = bytearray()
+        stopped = False
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_bytes:
+                response.close()
+                raise Exception("Page is larger than %d bytes: %s" % (self.max_bytes, response.url))
+            if stop_at and stop_at in body[-(len(chunk) + len(stop_at) - 1):]:
+                stopped = True
+                break
+        metrics.count('fetch.wire_bytes', response.raw.tell())
+        if stopped:
+            metrics.count('fetch.stopped_early')
+            response.close()  # the rest of the body is still on the wire, the connection can't be reused
+        response._content = bytes(body)
+        response._content_consumed = True
+        return response
+
+    def _hedge_delay(self, host):
+        if not self.hedge:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(host, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def _check_circuit(self, host):
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit['opened'] is None:
+                return
+            if time.monotonic() - circuit['opened'] >= self.cooldown and not circuit['probing']:
+                circuit['probing'] = True  # half open, this request tries the host again
+                return
+        metrics.count('fetch.circuit_open')
+        raise Exception("Circuit open for %s after %d failed fetches" % (host, circuit['failures']))
+
+    def _record_success(self, host):
+        with self._lock:
+            self._circuits.pop(host, None)
+
+    def _record_failure(self, host):
+        with self._lock:
+            circuit = self._circuits.setdefault(host, {'failures': 0, 'opened': None, 'probing': False})
+            circuit['failures'] += 1
+            circuit['probing'] = False
+            if circuit['failures'] >= self.threshold:
+                circuit['opened'] = time.monotonic()
+
+    def executor(self):
+        """
+        Threads for hedged requests, created on first use
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS)
+            return self._executor
+
+    def session(self):
+        """
+        The requests session, created on first use so importing this module doesn't load requests
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.headers['Accept-Encoding'] = _accept_encoding()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.max_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _wait_turn(self, host):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    @staticmethod
+    def host(url) -> str:
+        return urlsplit(url).netloc.lower()
+
+    @staticmethod
+    def interleave_by_host(jobs) -> list:
+        """
+        Orders jobs round robin over their hosts, so workers waiting for a busy shop don't hold up the others
+        """
+        by_host = {}
+        for job in jobs:
+            by_host.setdefault(Fetcher.host(job['site_url']), []).append(job)
+        queues = list(by_host.values())
+        result = []
+        for i in range(max(len(queue) for queue in queues) if queues else 0):
+            for queue in queues:
+                if i < len(queue):
+                    result.append(queue[i])
+        return result
+
+
+def _accept_encoding() -> str:
+    """
+    urllib3 only decodes brotli when the brotli package is installed, so br is only asked for then
+    """
+    import importlib.util
+    if importlib.util.find_spec('brotli') is None:
+        return 'gzip, deflate'
+    return 'gzip, deflate, br'
+
+
+web_fetcher = Fetcher()
+
+
+class Crawler(object):
+    """
+    Gets a web page, parses using the lxml query you give, logs execution/price and returns a price
+
+    With structured=True the price is read from the page's structured data (JSON-LD offers, og:price:amount,
+    itemprop="price") when it has any and all jobs on the page share one query, the lxml query is the fallback.
+    With stop_at the download ends at the chunk holding that marker, which has to come after the price on the page
+    (see Fetcher).
+    """
+
+    PAGE_CACHE_ENABLED = True  # remembers ETag, Last-Modified and a content hash per page
+    STRUCTURED_DATA_ENABLED = False
+
+    def __init__(self, storage: AbstractLogStorage, page_cache: bool = None, early_exit: bool = False,
+                 structured: bool = None, stop_at: str = None):
+        self.storage = storage
+        self.page_cache = self.PAGE_CACHE_ENABLED if page_cache is None else page_cache
+        self.early_exit = early_exit
+        self.structured = self.STRUCTURED_DATA_ENABLED if structured is None else structured
+        self.stop_at = stop_at
+
+    def grab_price(self, job_name, url, query):
+        result = self.grab_page(url, [{'job_name': job_name, 'html_query': query}])[0]
+        if result['status'] != STATUS_OK:
+            raise result['error']
+        return result['price']
+
+    def grab_page(self, url, jobs) -> list:
+        """
+        Fetches and parses the page once for all jobs watching it (dicts with job_name and html_query) and logs
+        every job on its own. Returns a list of dicts with job_name, price, status, error and source (the way the
+        price was found) in the same order
+        """
+        queries = list(dict.fromkeys(job['html_query'] for job in jobs))
+        if not self.page_cache:
+            page = self.get_web_page(url, self.stop_at)
+            return self._log_prices(jobs, *self.extract_prices(page, queries, self.early_exit, self.structured))
+
+        cache_name = self._page_cache_name(url, self.structured)
+        cached = self.storage.load(cache_name) or {}
+        prices = cached.get('prices', {})
+        if all(query in prices for query in queries):
+            page, validators = self.get_conditional_web_page(url, cached.get('etag'), cached.get('last_modified'),
+                                                             self.stop_at)
+        else:
+            page, validators = self.get_conditional_web_page(url, stop_at=self.stop_at)  # a new query needs the page
+        page_hash = None if page is None else hashlib.sha256(page).hexdigest()
+        if page is None or page_hash == cached.get('hash') and all(query in prices for query in queries):
+            # 304 or same content: the prices can't have changed, only the central log is touched
+            return self._log_prices(jobs, {query: prices[query] for query in queries},
+                                    cached.get('source', SOURCE_XPATH), changed=False)
+        parsed, source = self.extract_prices(page, queries, self.early_exit, self.structured)
+        result = self._log_prices(jobs, parsed, source)
+        validators.update({'url': url, 'hash': page_hash, 'source': source,
+                           'prices': {query: price for query, price in parsed.items()
+                                      if not isinstance(price, Exception)}})
+        self.storage.save(cache_name, validators)
+        return result
+
+    def _log_prices(self, jobs, prices, source, changed=True) -> list:
+        log = BufferedLog(self.storage) if len(jobs) > 1 else Log(self.storage)
+        for job in jobs:
+            if not isinstance(prices[job['html_query']], Exception):
+                log.latest_execution(job['job_name'], prices[job['html_query']], changed=changed)
+        failed = log.flush() if isinstance(log, BufferedLog) else {}
+        result = []
+        for job in jobs:
+            price = prices[job['html_query']]
+            error = price if isinstance(price, Exception) else failed.get(job['job_name'])
+            if error is not None:
+                result.append({'job_name': job['job_name'], 'price': None, 'status': STATUS_ERROR, 'error': error,
+                               'source': source})
+                continue
+            result.append({'job_name': job['job_name'], 'price': price, 'status': STATUS_OK, 'error': None,
+                           'source': source})
+        return result
+
+    @staticmethod
+    @timed('fetch')
+    def get_web_page(url, stop_at=None):
+        return web_fetcher.get(url, stop_at=stop_at).content
+
+    @staticmethod
+    @timed('fetch')
+    def get_conditional_web_page(url, etag=None, last_modified=None, stop_at=None):
+        """
+        Returns the page and its validators. The page is None when the server answers 304 Not Modified
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = web_fetcher.get(url, headers, stop_at)
+        if response.status_code == 304:
+            metrics.count('fetch.not_modified')
+            return None, {'etag': etag, 'last_modified': last_modified}
+        validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        return response.content, validators
+
+    @staticmethod
+    def _page_cache_name(url, structured=False) -> str:
+        key = url + '\nstructured' if structured else url
+        return PAGE_CACHE_PREFIX + hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+
+    @staticmethod
+    def extract_prices(page, queries, early_exit: bool = False, structured: bool = False):
+        """
+        Returns the price per query and the source it came from. With structured and a single query the page's
+        structured data is tried first; pages without any, or watched with several queries (the structured price
+        couldn't tell them apart), are parsed with the queries.
+        """
+        found = structured_price(page) if structured and len(queries) == 1 else None
+        if found is None:
+            prices, source = Crawler.parse_prices(page, queries, early_exit), SOURCE_XPATH
+        else:
+            prices, source = {query: found[0] for query in queries}, found[1]
+        metrics.count('parse.source.' + source)
+        return prices, source
+
+    @staticmethod
+    def parse_prices(page, queries, early_exit: bool = False) -> dict:
+        """
+        Evaluates all queries against one parse of the page. Returns the price per query, or the exception for a
+        query that didn't find a price. early_exit is only used for a single query.
+        """
+        doc = None if len(queries) == 1 else Crawler.parse_document(page)
+        prices = {}
+        for query in queries:
+            try:
+                data = Crawler.parse_html(page, query, early_exit) if doc is None else Crawler._find(doc, query)
+                prices[query] = Crawler.parse_price(data)
+            except Exception as e:
+                prices[query] = e
+        return prices
+
+    @staticmethod
+    @timed('parse_html')
+    def parse_html(page, find, early_exit: bool = False):
+        """
+        With early_exit the page is parsed in chunks and parsing stops at the first complete match, so a price
+        near the top of a large page doesn't pay for the rest of it. A second match further down is not detected.
+        """
+        if early_exit:
+            return Crawler._parse_html_early_exit(page, find)
+        import lxml.html
+        return Crawler._find(lxml.html.document_fromstring(page), find)
+
+    @staticmethod
+    @timed('parse_html')
+    def parse_document(page):
+        import lxml.html
+        return lxml.html.document_fromstring(page)
+
+    @staticmethod
+    def _find(doc, find):
+        result = compiled_xpath(find)(doc)
+        if len(result) != 1:
+            raise Exception("Couldn't find string in HTML: " + find)
+        return result[0]
+
+    @staticmethod
+    def _parse_html_early_exit(page, find):
+        import lxml.etree
+        xpath = compiled_xpath(find)
+        if isinstance(page, str):
+            page = page.encode('utf-8')
+            parser = lxml.etree.HTMLPullParser(events=('end',), encoding='utf-8')
+        else:
+            parser = lxml.etree.HTMLPullParser(events=('end',))
+        closed = set()
+        tree = None
+        for start in range(0, len(page), PARSE_CHUNK_SIZE):
+            parser.feed(page[start:start + PARSE_CHUNK_SIZE])
+            for _, element in parser.read_events():
+                closed.add(element)
+                if tree is None:
+                    tree = element.getroottree()
+            if tree is None:
+                continue
+            result = xpath(tree)
+            if len(result) > 0 and Crawler._is_complete(result[0], closed):
+                return result[0]
+        result = xpath(parser.close())
+        if len(result) != 1:
+            raise Exception("Couldn't find string in HTML: " + find)
+        return result[0]
+
+    @staticmethod
+    def _is_complete(node, closed) -> bool:
+        # text is only complete once the element holding it has been closed by the parser
+        if isinstance(node, str):
+            owner = node.getparent()
+            if owner is not None and node.is_tail:
+                owner = owner.getparent()
+        else:
+            owner = node
+        return owner is None or owner in closed
+
+    @staticmethod
+    @timed('parse_price')
+    def parse_price(value):
+        result = re.findall(r"\d+\.\d+", value)
+        if len(result) != 1:
+            raise Exception("Couldn't parse the price from value :" + value)
+        return result[0]
+
+
+_xpath_cache = threading.local()
+
+
+def compiled_xpath(query):
+    """
+    Returns the compiled lxml XPath for a query. The cache lives for the whole process; each thread keeps its own
+    copy because lxml serialises calls on a shared XPath object.
+    """
+    cache = getattr(_xpath_cache, 'queries', None)
+    if cache is None:
+        cache = _xpath_cache.queries = {}
+    xpath = cache.get(query)
+    if xpath is None:
+        import lxml.etree
+        xpath = cache[query] = lxml.etree.XPath(query)
+    return xpath
+
+
+def _parse_page(page, queries, early_exit=False, structured=False):
+    """
+    Module level so it can be pickled into a ProcessPoolExecutor
+    """
+    return Crawler.extract_prices(page, queries, early_exit, structured)
+
+
+class BatchCrawler(object):
+    """
+    Runs many Crawler jobs in one process: pages are fetched by a thread pool, round robin over the shops, and parsed
+    either in the same threads or, with parse_workers > 0, in a process pool. Jobs watching the same site_url share
+    one fetch and parse, a job with structured set reads the page's structured data first and a job with stop_at
+    stops the download at that marker (see Crawler). Prices go into a BufferedLog as their page comes in, it
+    flushes on its max_pending and max_age during the run and once more at the end.
+    """
+
+    def __init__(self, storage: AbstractLogStorage, fetch_workers: int = BATCH_FETCH_WORKERS,
+                 parse_workers: int = BATCH_PARSE_WORKERS, early_exit: bool = False, structured: bool = None):
+        self.storage = storage
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(0, parse_workers)
+        self.early_exit = early_exit
+        self.structured = Crawler.STRUCTURED_DATA_ENABLED if structured is None else structured
+
+    def grab_prices(self, jobs) -> list:
+        """
+        Takes a list of dicts with job_name, site_url, html_query and optionally structured and stop_at. Returns a
+        list of dicts with job_name, site_url, price, status and source in the same order
+        """
+        if len(jobs) == 0:
+            return []
+        if self.parse_workers > 0:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as parser:
+                return self._grab_prices(jobs, parser)
+        return self._grab_prices(jobs, None)
+
+    def _grab_prices(self, jobs, parser) -> list:
+        pages = {}
+        for job in jobs:
+            key = self._page_key(job)
+            page = pages.setdefault(key, {'key': key, 'site_url': job['site_url'], 'structured': key[1],
+                                          'stop_at': key[2], 'queries': [], 'jobs': []})
+            if job['html_query'] not in page['queries']:
+                page['queries'].append(job['html_query'])
+            page['jobs'].append(job)
+        prices = {}
+        # prices are logged as their page comes in, so max_pending and max_age flush during the run and a run cut
+        # short by the lambda timeout keeps what it had grabbed
+        log = BufferedLog(self.storage, flush_workers=self.fetch_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.fetch_workers, len(pages))) as fetcher:
+                futures = {fetcher.submit(self._grab_page, page, parser): page
+                           for page in Fetcher.interleave_by_host(list(pages.values()))}
+                for future in as_completed(futures):
+                    page = futures[future]
+                    try:
+                        prices[page['key']] = future.result()
+                    except Exception as e:
+                        prices[page['key']] = ({query: e for query in page['queries']}, None)
+                    for job in page['jobs']:
+                        price = prices[page['key']][0][job['html_query']]
+                        if not isinstance(price, Exception):
+                            log.latest_execution(job['job_name'], price)
+        finally:
+            failed = log.flush()
+        metrics.count('batch.pages', len(pages))
+        result = []
+        for job in jobs:
+            page_prices, source = prices[self._page_key(job)]
+            price = page_prices[job['html_query']]
+            status = STATUS_OK
+            if isinstance(price, Exception) or job['job_name'] in failed:
+                price, status = None, STATUS_ERROR
+            result.append({'job_name': job['job_name'], 'site_url': job['site_url'], 'price': price,
+                           'status': status, 'source': source})
+        return result
+
+    def _page_key(self, job):
+        return job['site_url'], bool(job.get('structured', self.structured)), job.get('stop_at')
+
+    def _grab_page(self, page, parser):
+        content = Crawler.get_web_page(page['site_url'], page['stop_at'])
+        if parser is None:
+            return _parse_page(content, page['queries'], self.early_exit, page['structured'])
+        return parser.submit(_parse_page, content, page['queries'], self.early_exit, page['structured']).result()
@@ -0,0 +1,443 @@
+"""Invoking the crawlers for the jobs list
+
+Only what grab-invoke needs is imported: the crawler (lxml, requests) is loaded when a batch is grabbed in process.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import time
+import uuid
+
+from .alerts import AlertEngine
+from .common import aws_clients, parse_time, timed, JOBS_FILENAME, STATUS_OK, STATUS_ACCEPTED, STATUS_TIMEOUT, \
+    STATUS_ERROR, BATCH_FETCH_WORKERS, BATCH_PARSE_WORKERS, LAST_EXECUTED_FILENAME, CENTRAL_LOG_SHARDED, CAS_RETRIES
+from .log import cas_backoff, LastExecutedStore, Log
+from .storage import AbstractJobsStorage, AbstractLogStorage, LogStorageS3
+
+MAX_CONCURRENT_INVOCATIONS: int = 1  # 1 keeps the original sequential behaviour
+INVOKE_TIMEOUT: int = 10  # seconds, the grab-price lambda times out after 5
+SCHEDULE_FILENAME: str = "job-schedule.json"
+SCHEDULE_MIN_INTERVAL: int = 7200  # seconds, how often grab-invoke is triggered
+SCHEDULE_MAX_INTERVAL: int = 259200  # seconds, stable prices are still checked every 3 days
+SCHEDULE_TOLERANCE: int = 300  # seconds, jobs due this close to a run are taken along
+SHARD_SIZE: int = 500  # jobs per grab-batch invocation of a sharded run
+SHARD_FETCH_BUDGET: float = 200  # seconds of grab-batch's 300 a shard may spend on the rate limit of one shop
+SHARD_FUNCTION: str = "grab-batch"
+RUNS_PREFIX: str = "runs/"
+
+
+class Invoker(object):
+    """
+    Calls web crawler using the list found in the JOBS_FILENAME
+
+    With max_workers > 1 the crawlers are invoked concurrently, so a run takes about as long as the slowest crawl
+    instead of the sum of all of them. With schedule=True only the jobs the Scheduler finds due are crawled. With a
+    notifier the alerts of the crawled jobs are evaluated once all of them are done.
+
+    Job lists too long for one grab-invoke run are sharded: fan_out stores the sites in shards and starts one
+    asynchronous grab-batch per shard, grab_shard crawls a shard and stores its statuses, aggregate collects them.
+    """
+
+    def __init__(self, storage: AbstractJobsStorage, max_workers: int = MAX_CONCURRENT_INVOCATIONS,
+                 invoke_timeout: int = INVOKE_TIMEOUT, schedule: bool = False, log_storage_factory=None,
+                 notifier=None):
+        self.storage = storage
+        self.max_workers = max(1, max_workers)
+        self.invoke_timeout = invoke_timeout
+        self.schedule = schedule
+        self.log_storage_factory = log_storage_factory
+        self.notifier = notifier
+
+    def get_website_monitor_list(self):
+        return self.storage.load(JOBS_FILENAME)
+
+    def grab(self) -> str:
+        """
+        Grabs prices from websites listed in the yaml file. Returns json list if job_name and HTTP status code.
+        Jobs watching the same page are sent to one grab-price invocation, which fetches and parses it once.
+        """
+        website_list = self.get_website_monitor_list()
+        sites = self.get_due_sites(website_list)
+        pages = self._by_page(sites)
+        if self.max_workers == 1:
+            statuses = [self._grab_page(page) for page in pages]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(pages)))) as executor:
+                statuses = list(executor.map(self._grab_page, pages))
+        by_job = {}
+        for page_statuses in statuses:
+            by_job.update(page_statuses)
+        result = [{'job_name': site['job_name'], 'status': by_job[site['job_name']]} for site in sites]
+        self._reschedule(sites, result)
+        self._alert(sites, result, self._log_storage_factory())
+        return json.dumps(result)
+
+    def grab_batch(self, log_storage_factory=None, fetch_workers: int = BATCH_FETCH_WORKERS,
+                   parse_workers: int = BATCH_PARSE_WORKERS) -> str:
+        """
+        Grabs prices in this process with a BatchCrawler instead of invoking one lambda per site. Returns the same
+        json list as grab()
+        """
+        if log_storage_factory is None:
+            log_storage_factory = self._log_storage_factory()
+        website_list = self.get_website_monitor_list()
+        sites = self.get_due_sites(website_list)
+        result = self._grab_in_process(sites, log_storage_factory, fetch_workers, parse_workers)
+        self._reschedule(sites, result)
+        self._alert(sites, result, log_storage_factory)
+        return json.dumps(result)
+
+    def fan_out(self, run_storage: AbstractLogStorage, shard_size: int = SHARD_SIZE, event: dict = None) -> str:
+        """
+        Stores the due sites in shards under RUNS_PREFIX and invokes SHARD_FUNCTION asynchronously for the first shard
+        of every chain, with run_id and shard added to event. Returns the run_id to aggregate and the shards that
+        couldn't be dispatched
+        """
+        website_list = self.get_website_monitor_list()
+        sites = self.get_due_sites(website_list)
+        run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+        shards, chained = self._shard_by_host(sites, shard_size)
+        run_storage.save(self._run_object(run_id, 'run'), {'run_id': run_id, 'started': datetime.utcnow().isoformat(),
+                                                           'shards': len(shards), 'jobs': len(sites),
+                                                           'next': chained, 'event': event or {}})
+        for shard, shard_sites in enumerate(shards):
+            run_storage.save(self._run_object(run_id, 'shard', shard), shard_sites)
+
+        def dispatch(shard):
+            try:
+                return self._dispatch_shard(event, run_id, shard)
+            except Exception:
+                return STATUS_ERROR
+
+        first = [shard for shard in range(len(shards)) if shard not in chained.values()]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(first)))) as executor:
+            statuses = list(executor.map(dispatch, first))
+        failed = [shard for shard, status in zip(first, statuses) if status != STATUS_ACCEPTED]
+        return json.dumps({'run_id': run_id, 'shards': len(shards), 'jobs': len(sites), 'failed': failed})
+
+    def grab_shard(self, run_storage: AbstractLogStorage, run_id: str, shard: int, log_storage_factory=None,
+                   fetch_workers: int = BATCH_FETCH_WORKERS, parse_workers: int = BATCH_PARSE_WORKERS) -> str:
+        """
+        Crawls one shard of a fan_out run in this process and stores the statuses for aggregate. The next shard of
+        the chain is dispatched once they are stored
+        """
+        if log_storage_factory is None:
+            log_storage_factory = self._log_storage_factory()
+        sites = run_storage.load(self._run_object(run_id, 'shard', shard))
+        result = self._grab_in_process(sites, log_storage_factory, fetch_workers, parse_workers)
+        run_storage.save(self._run_object(run_id, 'result', shard), result)
+        self._reschedule(sites, result)
+        run = run_storage.load(self._run_object(run_id, 'run'))
+        following = run.get('next', {}).get(str(shard))
+        if following is not None and self._dispatch_shard(run.get('event'), run_id, following) != STATUS_ACCEPTED:
+            raise Exception('Shard %d of run %s could not be dispatched' % (following, run_id))
+        return json.dumps(result)
+
+    def aggregate(self, run_storage: AbstractLogStorage, run_id: str) -> str:
+        """
+        Collects the statuses of a fan_out run. Jobs of shards that haven't stored a result yet have status None.
+        The alerts are evaluated once every shard is done
+        """
+        run = run_storage.load(self._run_object(run_id, 'run'))
+        if not run:
+            raise Exception('Unknown run ' + run_id)
+        sites, result, done = [], [], 0
+        for shard in range(run['shards']):
+            shard_sites = run_storage.load(self._run_object(run_id, 'shard', shard))
+            shard_result = run_storage.load(self._run_object(run_id, 'result', shard))
+            statuses = {item['job_name']: item['status'] for item in shard_result}
+            done += 1 if shard_result else 0
+            sites.extend(shard_sites)
+            result.extend({'job_name': site['job_name'], 'status': statuses.get(site['job_name'])}
+                          for site in shard_sites)
+        complete = done == run['shards']
+        if complete:
+            self._alert(sites, result, self._log_storage_factory())
+        return json.dumps({'run_id': run_id, 'shards': run['shards'], 'done': done, 'complete': complete,
+                           'jobs': result})
+
+    def get_due_sites(self, website_list) -> list:
+        sites = website_list['sites']
+        if not self.schedule:
+            return sites
+        log_storage_factory = self._log_storage_factory()
+        due = set()
+        for bucket_name, bucket_sites in self._by_bucket(sites).items():
+            for site in Scheduler(log_storage_factory(bucket_name)).due(bucket_sites):
+                due.add(site['job_name'])
+        return [site for site in sites if site['job_name'] in due]
+
+    def _log_storage_factory(self):
+        return self.log_storage_factory or LogStorageS3
+
+    def _reschedule(self, sites, result):
+        if not self.schedule:
+            return
+        log_storage_factory = self._log_storage_factory()
+        statuses = {item['job_name']: item['status'] for item in result}
+        for bucket_name, bucket_sites in self._by_bucket(sites).items():
+            Scheduler(log_storage_factory(bucket_name)).done(
+                [{'job_name': site['job_name'], 'status': statuses[site['job_name']]} for site in bucket_sites])
+
+    def _alert(self, sites, result, log_storage_factory):
+        if self.notifier is None:
+            return
+        crawled = set(item['job_name'] for item in result if item['status'] == STATUS_OK)
+        alerts = []
+        for bucket_name, bucket_sites in self._by_bucket(sites).items():
+            bucket_sites = [site for site in bucket_sites if site['job_name'] in crawled]
+            if len(bucket_sites) > 0:
+                alerts.extend(AlertEngine(log_storage_factory(bucket_name)).evaluate(bucket_sites))
+        if len(alerts) > 0:
+            self.notifier.notify(alerts)
+
+    @staticmethod
+    def _grab_in_process(sites, log_storage_factory, fetch_workers, parse_workers) -> list:
+        from .crawler import BatchCrawler
+        statuses = {}
+        for bucket_name, bucket_sites in Invoker._by_bucket(sites).items():
+            crawler = BatchCrawler(log_storage_factory(bucket_name), fetch_workers, parse_workers)
+            for item in crawler.grab_prices(bucket_sites):
+                statuses[item['job_name']] = item['status']
+        return [{'job_name': site['job_name'], 'status': statuses[site['job_name']]} for site in sites]
+
+    def _dispatch_shard(self, event, run_id, shard) -> int:
+        payload = json.dumps(dict(event or {}, run_id=run_id, shard=shard))
+        return self._decode_status_code(self._dispatch_lambda(payload))
+
+    @staticmethod
+    def _shard_by_host(sites, shard_size) -> tuple:
+        """
+        Splits sites into shards of at most shard_size jobs and SHARD_FETCH_BUDGET / HOST_MIN_INTERVAL pages per shop.
+        The rate limits of Fetcher hold per process, so a shop too large for one shard gets a chain of shards that run
+        one after the other. Returns the shards and the next shard of every chained one, keyed by str(shard) like json
+        """
+        from .crawler import Fetcher, HOST_MIN_INTERVAL
+        shard_size = max(1, shard_size)
+        host_pages = max(1, int(SHARD_FETCH_BUDGET / HOST_MIN_INTERVAL))
+        by_host = {}
+        for site in sites:
+            by_host.setdefault(Fetcher.host(site['site_url']), []).append(site)
+        packed, chains = [], []
+        for host_sites in by_host.values():
+            chain, pages = [[]], set()
+            for site in host_sites:
+                if len(chain[-1]) >= shard_size or (site['site_url'] not in pages and len(pages) >= host_pages):
+                    chain.append([])
+                    pages = set()
+                chain[-1].append(site)
+                pages.add(site['site_url'])
+            if len(chain) > 1:
+                chains.append(chain)
+            elif packed and len(packed[-1]) + len(chain[0]) <= shard_size:
+                # different shops crawl side by side, each within its own budget
+                packed[-1].extend(chain[0])
+            else:
+                packed.append(chain[0])
+        shards, chained = packed, {}
+        for chain in chains:
+            for position, shard_sites in enumerate(chain):
+                if position > 0:
+                    chained[str(len(shards) - 1)] = len(shards)
+                shards.append(shard_sites)
+        return shards, chained
+
+    @staticmethod
+    def _run_object(run_id, kind, shard=None) -> str:
+        if shard is None:
+            return RUNS_PREFIX + run_id + '/' + kind + '.json'
+        return RUNS_PREFIX + run_id + '/' + kind + '-%05d.json' % shard
+
+    @staticmethod
+    def _by_bucket(sites) -> dict:
+        by_bucket = {}
+        for site in sites:
+            by_bucket.setdefault(site['bucket_name'], []).append(site)
+        return by_bucket
+
+    @staticmethod
+    def _by_page(sites) -> list:
+        pages = {}
+        for site in sites:
+            key = site['bucket_name'], site['site_url'], bool(site.get('structured')), site.get('stop_at')
+            pages.setdefault(key, []).append(site)
+        return list(pages.values())
+
+    def _grab_page(self, sites) -> dict:
+        """
+        Invokes grab-price for all jobs of one page. Returns the status per job_name
+        """
+        site = sites[0]
+        events = {
+            'site_url': site['site_url'],
+            'bucket_name': site['bucket_name']
+        }
+        if site.get('structured'):
+            events['structured'] = True
+        if site.get('stop_at'):
+            events['stop_at'] = site['stop_at']
+        if len(sites) == 1:
+            events.update({'job_name': site['job_name'], 'html_query': site['html_query']})
+        else:
+            events['jobs'] = [{'job_name': site['job_name'], 'html_query': site['html_query']} for site in sites]
+        events_payload = json.dumps(events)
+        from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+        try:
+            response = self._invoke_lambda(events_payload, self.invoke_timeout)
+            status = self._decode_status_code(response)
+        except (ConnectTimeoutError, ReadTimeoutError):
+            status = STATUS_TIMEOUT
+        except Exception:
+            if self.max_workers == 1:
+                raise
+            status = STATUS_ERROR  # one failing crawl must not cancel the rest of a concurrent run
+        statuses = {site['job_name']: status for site in sites}
+        if len(sites) > 1 and status == STATUS_OK:
+            statuses.update(self._decode_job_statuses(response))
+        return statuses
+
+    @timed('invoke')
+    def _invoke_lambda(self, json_payload: str, timeout: int = INVOKE_TIMEOUT):
+        client = aws_clients.client('lambda', read_timeout=timeout, connect_timeout=timeout,
+                                    retries={'max_attempts': 0}, max_pool_connections=self._pool_size())
+        return client.invoke(FunctionName='grab-price',
+                             InvocationType='RequestResponse',
+                             Payload=json_payload)
+
+    @timed('dispatch')
+    def _dispatch_lambda(self, json_payload: str, function_name: str = SHARD_FUNCTION):
+        client = aws_clients.client('lambda', max_pool_connections=self._pool_size())
+        return client.invoke(FunctionName=function_name,
+                             InvocationType='Event',
+                             Payload=json_payload)
+
+    def _pool_size(self) -> int:
+        # one connection per in-flight invocation, the registry keys clients by it
+        return max(self.max_workers, aws_clients.max_pool_connections)
+
+    @staticmethod
+    def _decode_payload(response):
+        return response['Payload'].read().decode("utf-8")
+
+    @staticmethod
+    def _decode_job_statuses(response) -> dict:
+        """
+        Status per job_name from the response of a grab-price invocation with several jobs
+        """
+        if 'Payload' not in response:
+            return {}
+        body = json.loads(Invoker._decode_payload(response))
+        if isinstance(body, str):
+            body = json.loads(body)  # the handler returns a json string, which lambda encodes once more
+        return {job['job_name']: job['status'] for job in body.get('jobs', [])}
+
+    @staticmethod
+    def _decode_status_code(response):
+        # lambda answers 200 for a function that raised, the error is only in FunctionError
+        if response.get('FunctionError'):
+            return STATUS_ERROR
+        return response['StatusCode']
+
+
+class Scheduler(object):
+    """
+    Gives every job its own polling interval from its price history: half the time the price has been stable, kept
+    between min_interval and max_interval. Volatile prices are polled every run, stable ones back off.
+
+    An interval (seconds) in the yml fixes the interval of a job, a min_interval raises its lower bound. The next due
+    time of every job is kept in SCHEDULE_FILENAME, so jobs that aren't due yet cost no history reads.
+
+    The price history isn't written when the page cache finds a page unchanged, so the last execution comes from the
+    central log: a job whose page never changes is still seen as stable up to its latest crawl.
+    """
+
+    def __init__(self, storage: AbstractLogStorage, min_interval: int = SCHEDULE_MIN_INTERVAL,
+                 max_interval: int = SCHEDULE_MAX_INTERVAL):
+        self.storage = storage
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def due(self, sites, now: datetime = None) -> list:
+        """
+        Returns the sites that should be crawled now and stores when each job is due next. Due jobs stay due until
+        done reports their crawl
+        """
+        if now is None:
+            now = datetime.utcnow()
+        horizon = Log._json_serial(now + timedelta(seconds=SCHEDULE_TOLERANCE))
+        since = now - timedelta(seconds=2 * self.max_interval)
+        schedule = self.storage.load(SCHEDULE_FILENAME) or {}
+        log = Log(self.storage)
+        central = None
+        result, entries = [], {}
+        for site in sites:
+            job_name = site['job_name']
+            entry = schedule.get(job_name)
+            if entry is not None and entry['next_due'] > horizon:
+                continue
+            history = log.history(job_name, since=since)
+            if log.central_log_format == CENTRAL_LOG_SHARDED:
+                last_seen = LastExecutedStore(self.storage).get(job_name)
+            else:
+                if central is None:
+                    central = {job['job_name']: job for job in self.storage.load(LAST_EXECUTED_FILENAME)}
+                last_seen = central.get(job_name)
+            if last_seen is not None and (len(history) == 0 or last_seen['executed'] > history[-1]['executed']):
+                if len(history) == 0:  # crawled, but the price didn't change within the window
+                    history.append({'executed': Log._json_serial(since), 'price': last_seen['price']})
+                history.append({'executed': last_seen['executed'], 'price': last_seen['price']})
+            interval = self.interval(site, history)
+            next_due = now
+            if len(history) > 0:
+                next_due = parse_time(history[-1]['executed']) + timedelta(seconds=interval)
+            if Log._json_serial(next_due) <= horizon:
+                result.append(site)
+            entries[job_name] = {'next_due': Log._json_serial(next_due), 'interval': interval}
+        self._update(entries)
+        return result
+
+    def done(self, result, now: datetime = None):
+        """
+        Moves the next due time of the jobs crawled with STATUS_OK one interval ahead. Failed crawls stay due, so the
+        next run retries them instead of waiting for their interval
+        """
+        if now is None:
+            now = datetime.utcnow()
+        crawled = set(item['job_name'] for item in result if item['status'] == STATUS_OK)
+        if len(crawled) == 0:
+            return
+        schedule = self.storage.load(SCHEDULE_FILENAME) or {}
+        entries = {}
+        for job_name in crawled:
+            entry = schedule.get(job_name)
+            if entry is not None:
+                entries[job_name] = {'next_due': Log._json_serial(now + timedelta(seconds=entry['interval'])),
+                                     'interval': entry['interval']}
+        self._update(entries)
+
+    def _update(self, entries):
+        """
+        Merges entries into SCHEDULE_FILENAME with compare-and-swap, shards of a run finish at the same time
+        """
+        started = time.monotonic()
+        for attempt in range(CAS_RETRIES):
+            schedule, version = self.storage.load_versioned(SCHEDULE_FILENAME)
+            schedule = dict(schedule or {}, **entries)
+            if self.storage.save_if(SCHEDULE_FILENAME, schedule, version):
+                return
+            if not cas_backoff(attempt, started):
+                break
+        raise Exception("Couldn't update the schedule of jobs: " + ', '.join(sorted(entries)))
+
+    def interval(self, site, history) -> float:
+        if 'interval' in site:
+            return float(site['interval'])
+        minimum = max(float(site.get('min_interval', self.min_interval)), 0)
+        if len(history) == 0:
+            return minimum
+        stable_since = history[0]['executed']
+        for previous, current in zip(history, history[1:]):
+            if current['price'] != previous['price']:
+                stable_since = current['executed']
+        stable_for = (parse_time(history[-1]['executed']) - parse_time(stable_since)).total_seconds()
+        return min(max(stable_for / 2, minimum), max(self.max_interval, minimum))
@@ -0,0 +1,550 @@
+"""Execution logs: price history, last executed log and compaction
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import bisect
+import random
+import threading
+import time
+
+from .common import metrics, parse_time, LAST_EXECUTED_FILENAME, LAST_EXECUTED_PREFIX, CAS_RETRIES, CAS_BACKOFF, \
+    CAS_MAX_BACKOFF, CAS_DEADLINE, HISTORY_JSON, HISTORY_SEGMENTED, HISTORY_INDEXED, CENTRAL_LOG_SHARDED
+from .storage import AbstractHistoryStorage, AbstractLogStorage
+
+ROLLUP_PREFIX: str = "rollup/"
+RAW_RETENTION_DAYS: int = 30  # raw executions older than this are dropped once rolled up
+HOURLY_RETENTION_DAYS: int = 365  # daily rollups are kept forever
+LOG_FLUSH_WORKERS: int = 8  # price histories written in parallel by BufferedLog
+LOG_MAX_PENDING: int = 1000  # executions BufferedLog keeps before it flushes
+LOG_MAX_AGE: float = 60  # seconds BufferedLog keeps an execution before it flushes
+
+
+def cas_backoff(attempt: int, started: float) -> bool:
+    """
+    Waits before retrying a compare-and-swap that lost, with jitter so the writers that collided don't meet again.
+    Returns False without waiting when the retry wouldn't start within CAS_DEADLINE seconds of started (monotonic)
+    """
+    metrics.count('storage.cas_conflicts')
+    delay = random.uniform(0, min(CAS_MAX_BACKOFF, CAS_BACKOFF * 2 ** attempt))
+    if time.monotonic() - started + delay > CAS_DEADLINE:
+        return False
+    time.sleep(delay)
+    return True
+
+
+class LastExecutedStore(object):
+    """
+    The "last executed" log sharded into one small object per job, so an update only reads and writes that job's
+    object. Writes use compare-and-swap and retry, so crawlers finishing at the same time don't lose updates.
+    """
+
+    def __init__(self, storage: AbstractLogStorage):
+        self.storage = storage
+
+    def get(self, job_name):
+        data, _ = self.storage.load_versioned(self._object_name(job_name))
+        return data
+
+    def update(self, job_name, executed: str, price, **fields) -> dict:
+        object_name = self._object_name(job_name)
+        started = time.monotonic()
+        for attempt in range(CAS_RETRIES):
+            data, version = self.storage.load_versioned(object_name)
+            if data is not None and data['executed'] > executed:
+                return data  # a newer execution got there first
+            data = dict({'job_name': job_name, 'executed': executed, 'price': price}, **fields)
+            if self.storage.save_if(object_name, data, version):
+                return data
+            if not cas_backoff(attempt, started):
+                break
+        raise Exception("Couldn't update the last executed log of job: " + job_name)
+
+    def aggregate(self, save: bool = False) -> []:
+        """
+        Builds the LAST_EXECUTED_FILENAME list from the per job objects, optionally saving it
+        """
+        names = self.storage.list_objects(LAST_EXECUTED_PREFIX)
+        jobs = []
+        for name in names:
+            data, _ = self.storage.load_versioned(name)
+            if data is not None:
+                jobs.append(data)
+        if save:
+            self.storage.save(LAST_EXECUTED_FILENAME, jobs)
+        return jobs
+
+    @staticmethod
+    def _object_name(job_name) -> str:
+        return LAST_EXECUTED_PREFIX + job_name + '.json'
+
+
+class Log(object):
+    """
+    Stores latest execution information
+
+    Note: The central log file is not supposed to be kept forever. You need to aggregate the data and empty it. If
+    you don't, then your program will become slower and also cost more to run over the long term. Compactor does
+    this for the price history of every job.
+
+    With change_only the price history is run-length encoded: a record is only written when the price changes. The
+    current run (since, last executed and count of executions at that price) is kept in the central log entry, and
+    when the price changes the run is closed with a record holding executed (last seen), count and since. history()
+    returns the current run from the central log too, expand() spreads the executions of a run evenly between its
+    since and its last execution.
+    """
+
+    FEATURE_ENABLED = True  # can be removed once S3 bucket is integrated
+    HISTORY_FORMAT = HISTORY_JSON  # HISTORY_SEGMENTED appends without reading the price history
+    CENTRAL_LOG_FORMAT = CENTRAL_LOG_SHARDED  # CENTRAL_LOG_SINGLE keeps all jobs in LAST_EXECUTED_FILENAME
+    CHANGE_ONLY = False  # True only writes price changes to the history
+
+    def __init__(self, storage: AbstractLogStorage, history_format: str = None, central_log_format: str = None,
+                 change_only: bool = None):
+        self.storage = storage
+        if history_format is None and isinstance(storage, AbstractHistoryStorage):
+            history_format = HISTORY_INDEXED
+        self.history_format = history_format or self.HISTORY_FORMAT
+        self.central_log_format = central_log_format or self.CENTRAL_LOG_FORMAT
+        self.change_only = self.CHANGE_ONLY if change_only is None else change_only
+
+    def latest_execution(self, job_name, price, changed: bool = True):
+        """
+        Logs an execution. With changed=False the page was known to be unchanged and the price history is skipped.
+        With change_only the price decides: an unchanged price only counts the execution in the central log
+        """
+        if not self.FEATURE_ENABLED:
+            return
+        if self.change_only:
+            records, entries, central = self._runs({job_name: [self._create_job_executed_log(price)]})
+            if job_name in records:
+                self._write_history(job_name, records[job_name])
+            self._write_central([entries[job_name]], central)
+            return
+        if changed:
+            self._append_to_job_log(job_name, price)  # each job gets its own file with price history
+        self._update_central_job_log(job_name, price)  # goes into the LAST_EXECUTED_FILENAME
+
+    def history(self, job_name, since: datetime = None, expand: bool = False) -> []:
+        """
+        Returns the price history of a job, optionally only the executions since the given UTC time. Segmented
+        histories only read the segments in that window. A change_only history ends with the current run, which is
+        returned whole, expand gives one record per execution.
+        """
+        jobs = self._history(job_name, since)
+        if self.change_only:
+            jobs.extend(self._current_run(job_name, jobs))
+        if expand:
+            jobs = [job for job in self.expand(jobs) if since is None or job['executed'] >= self._json_serial(since)]
+        return jobs
+
+    @staticmethod
+    def expand(records) -> list:
+        """
+        One record per execution from a change_only history: the executions of a run are spread evenly between the
+        since and the executed of the record closing it. Records without count are returned as they are
+        """
+        result = []
+        for record in records:
+            count = record.get('count', 1)
+            if count > 1:
+                start, end = parse_time(record['since']), parse_time(record['executed'])
+                if len(result) == 0 or result[-1]['executed'] != record['since']:
+                    result.append({'executed': record['since'], 'price': record['price']})
+                for i in range(1, count - 1):
+                    executed = Log._json_serial(start + (end - start) * i / (count - 1))
+                    result.append({'executed': executed, 'price': record['price']})
+            result.append({'executed': record['executed'], 'price': record['price']})
+        return result
+
+    def _history(self, job_name, since: datetime = None) -> []:
+        if self.history_format == HISTORY_INDEXED:
+            jobs = self.storage.load_history(job_name, None if since is None else self._json_serial(since))
+            metrics.count('history.entries_read', len(jobs))
+            return jobs
+        if self.history_format == HISTORY_SEGMENTED:
+            start_after = None
+            if since is not None:
+                start_after = self._segment_name(job_name, since.date().isoformat())[:-len('.jsonl')]
+            jobs = []
+            for segment in self.storage.list_objects(job_name + '/', start_after):
+                jobs.extend(self.storage.load_lines(segment))
+        else:
+            jobs = self.storage.load(job_name + ".json")
+        if since is not None:
+            since = self._json_serial(since)
+            jobs = [job for job in jobs if job['executed'] >= since]
+        metrics.count('history.entries_read', len(jobs))
+        return jobs
+
+    def latest(self, job_name):
+        """
+        Returns the last execution in the price history of a job, or None
+        """
+        if self.change_only:
+            entry = self._central_entry(job_name)
+            if entry is not None:
+                return {'executed': entry['executed'], 'price': entry['price']}
+        if self.history_format == HISTORY_INDEXED:
+            return self.storage.latest_history(job_name)
+        if self.history_format == HISTORY_SEGMENTED:
+            segments = self.storage.list_objects(job_name + '/')
+            jobs = self.storage.load_lines(segments[-1]) if segments else []
+        else:
+            jobs = self.storage.load(job_name + ".json")
+        return max(jobs, key=lambda job: job['executed']) if jobs else None
+
+    def _append_to_job_log(self, job_name, price):
+        self._write_history(job_name, [self._create_job_executed_log(price)])
+
+    def _write_history(self, job_name, logs):
+        if self.history_format == HISTORY_INDEXED:
+            self.storage.append_history(job_name, logs)
+            return
+        if self.history_format == HISTORY_SEGMENTED:
+            by_day = {}
+            for log in logs:
+                by_day.setdefault(log['executed'][:10], []).append(log)
+            for day, day_logs in sorted(by_day.items()):
+                self.storage.append(self._segment_name(job_name, day), day_logs)
+            return
+        log_file = job_name + ".json"
+        jobs = self.storage.load(log_file)
+        jobs.extend(logs)
+        metrics.count('history.entries_rewritten', len(jobs))
+        self.storage.save(log_file, jobs)
+
+    @staticmethod
+    def _segment_name(job_name, day) -> str:
+        return job_name + '/' + day + '.jsonl'
+
+    def _update_central_job_log(self, job_name, price):
+        self._write_central([self._create_job_name_executed_log(job_name, price)])
+
+    def _write_central(self, logs, loaded: tuple = None):
+        """
+        Puts the executions (dicts with job_name, executed, price and for change_only count and since) into the
+        central log. loaded is the LAST_EXECUTED_FILENAME list and its version when the caller has loaded it already.
+        The list is written with compare-and-swap, a writer that lost reloads it and merges its executions again
+        """
+        if self.central_log_format == CENTRAL_LOG_SHARDED:
+            store = LastExecutedStore(self.storage)
+            for log in logs:
+                fields = {key: value for key, value in log.items() if key not in ('job_name', 'executed', 'price')}
+                store.update(log['job_name'], log['executed'], log['price'], **fields)
+            return
+        started = time.monotonic()
+        for attempt in range(CAS_RETRIES):
+            jobs, version = loaded or self._load_central()
+            loaded = None
+            positions = {job['job_name']: i for i, job in enumerate(jobs)}
+            for log in logs:
+                pos = positions.get(log['job_name'])
+                if pos is None:
+                    positions[log['job_name']] = len(jobs)
+                    jobs.append(dict(log))
+                elif jobs[pos]['executed'] <= log['executed']:  # a newer execution may have got there first
+                    jobs[pos] = dict(log)
+            if self.storage.save_if(LAST_EXECUTED_FILENAME, jobs, version):
+                return
+            if not cas_backoff(attempt, started):
+                break
+        raise Exception("Couldn't update the last executed log of jobs: " +
+                        ', '.join(sorted(log['job_name'] for log in logs)))
+
+    def _load_central(self) -> tuple:
+        jobs, version = self.storage.load_versioned(LAST_EXECUTED_FILENAME)
+        return jobs or [], version
+
+    def _central_entry(self, job_name):
+        if self.central_log_format == CENTRAL_LOG_SHARDED:
+            return LastExecutedStore(self.storage).get(job_name)
+        for job in self.storage.load(LAST_EXECUTED_FILENAME):
+            if job['job_name'] == job_name:
+                return job
+        return None
+
+    def _runs(self, observations) -> tuple:
+        """
+        For change_only: takes the executions of every job ({job_name: [{'executed', 'price'}]}, oldest first) and
+        returns the history records to write per job, the new central log entry per job and the loaded
+        LAST_EXECUTED_FILENAME list with its version (None when sharded)
+        """
+        if self.central_log_format == CENTRAL_LOG_SHARDED:
+            store = LastExecutedStore(self.storage)
+            current, central = {job_name: store.get(job_name) for job_name in observations}, None
+        else:
+            central = self._load_central()
+            current = {job['job_name']: job for job in central[0]}
+        records, entries = {}, {}
+        for job_name, logs in observations.items():
+            entry = current.get(job_name)
+            for log in logs:
+                if entry is not None and entry['price'] == log['price']:
+                    # entries written before change_only count as a run of one execution
+                    entry = dict(entry, executed=log['executed'], count=entry.get('count', 1) + 1,
+                                 since=entry.get('since', entry['executed']))
+                    metrics.count('history.unchanged')
+                    continue
+                if entry is not None and entry.get('count', 1) > 1:
+                    records.setdefault(job_name, []).append(
+                        {'executed': entry['executed'], 'price': entry['price'], 'count': entry['count'],
+                         'since': entry['since']})  # closes the run
+                records.setdefault(job_name, []).append({'executed': log['executed'], 'price': log['price']})
+                entry = {'job_name': job_name, 'executed': log['executed'], 'price': log['price'], 'count': 1,
+                         'since': log['executed']}
+            entries[job_name] = entry
+        return records, entries, central
+
+    def _current_run(self, job_name, jobs) -> list:
+        """
+        The run still going on, from the central log: its first execution unless jobs ends with it, and its last
+        """
+        entry = self._central_entry(job_name)
+        if entry is None or 'count' not in entry:
+            return []
+        run = []
+        if len(jobs) == 0 or jobs[-1]['executed'] != entry['since']:
+            run.append({'executed': entry['since'], 'price': entry['price']})
+        if entry['count'] > 1:
+            run.append({'executed': entry['executed'], 'price': entry['price'], 'count': entry['count'],
+                        'since': entry['since']})
+        return run
+
+    def _create_job_name_executed_log(self, job_name, price) -> dict:
+        return {'job_name': job_name, 'executed': self._json_serial(datetime.utcnow()), 'price': price}
+
+    def _create_job_executed_log(self, price) -> dict:
+        return {'executed': self._json_serial(datetime.utcnow()), 'price': price}
+
+    @staticmethod
+    def _json_serial(obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        raise TypeError("Type %s not serializable" % type(obj))
+
+
+class BufferedLog(Log):
+    """
+    Write-behind Log for runs with many jobs. Executions are kept in memory and written in one go: the central log is
+    loaded and saved once, the price histories are written in parallel with one write per job. A flush happens on
+    flush(), when the with block is left (also on errors), after max_pending executions and max_age seconds after
+    the first buffered execution, so a run cut short by a timeout loses at most max_age seconds of executions.
+    """
+
+    def __init__(self, storage: AbstractLogStorage, history_format: str = None, central_log_format: str = None,
+                 flush_workers: int = LOG_FLUSH_WORKERS, max_pending: int = LOG_MAX_PENDING,
+                 max_age: float = LOG_MAX_AGE, change_only: bool = None):
+        super().__init__(storage, history_format, central_log_format, change_only)
+        self.flush_workers = max(1, flush_workers)
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.failed = {}  # job_name: exception of flushes nobody asked for
+        self._histories = {}
+        self._central = {}
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        failed = self.flush()
+        if failed and exc_type is None:
+            raise Exception("Couldn't write the logs of jobs: " + ', '.join(sorted(failed)))
+
+    def latest_execution(self, job_name, price, changed: bool = True):
+        if not self.FEATURE_ENABLED:
+            return
+        log = self._create_job_name_executed_log(job_name, price)
+        with self._lock:
+            if changed or self.change_only:
+                self._histories.setdefault(job_name, []).append({'executed': log['executed'], 'price': price})
+            self._central[job_name] = log
+            self._pending += 1
+            full = self._pending >= self.max_pending
+            if not full and self._timer is None and self.max_age is not None:
+                self._timer = threading.Timer(self.max_age, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.failed.update(self._flush())
+
+    def flush(self) -> dict:
+        """
+        Writes everything buffered. Returns job_name: exception for the jobs whose logs couldn't be written, these
+        are dropped. Failures of earlier automatic flushes are returned as well
+        """
+        with self._lock:
+            failed = self._flush()
+            failed.update(self.failed)
+            self.failed = {}
+        return failed
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+            self.failed.update(self._flush())
+
+    def _flush(self) -> dict:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            histories, central = self._histories, self._central
+            self._histories, self._central, self._pending = {}, {}, 0
+            if len(central) == 0:
+                return {}
+            metrics.count('log.flushes')
+            failed = {}
+            sharded = self.central_log_format == CENTRAL_LOG_SHARDED
+            loaded = None
+            if self.change_only:
+                try:
+                    histories, central, loaded = self._runs(histories)
+                except Exception as e:
+                    return {job_name: e for job_name in central}
+
+            def write(job_name):
+                try:
+                    if job_name in histories:
+                        self._write_history(job_name, histories[job_name])
+                    if sharded:
+                        self._write_central([central[job_name]])  # one object per job, written in parallel too
+                except Exception as e:
+                    return job_name, e
+                return job_name, None
+
+            with ThreadPoolExecutor(max_workers=min(self.flush_workers, len(central))) as executor:
+                for job_name, error in executor.map(write, list(central)):
+                    if error is not None:
+                        failed[job_name] = error
+            if not sharded:
+                # like Log.latest_execution, the central log isn't touched when the history couldn't be written
+                logs = [log for job_name, log in central.items() if job_name not in failed]
+                try:
+                    self._write_central(logs, loaded)
+                except Exception as e:
+                    failed.update({log['job_name']: e for log in logs})
+            return failed
+
+
+class Compactor(object):
+    """
+    Rolls the raw price history of a job up into hourly and daily min/max/last/count records and drops raw
+    executions older than retention_days. Rollups are stored column wise (one array per field) under ROLLUP_PREFIX
+    together with a watermark, the last execution rolled up, so each run only reads what is new.
+
+    A change_only run is rolled up as count executions. The run still going on grows between compactions, so the
+    rollup keeps its since and how many of its executions were rolled up, and later compactions only add the rest,
+    spread evenly between the watermark and the run's last execution.
+    """
+
+    FIELDS = ('start', 'min', 'max', 'last', 'count')
+
+    def __init__(self, storage: AbstractLogStorage, retention_days: int = RAW_RETENTION_DAYS,
+                 hourly_retention_days: int = HOURLY_RETENTION_DAYS, history_format: str = None,
+                 change_only: bool = None):
+        self.storage = storage
+        self.retention_days = retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.log = Log(storage, history_format, change_only=change_only)
+
+    def compact(self, job_name, now: datetime = None) -> dict:
+        """
+        Rolls up the executions since the watermark and drops expired raw data. Returns how many were rolled up
+        and dropped
+        """
+        if now is None:
+            now = datetime.utcnow()
+        rollup = self.rollup(job_name)
+        watermark = rollup['watermark']
+        since = None if watermark is None else parse_time(watermark)
+        executions = []
+        for record in self.log.history(job_name, since):
+            if watermark is not None and record['executed'] <= watermark:
+                continue
+            executions.extend(self._executions(record, rollup))
+        executions.sort(key=lambda log: log['executed'])
+        for log in executions:
+            price = float(log['price'])
+            self._add(rollup['hourly'], log['executed'][:13] + ':00:00', price)
+            self._add(rollup['daily'], log['executed'][:10], price)
+        if len(executions) > 0:
+            rollup['watermark'] = executions[-1]['executed']
+        hourly_cutoff = Log._json_serial(now - timedelta(days=self.hourly_retention_days))
+        self._trim(rollup['hourly'], hourly_cutoff)
+        self.storage.save(self._rollup_name(job_name), rollup)
+
+        dropped = 0
+        if rollup['watermark'] is not None:
+            cutoff = min(Log._json_serial(now - timedelta(days=self.retention_days)), rollup['watermark'])
+            dropped = self._drop_raw(job_name, cutoff)
+        return {'job_name': job_name, 'rolled_up': len(executions), 'dropped': dropped}
+
+    @staticmethod
+    def _executions(record, rollup) -> list:
+        """
+        The executions of a history record not rolled up yet. For a change_only run the ones rolled up before are
+        taken off its count, the run's first execution has a record of its own
+        """
+        count = record.get('count', 1)
+        if count == 1:
+            return [record]
+        run = rollup.get('run')
+        done = run['count'] if run is not None and run['since'] == record['since'] else 1
+        rollup['run'] = {'since': record['since'], 'count': count}
+        start = parse_time(max(record['since'], rollup['watermark'] or record['since']))
+        end = parse_time(record['executed'])
+        new = count - done
+        return [{'executed': Log._json_serial(start + (end - start) * i / new), 'price': record['price']}
+                for i in range(1, new + 1)]
+
+    def rollup(self, job_name) -> dict:
+        rollup = self.storage.load(self._rollup_name(job_name))
+        if not rollup:
+            rollup = {'watermark': None,
+                      'hourly': {field: [] for field in self.FIELDS},
+                      'daily': {field: [] for field in self.FIELDS}}
+        return rollup
+
+    def _drop_raw(self, job_name, cutoff) -> int:
+        # only executions before cutoff are dropped, cutoff never passes the watermark
+        if self.log.history_format == HISTORY_INDEXED:
+            return self.storage.delete_history(job_name, cutoff)
+        if self.log.history_format == HISTORY_SEGMENTED:
+            dropped = 0
+            for segment in self.storage.list_objects(job_name + '/'):
+                if segment[len(job_name) + 1:][:10] < cutoff[:10]:
+                    dropped += len(self.storage.load_lines(segment))
+                    self.storage.delete(segment)
+            return dropped
+        log_file = job_name + ".json"
+        logs = self.storage.load(log_file)
+        kept = [log for log in logs if log['executed'] >= cutoff]
+        if len(kept) != len(logs):
+            self.storage.save(log_file, kept)
+        return len(logs) - len(kept)
+
+    @staticmethod
+    def _add(columns, start, price):
+        i = bisect.bisect_left(columns['start'], start)
+        if i < len(columns['start']) and columns['start'][i] == start:
+            columns['min'][i] = min(columns['min'][i], price)
+            columns['max'][i] = max(columns['max'][i], price)
+            columns['count'][i] += 1
+            columns['last'][i] = price  # executions are rolled up in time order
+            return
+        for field, value in zip(Compactor.FIELDS, (start, price, price, price, 1)):
+            columns[field].insert(i, value)
+
+    @staticmethod
+    def _trim(columns, cutoff):
+        i = bisect.bisect_left(columns['start'], cutoff)
+        for field in Compactor.FIELDS:
+            del columns[field][:i]
+
+    @staticmethod
+    def _rollup_name(job_name) -> str:
+        return ROLLUP_PREFIX + job_name + '.json'
@@ -0,0 +1,662 @@
+"""Jobs and log storage on Amazon S3 or the local hard disk
+
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+import codecs
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from .common import aws_clients, metrics, timed, to_json_lines
+
+# the parsed job list survives warm invocations, keyed by location, revalidated against its version before use
+_job_manifests: dict = {}
+JOB_MANIFEST_SUFFIX: str = '.json'
+JOB_REQUIRED_FIELDS = ('job_name', 'bucket_name', 'site_url', 'html_query')
+COMPRESSION_GZIP: str = "gzip"
+GZIP_MAGIC: bytes = b'\x1f\x8b'
+GZIP_LEVEL: int = 6  # the histories compress about as well at 6 as at 9, at a fraction of the CPU
+LOCK_SUFFIX: str = ".lock"  # LogStorageOS lock files of save_if, kept next to the object
+SQLITE_TIMEOUT: float = 30  # seconds a writer waits for the lock of another connection
+
+
+class AbstractLogStorage(ABC):
+    """
+    Log storage can be implemented for S3 or local hard disk (JSON files)
+    """
+
+    @abstractmethod
+    def load(self, object_name: str) -> []:
+        pass
+
+    @abstractmethod
+    def save(self, object_name: str, logs: []):
+        pass
+
+    @abstractmethod
+    def check_exists(self, object_name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def append(self, object_name: str, logs: []):
+        """
+        Adds logs to the end of a JSON Lines object
+        """
+        pass
+
+    @abstractmethod
+    def load_lines(self, object_name: str) -> []:
+        """
+        Loads a JSON Lines object written by append
+        """
+        pass
+
+    @abstractmethod
+    def list_objects(self, prefix: str, start_after: str = None) -> []:
+        """
+        Returns the sorted names of the objects starting with prefix, optionally only those after start_after
+        """
+        pass
+
+    @abstractmethod
+    def load_versioned(self, object_name: str):
+        """
+        Returns the logs and a version token, or (None, None) when the object doesn't exist
+        """
+        pass
+
+    @abstractmethod
+    def save_if(self, object_name: str, logs, version) -> bool:
+        """
+        Saves only if the object is still at the given version (None: doesn't exist yet). Returns False otherwise
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, object_name: str):
+        pass
+
+
+class AbstractHistoryStorage(AbstractLogStorage):
+    """
+    Log storage that also keeps price histories as rows indexed by job name and execution time, so appends don't
+    rewrite anything and time ranges are looked up instead of scanned. Log uses it with HISTORY_INDEXED.
+    """
+
+    @abstractmethod
+    def append_history(self, job_name: str, logs: []):
+        pass
+
+    @abstractmethod
+    def load_history(self, job_name: str, since: str = None, until: str = None) -> []:
+        """
+        Returns the executions of a job in time order, optionally only since <= executed < until (ISO strings)
+        """
+        pass
+
+    @abstractmethod
+    def latest_history(self, job_name: str):
+        """
+        Returns the last execution of a job, or None
+        """
+        pass
+
+    @abstractmethod
+    def delete_history(self, job_name: str, before: str) -> int:
+        """
+        Deletes the executions before the given ISO time, returns how many were deleted
+        """
+        pass
+
+
+class AbstractJobsStorage(ABC):
+    """
+    Jobs can be loaded from S3 or local hard disk (YML files)
+    """
+
+    @abstractmethod
+    def load(self, object_name: str) -> dict:
+        pass
+
+
+class JobStorageS3(AbstractJobsStorage):
+    """
+    Load jobs from Amazon S3
+    """
+
+    def __init__(self, s3_bucket: str, manifest: bool = False):
+        self.s3_bucket = s3_bucket
+        self.manifest = manifest
+
+    @timed('jobs.load')
+    def load(self, object_name):
+        from botocore.exceptions import ClientError
+        key = ('s3', self.s3_bucket, object_name)
+        cached = _job_manifests.get(key)
+        if cached is None and self.manifest:
+            cached = self._load_manifest(object_name)
+        s3 = aws_clients.client('s3')
+        condition = {'IfNoneMatch': cached['version']} if cached else {}
+        try:
+            response = s3.get_object(Bucket=self.s3_bucket, Key=object_name, **condition)
+        except ClientError as e:
+            if cached and e.response['Error']['Code'] in ("304", "NotModified"):
+                metrics.count('jobs.not_modified')
+                _job_manifests[key] = cached
+                return cached['jobs']
+            raise
+        body = response['Body'].read()
+        metrics.count('jobs.read_bytes', len(body))
+        cached = {'source': object_name, 'version': response['ETag'], 'jobs': parse_jobs(body)}
+        _job_manifests[key] = cached
+        if self.manifest:
+            s3.put_object(Bucket=self.s3_bucket, Key=manifest_name(object_name), Body=json.dumps(cached))
+        return cached['jobs']
+
+    def _load_manifest(self, object_name):
+        from botocore.exceptions import ClientError
+        s3 = aws_clients.client('s3')
+        try:
+            body = s3.get_object(Bucket=self.s3_bucket, Key=manifest_name(object_name))['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return json.loads(body.decode('utf-8'))
+
+
+class JobStorageOS(AbstractJobsStorage):
+    """
+    Load jobs from local hard disk
+    """
+
+    def __init__(self, filepath, manifest: bool = False):
+        self.filepath = filepath
+        self.manifest = manifest
+
+    @timed('jobs.load')
+    def load(self, object_name):
+        path = self.filepath + object_name
+        key = ('os', os.path.abspath(path))
+        stat = os.stat(path)
+        version = '%d-%d' % (stat.st_mtime_ns, stat.st_size)  # stands in for the S3 ETag
+        cached = _job_manifests.get(key)
+        if cached is None and self.manifest:
+            cached = self._load_manifest(object_name)
+        if cached and cached['version'] == version:
+            metrics.count('jobs.not_modified')
+            _job_manifests[key] = cached
+            return cached['jobs']
+        with open(path, 'rb') as jobfile:
+            body = jobfile.read()
+        metrics.count('jobs.read_bytes', len(body))
+        cached = {'source': object_name, 'version': version, 'jobs': parse_jobs(body)}
+        _job_manifests[key] = cached
+        if self.manifest:
+            with open(self.filepath + manifest_name(object_name), 'w') as outfile:
+                json.dump(cached, outfile)
+        return cached['jobs']
+
+    def _load_manifest(self, object_name):
+        path = self.filepath + manifest_name(object_name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as manifest_file:
+            return json.load(manifest_file)
+
+
+def manifest_name(object_name) -> str:
+    """
+    The pre-compiled JSON manifest lives next to the YAML job list, i.e. website-monitor-list.json
+    """
+    return os.path.splitext(object_name)[0] + JOB_MANIFEST_SUFFIX
+
+
+@timed('jobs.parse')
+def parse_jobs(stream) -> dict:
+    """
+    Parses and validates a YAML job list, with the C accelerated safe loader when PyYAML was built with libyaml
+    """
+    import yaml
+    jobs = yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    if not isinstance(jobs, dict) or not isinstance(jobs.get('sites'), list):
+        raise Exception('Job list needs a list of sites')
+    job_names = set()
+    for site in jobs['sites']:
+        missing = [field for field in JOB_REQUIRED_FIELDS if not isinstance(site, dict) or field not in site]
+        if missing:
+            raise Exception('Job %s is missing %s' % (site, ', '.join(missing)))
+        if site['job_name'] in job_names:
+            raise Exception('Job name %s is used twice' % site['job_name'])
+        job_names.add(site['job_name'])
+    return jobs
+
+
+class LogStorageS3(AbstractLogStorage):
+    """
+    Load and save logs to Amazon S3
+
+    With compression=COMPRESSION_GZIP objects are written gzipped with Content-Encoding gzip, plain objects written
+    before are still read.
+    """
+
+    COMPRESSION = None  # COMPRESSION_GZIP compresses everything written from now on
+
+    def __init__(self, s3_bucket: str, compression: str = None):
+        self.s3_bucket = s3_bucket
+        self.compression = self.COMPRESSION if compression is None else compression
+
+    @timed('storage.load')
+    def load(self, object_name):
+        response = self._get_object(object_name)
+        if response is None:
+            return []
+        return json.load(_text_stream(response['Body'], self._is_gzip(response)))
+
+    @timed('storage.check_exists')
+    def check_exists(self, object_name):
+        from botocore.exceptions import ClientError
+        s3 = aws_clients.client('s3')
+        try:
+            s3.head_object(Bucket=self.s3_bucket, Key=object_name)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == "404":
+                return False
+            raise
+
+    @timed('storage.save')
+    def save(self, object_name, logs):
+        self._put_object(object_name, json.dumps(logs))
+
+    @timed('storage.append')
+    def append(self, object_name, logs):
+        # S3 objects can't be appended to, the segment is rewritten. Segments only hold one day, so this stays cheap.
+        response = self._get_object(object_name)
+        stream = '' if response is None else _text_stream(response['Body'], self._is_gzip(response)).read()
+        self._put_object(object_name, stream + to_json_lines(logs))
+
+    @timed('storage.load_lines')
+    def load_lines(self, object_name):
+        response = self._get_object(object_name)
+        if response is None:
+            return []
+        return [json.loads(line) for line in _text_stream(response['Body'], self._is_gzip(response)) if line.strip()]
+
+    @timed('storage.list_objects')
+    def list_objects(self, prefix, start_after=None):
+        s3 = aws_clients.client('s3')
+        paginator = s3.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.s3_bucket, 'Prefix': prefix}
+        if start_after is not None:
+            kwargs['StartAfter'] = start_after
+        names = []
+        for page in paginator.paginate(**kwargs):
+            names.extend(item['Key'] for item in page.get('Contents', []))
+        return names
+
+    @timed('storage.load_versioned')
+    def load_versioned(self, object_name):
+        response = self._get_object(object_name)
+        if response is None:
+            return None, None
+        return json.load(_text_stream(response['Body'], self._is_gzip(response))), response['ETag']
+
+    @timed('storage.save_if')
+    def save_if(self, object_name, logs, version):
+        from botocore.exceptions import ClientError
+        # S3 conditional writes, needs a boto3 release that knows IfMatch/IfNoneMatch on put_object
+        condition = {'IfNoneMatch': '*'} if version is None else {'IfMatch': version}
+        try:
+            self._put_object(object_name, json.dumps(logs), **condition)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("412", "409", "PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    @timed('storage.delete')
+    def delete(self, object_name):
+        s3 = aws_clients.client('s3')
+        s3.delete_object(Bucket=self.s3_bucket, Key=object_name)
+
+    def _get_object(self, object_name):
+        """
+        Returns the get_object response, or None when the object doesn't exist
+        """
+        from botocore.exceptions import ClientError
+        s3 = aws_clients.client('s3')
+        try:
+            response = s3.get_object(Bucket=self.s3_bucket, Key=object_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                return None
+            raise
+        metrics.count('storage.read_bytes', response.get('ContentLength', 0))
+        return response
+
+    def _put_object(self, object_name, stream, **kwargs):
+        s3 = aws_clients.client('s3')
+        body = _encode(stream, self.compression)
+        if self.compression == COMPRESSION_GZIP:
+            kwargs.update({'ContentEncoding': 'gzip', 'ContentType': 'application/json'})
+        metrics.count('storage.written_bytes', len(body))
+        s3.put_object(Bucket=self.s3_bucket, Key=object_name, Body=body, **kwargs)
+
+    @staticmethod
+    def _is_gzip(response) -> bool:
+        return response.get('ContentEncoding') == 'gzip'
+
+
+class LogStorageOS(AbstractLogStorage):
+    """
+    Load and save logs to local hard disk
+
+    With compression=COMPRESSION_GZIP files are written gzipped under the same name, files are told apart by the gzip
+    magic number so plain files written before are still read.
+    """
+
+    COMPRESSION = None  # COMPRESSION_GZIP compresses everything written from now on
+
+    def __init__(self, filepath, compression: str = None):
+        self.filepath = filepath
+        self.compression = self.COMPRESSION if compression is None else compression
+
+    @timed('storage.load')
+    def load(self, object_name):
+        if self.check_exists(object_name):
+            with open(self.filepath + object_name, 'rb') as logfile:
+                metrics.count('storage.read_bytes', os.fstat(logfile.fileno()).st_size)
+                return json.load(_text_stream(logfile, _is_gzip(logfile)))
+        return []
+
+    @timed('storage.check_exists')
+    def check_exists(self, object_name):
+        my_file = Path(self.filepath + object_name)
+        return my_file.is_file()
+
+    @timed('storage.save')
+    def save(self, object_name, logs):
+        self._make_dirs(object_name)
+        body = _encode(json.dumps(logs), self.compression)
+        metrics.count('storage.written_bytes', len(body))
+        with open(self.filepath + object_name, 'wb') as outfile:
+            outfile.write(body)
+
+    @timed('storage.append')
+    def append(self, object_name, logs):
+        self._make_dirs(object_name)
+        path = self.filepath + object_name
+        compression = self.compression
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as logfile:
+                # appends keep the format of the file, gzip members can simply be concatenated
+                compression = COMPRESSION_GZIP if _is_gzip(logfile) else None
+        body = _encode(to_json_lines(logs), compression)
+        metrics.count('storage.written_bytes', len(body))
+        with open(path, 'ab') as outfile:
+            outfile.write(body)
+
+    @timed('storage.load_lines')
+    def load_lines(self, object_name):
+        if self.check_exists(object_name):
+            with open(self.filepath + object_name, 'rb') as logfile:
+                metrics.count('storage.read_bytes', os.fstat(logfile.fileno()).st_size)
+                return [json.loads(line) for line in _text_stream(logfile, _is_gzip(logfile)) if line.strip()]
+        return []
+
+    @timed('storage.list_objects')
+    def list_objects(self, prefix, start_after=None):
+        folder, _ = os.path.split(prefix)
+        path = self.filepath + folder
+        if not os.path.isdir(path):
+            return []
+        names = []
+        for filename in os.listdir(path):
+            name = folder + '/' + filename if folder else filename
+            if name.startswith(prefix) and (start_after is None or name > start_after) \
+                    and not name.endswith((LOCK_SUFFIX, '.tmp')) and os.path.isfile(self.filepath + name):
+                names.append(name)
+        return sorted(names)
+
+    @timed('storage.load_versioned')
+    def load_versioned(self, object_name):
+        if not self.check_exists(object_name):
+            return None, None
+        with open(self.filepath + object_name, 'rb') as logfile:
+            content = logfile.read()
+        metrics.count('storage.read_bytes', len(content))
+        if content[:2] == GZIP_MAGIC:
+            return json.loads(gzip.decompress(content).decode('utf-8')), hashlib.md5(content).hexdigest()
+        return json.loads(content.decode('utf-8')), hashlib.md5(content).hexdigest()
+
+    @timed('storage.save_if')
+    def save_if(self, object_name, logs, version):
+        self._make_dirs(object_name)
+        path = self.filepath + object_name
+        with open(self._lock_file(path), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                current = None
+                if os.path.isfile(path):
+                    with open(path, 'rb') as logfile:
+                        current = hashlib.md5(logfile.read()).hexdigest()
+                if current != version:
+                    return False
+                body = _encode(json.dumps(logs), self.compression)
+                metrics.count('storage.written_bytes', len(body))
+                with open(path + '.tmp', 'wb') as outfile:
+                    outfile.write(body)
+                os.replace(path + '.tmp', path)  # readers without the lock never see a half written file
+                return True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @timed('storage.delete')
+    def delete(self, object_name):
+        if self.check_exists(object_name):
+            os.remove(self.filepath + object_name)
+
+    @staticmethod
+    def _lock_file(path) -> str:
+        # next to the object it locks, list_objects skips it. It isn't removed: a writer waiting on the lock of an
+        # unlinked file wouldn't exclude the writer that created a new one
+        return path + LOCK_SUFFIX
+
+    def _make_dirs(self, object_name):
+        folder = os.path.dirname(object_name)
+        if folder:
+            os.makedirs(self.filepath + folder, exist_ok=True)
+
+
+class LogStorageSQLite(AbstractHistoryStorage):
+    """
+    Load and save logs to a local SQLite database, for development and large backfills
+
+    Objects and JSON Lines are kept in tables of their own, price histories as rows indexed by (job_name, executed).
+    The database runs in WAL mode, so readers don't block the writer. Every thread gets its own connection; writes
+    inside transaction() are committed together.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS objects (name TEXT PRIMARY KEY, body TEXT NOT NULL, version INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS lines (name TEXT NOT NULL, line TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS lines_name ON lines (name)',
+        'CREATE TABLE IF NOT EXISTS history (job_name TEXT NOT NULL, executed TEXT NOT NULL, log TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS history_job_executed ON history (job_name, executed)',
+    )
+
+    def __init__(self, database: str):
+        self.database = database
+        self._local = threading.local()
+        with self.transaction() as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.database, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')  # durable at checkpoints, which is safe with WAL
+            self._local.connection = connection
+            self._local.depth = 0
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups writes into one transaction, nested calls join the outer one
+        """
+        connection = self.connection()
+        if self._local.depth == 0:
+            connection.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield connection
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            connection.execute('COMMIT')
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    @timed('storage.load')
+    def load(self, object_name):
+        logs, _ = self.load_versioned(object_name)
+        return [] if logs is None else logs
+
+    @timed('storage.check_exists')
+    def check_exists(self, object_name):
+        query = 'SELECT 1 FROM objects WHERE name = ? UNION ALL SELECT 1 FROM lines WHERE name = ? LIMIT 1'
+        return self.connection().execute(query, (object_name, object_name)).fetchone() is not None
+
+    @timed('storage.save')
+    def save(self, object_name, logs):
+        body = json.dumps(logs)
+        metrics.count('storage.written_bytes', len(body))
+        with self.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO objects (name, body, version) VALUES (?, ?, '
+                               'COALESCE((SELECT version FROM objects WHERE name = ?), 0) + 1)',
+                               (object_name, body, object_name))
+
+    @timed('storage.append')
+    def append(self, object_name, logs):
+        rows = [(object_name, json.dumps(log)) for log in logs]
+        metrics.count('storage.written_bytes', sum(len(line) for _, line in rows))
+        with self.transaction() as connection:
+            connection.executemany('INSERT INTO lines (name, line) VALUES (?, ?)', rows)
+
+    @timed('storage.load_lines')
+    def load_lines(self, object_name):
+        rows = self.connection().execute('SELECT line FROM lines WHERE name = ? ORDER BY rowid', (object_name,))
+        return [json.loads(line) for line, in rows]
+
+    @timed('storage.list_objects')
+    def list_objects(self, prefix, start_after=None):
+        conditions, arguments = ['name >= ?'], [prefix]
+        if start_after is not None:
+            conditions.append('name > ?')
+            arguments.append(start_after)
+        if prefix:
+            # everything starting with prefix sorts before prefix with its last character incremented
+            conditions.append('name < ?')
+            arguments.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        condition = ' AND '.join(conditions)
+        query = 'SELECT name FROM objects WHERE %s UNION SELECT name FROM lines WHERE %s ORDER BY name' \
+                % (condition, condition)
+        return [name for name, in self.connection().execute(query, arguments * 2)]
+
+    @timed('storage.load_versioned')
+    def load_versioned(self, object_name):
+        row = self.connection().execute('SELECT body, version FROM objects WHERE name = ?', (object_name,)).fetchone()
+        if row is None:
+            return None, None
+        metrics.count('storage.read_bytes', len(row[0]))
+        return json.loads(row[0]), row[1]
+
+    @timed('storage.save_if')
+    def save_if(self, object_name, logs, version):
+        body = json.dumps(logs)
+        with self.transaction() as connection:
+            if version is None:
+                cursor = connection.execute('INSERT OR IGNORE INTO objects (name, body, version) VALUES (?, ?, 1)',
+                                            (object_name, body))
+            else:
+                cursor = connection.execute('UPDATE objects SET body = ?, version = version + 1 '
+                                            'WHERE name = ? AND version = ?', (body, object_name, version))
+        if cursor.rowcount != 1:
+            return False
+        metrics.count('storage.written_bytes', len(body))
+        return True
+
+    @timed('storage.delete')
+    def delete(self, object_name):
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM objects WHERE name = ?', (object_name,))
+            connection.execute('DELETE FROM lines WHERE name = ?', (object_name,))
+
+    @timed('storage.append_history')
+    def append_history(self, job_name, logs):
+        with self.transaction() as connection:
+            connection.executemany('INSERT INTO history (job_name, executed, log) VALUES (?, ?, ?)',
+                                   [(job_name, log['executed'], json.dumps(log)) for log in logs])
+
+    @timed('storage.load_history')
+    def load_history(self, job_name, since=None, until=None):
+        query, arguments = 'SELECT log FROM history WHERE job_name = ?', [job_name]
+        if since is not None:
+            query += ' AND executed >= ?'
+            arguments.append(since)
+        if until is not None:
+            query += ' AND executed < ?'
+            arguments.append(until)
+        rows = self.connection().execute(query + ' ORDER BY executed, rowid', arguments)
+        return [json.loads(log) for log, in rows]
+
+    @timed('storage.latest_history')
+    def latest_history(self, job_name):
+        row = self.connection().execute('SELECT log FROM history WHERE job_name = ? ORDER BY executed DESC, '
+                                        'rowid DESC LIMIT 1', (job_name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    @timed('storage.delete_history')
+    def delete_history(self, job_name, before):
+        with self.transaction() as connection:
+            cursor = connection.execute('DELETE FROM history WHERE job_name = ? AND executed < ?',
+                                        (job_name, before))
+        return cursor.rowcount
+
+
+def _encode(stream: str, compression: str = None) -> bytes:
+    body = stream.encode('utf-8')
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(body, GZIP_LEVEL)
+    return body
+
+
+def _is_gzip(logfile) -> bool:
+    return logfile.peek(2)[:2] == GZIP_MAGIC
+
+
+def _text_stream(raw, gzipped: bool):
+    """
+    Decodes a binary file object while it is read, decompressing gzip on the fly
+    """
+    if gzipped:
+        raw = gzip.GzipFile(fileobj=raw, mode='rb')
+    return codecs.getreader('utf-8')(raw)
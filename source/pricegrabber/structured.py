@@ -0,0 +1,109 @@
+"""Prices from structured data embedded in a page
+
+JSON-LD offers, og:price:amount / product:price:amount and itemprop="price" are found with a scan over the raw bytes,
+no DOM is built. Crawler falls back to the job's XPath when a page has none of them.
+"""
+import json
+import re
+
+from .common import timed
+
+SOURCE_JSON_LD: str = "json-ld"
+SOURCE_OPEN_GRAPH: str = "og"
+SOURCE_ITEMPROP: str = "itemprop"
+SOURCE_XPATH: str = "xpath"
+
+_JSON_LD = re.compile(rb'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+_OPEN_GRAPH = re.compile(rb'<meta[^>]+(?:og|product):price:amount[^>]*>', re.IGNORECASE)
+_ITEMPROP = re.compile(rb'<[a-z]+[^>]+itemprop\s*=\s*["\']price["\'][^>]*>', re.IGNORECASE)
+_CONTENT = re.compile(rb'\bcontent\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+
+
+@timed('parse_structured')
+def structured_price(page):
+    """
+    Returns (price, source) from the first structured source holding a price, or None
+    """
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+    if b'ld+json' in page:
+        for match in _JSON_LD.finditer(page):
+            try:
+                price = _normalize_price(_offer_price(json.loads(match.group(1).decode('utf-8'))))
+            except ValueError:
+                continue
+            if price is not None:
+                return price, SOURCE_JSON_LD
+    for pattern, source, marker in ((_OPEN_GRAPH, SOURCE_OPEN_GRAPH, b'price:amount'),
+                                    (_ITEMPROP, SOURCE_ITEMPROP, b'itemprop')):
+        if marker not in page:
+            continue
+        for match in pattern.finditer(page):
+            content = _CONTENT.search(match.group(0))
+            price = None if content is None else _normalize_price(content.group(1).decode('utf-8', 'replace'))
+            if price is not None:
+                return price, source
+    return None
+
+
+def _offer_price(data):
+    """
+    Price of the first offer in a JSON-LD document, following @graph, lists and priceSpecification
+    """
+    if isinstance(data, list):
+        for item in data:
+            price = _offer_price(item)
+            if price is not None:
+                return price
+        return None
+    if not isinstance(data, dict):
+        return None
+    if '@graph' in data:
+        return _offer_price(data['@graph'])
+    offers = data.get('offers')
+    if offers is None:
+        return None
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        for key in ('price', 'lowPrice'):
+            if offer.get(key) not in (None, ''):
+                return offer[key]
+        specification = offer.get('priceSpecification')
+        if isinstance(specification, dict) and specification.get('price') not in (None, ''):
+            return specification['price']
+    return None
+
+
+def _normalize_price(value):
+    """
+    Formats the price like Crawler.parse_price does ('105.00'), None when it isn't a positive number. In text the
+    last separator is the decimal one, unless it repeats (1.299.000) or is the only one with three digits after it:
+    1.299 may be a thousand or one, so it gives None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    text = str(value).strip()
+    if not isinstance(value, (int, float)):
+        text = _decimal_point(text)
+        if text is None:
+            return None
+    try:
+        price = float(text)
+    except ValueError:
+        return None
+    if not 0 < price < float('inf'):
+        return None
+    return '%.2f' % price
+
+
+def _decimal_point(text):
+    last = max(text.rfind(','), text.rfind('.'))
+    if last < 0:
+        return text
+    separator, integer, fraction = text[last], text[:last], text[last + 1:]
+    if separator in integer:  # 1.299.000, a repeated separator groups thousands
+        return text.replace(separator, '') if len(fraction) == 3 else None
+    if len(fraction) == 3 and ',' not in integer and '.' not in integer:
+        return None
+    return integer.replace(',', '').replace('.', '') + '.' + fraction  # 1,299.00 and 1.299,00
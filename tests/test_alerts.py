@@ -0,0 +1,116 @@
+import unittest
+from source.grabber import AlertEngine, FileNotifier, Invoker, JobStorageOS, LastExecutedStore, LogStorageOS, \
+    AbstractNotifier, ALERTS_FILENAME, CENTRAL_LOG_SINGLE, LAST_EXECUTED_FILENAME
+from mock import patch
+import json
+import tempfile
+
+
+class ListNotifier(AbstractNotifier):
+
+    def __init__(self):
+        self.alerts = []
+
+    def notify(self, alerts):
+        self.alerts.extend(alerts)
+
+
+class TestAlertEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+        self.executions = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _site(job_name, alert_whenever, difference):
+        return {'job_name': job_name, 'site_url': 'https://example.com/' + job_name, 'html_query': '//div/text()',
+                'bucket_name': 'bucket', 'alert_whenever': alert_whenever, 'difference': difference}
+
+    def _crawl(self, prices):
+        self.executions += 1
+        store = LastExecutedStore(self.storage)
+        for job_name, price in prices.items():
+            store.update(job_name, '2018-12-20T%02d:00:00' % self.executions, price)
+
+    def test_pct_drop(self):
+        engine = AlertEngine(self.storage)
+        sites = [self._site('shirt', '-5', 'pct')]
+
+        self._crawl({'shirt': '100.00'})
+        self.assertEqual(engine.evaluate(sites), [])
+        self._crawl({'shirt': '97.00'})
+        self.assertEqual(engine.evaluate(sites), [])
+        self._crawl({'shirt': '94.00'})
+        alerts = engine.evaluate(sites)
+
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]['difference'], -6.0)
+        self.assertEqual(alerts[0]['reference'], 100.0)
+
+    def test_alert_is_not_repeated(self):
+        engine = AlertEngine(self.storage)
+        sites = [self._site('shirt', '-1', 'val')]
+
+        self._crawl({'shirt': '10.00'})
+        engine.evaluate(sites)
+        self._crawl({'shirt': '8.00'})
+        self.assertEqual(len(engine.evaluate(sites)), 1)
+        self.assertEqual(engine.evaluate(sites), [])  # same execution evaluated again
+        self._crawl({'shirt': '8.00'})
+        self.assertEqual(engine.evaluate(sites), [])  # no new move
+        self._crawl({'shirt': '6.50'})
+        self.assertEqual(len(engine.evaluate(sites)), 1)
+
+    def test_reference_trails_rising_prices(self):
+        engine = AlertEngine(self.storage)
+        sites = [self._site('shirt', '-10', 'val')]
+
+        for price in ['100.00', '120.00', '109.00']:
+            self._crawl({'shirt': price})
+            alerts = engine.evaluate(sites)
+
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(self.storage.load(ALERTS_FILENAME)['shirt']['reference'], 109.0)
+
+    def test_single_central_log(self):
+        engine = AlertEngine(self.storage, CENTRAL_LOG_SINGLE)
+        sites = [self._site('shirt', '5', 'val')]
+
+        self.storage.save(LAST_EXECUTED_FILENAME, [{'job_name': 'shirt', 'executed': '2018-12-20T01:00:00',
+                                                    'price': '10.00'}])
+        engine.evaluate(sites)
+        self.storage.save(LAST_EXECUTED_FILENAME, [{'job_name': 'shirt', 'executed': '2018-12-20T02:00:00',
+                                                    'price': '15.00'}])
+
+        self.assertEqual(len(engine.evaluate(sites)), 1)
+
+    def test_invoker_notifies_at_end_of_run(self):
+        sites = [self._site('shirt', '-1', 'val'), self._site('pullover', '-1', 'val')]
+        notifier = ListNotifier()
+        grabber = Invoker(JobStorageOS(self.storage_path), log_storage_factory=lambda bucket_name: self.storage,
+                          notifier=notifier)
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value={'sites': sites}), \
+                patch.object(Invoker, '_invoke_lambda', return_value={'StatusCode': 200}):
+            self._crawl({'shirt': '10.00', 'pullover': '20.00'})
+            grabber.grab()
+            self._crawl({'shirt': '8.00', 'pullover': '20.00'})
+            grabber.grab()
+
+        self.assertEqual([alert['job_name'] for alert in notifier.alerts], ['shirt'])
+
+    def test_file_notifier(self):
+        notifier = FileNotifier(self.storage_path + 'alerts.jsonl')
+        notifier.notify([{'job_name': 'shirt'}, {'job_name': 'pullover'}])
+
+        with open(self.storage_path + 'alerts.jsonl', 'r') as logfile:
+            self.assertEqual([json.loads(line)['job_name'] for line in logfile], ['shirt', 'pullover'])
+
+
+if __name__ == '__main__':
+    unittest.main()
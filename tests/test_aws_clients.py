@@ -0,0 +1,55 @@
+import unittest
+from source.grabber import AwsClients
+
+
+class TestAwsClients(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = AwsClients(max_pool_connections=25)
+
+    def test_client_is_reused(self):
+        first = self.clients.client('s3')
+        second = self.clients.client('s3')
+
+        self.assertIs(first, second)
+        self.assertEqual(self.clients.stats(), {'created': 1, 'reused': 1})
+
+    def test_clients_are_keyed_by_service_region_and_config(self):
+        s3 = self.clients.client('s3')
+        s3_us = self.clients.client('s3', region_name='us-east-1')
+        lambda_client = self.clients.client('lambda')
+        lambda_timeout = self.clients.client('lambda', read_timeout=3)
+
+        self.assertEqual(len({id(s3), id(s3_us), id(lambda_client), id(lambda_timeout)}), 4)
+        self.assertEqual(s3_us.meta.region_name, 'us-east-1')
+        self.assertEqual(self.clients.stats(), {'created': 4, 'reused': 0})
+
+    def test_pool_size_is_configurable(self):
+        s3 = self.clients.client('s3')
+        self.assertEqual(s3.meta.config.max_pool_connections, 25)
+
+        self.clients.max_pool_connections = 50
+        bigger = self.clients.client('s3')
+        self.assertIsNot(s3, bigger)
+        self.assertEqual(bigger.meta.config.max_pool_connections, 50)
+
+    def test_override(self):
+        stand_in = object()
+        self.clients.override('s3', stand_in)
+
+        self.assertIs(self.clients.client('s3'), stand_in)
+        self.assertIs(self.clients.client('s3', region_name='us-east-1', read_timeout=3), stand_in)
+        self.assertIsNot(self.clients.client('lambda'), stand_in)
+
+        self.clients.override('s3', None)
+        self.assertIsNot(self.clients.client('s3'), stand_in)
+
+    def test_clear(self):
+        self.clients.client('s3')
+        self.clients.clear()
+
+        self.assertEqual(self.clients.stats(), {'created': 0, 'reused': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from source.grabber import BatchCrawler, BufferedLog, Crawler, Invoker, JobStorageOS, LastExecutedStore, LogStorageOS
+from mock import patch
+import json
+import os
+import tempfile
+import threading
+
+
+class TestBatchCrawler(unittest.TestCase):
+    QUERY = "//div[contains(@class, 'h-product-price')]/div/text()"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        with open('./tests/test-data/shirt.html', 'r') as my_file:
+            self.page = my_file.read()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _jobs(self, count):
+        return [{'job_name': 'job-' + str(i), 'site_url': 'https://example.com/' + str(i), 'html_query': self.QUERY,
+                 'bucket_name': 'bucket'} for i in range(count)]
+
+    def _get_web_page(self, url, stop_at=None):
+        if url.endswith('/broken'):
+            raise Exception('HTTP Error 503')
+        return self.page
+
+    def test_grab_prices_logs_every_job(self):
+        with patch.object(Crawler, 'get_web_page', side_effect=self._get_web_page):
+            crawler = BatchCrawler(LogStorageOS(self.storage_path), fetch_workers=4)
+            result = crawler.grab_prices(self._jobs(6))
+
+        self.assertEqual([item['price'] for item in result], ['105.00'] * 6)
+        self.assertEqual([item['status'] for item in result], [200] * 6)
+        for i in range(6):
+            self.assertTrue(os.path.isfile(self.storage_path + 'job-' + str(i) + '.json'))
+        self.assertEqual(len(LastExecutedStore(LogStorageOS(self.storage_path)).aggregate()), 6)
+
+    def test_grab_prices_with_process_pool(self):
+        with patch.object(Crawler, 'get_web_page', side_effect=self._get_web_page):
+            crawler = BatchCrawler(LogStorageOS(self.storage_path), fetch_workers=2, parse_workers=2)
+            result = crawler.grab_prices(self._jobs(3))
+
+        self.assertEqual([item['price'] for item in result], ['105.00'] * 3)
+
+    def test_prices_are_logged_as_pages_come_in(self):
+        logged = threading.Event()
+        events = []
+        latest_execution = BufferedLog.latest_execution
+
+        def log(self, job_name, price, changed=True):
+            events.append('logged ' + job_name)
+            logged.set()
+            return latest_execution(self, job_name, price, changed)
+
+        def get_web_page(url, stop_at=None):
+            if url.endswith('/1'):
+                logged.wait(2)  # the slow page is still loading when the fast one is logged
+                events.append('fetched job-1')
+            return self.page
+
+        with patch.object(Crawler, 'get_web_page', side_effect=get_web_page), \
+                patch.object(BufferedLog, 'latest_execution', autospec=True, side_effect=log):
+            result = BatchCrawler(LogStorageOS(self.storage_path), fetch_workers=2).grab_prices(self._jobs(2))
+
+        self.assertEqual(events, ['logged job-0', 'fetched job-1', 'logged job-1'])
+        self.assertEqual([item['status'] for item in result], [200, 200])
+
+    def test_failing_job_does_not_stop_the_batch(self):
+        jobs = self._jobs(2)
+        jobs[0]['site_url'] = 'https://example.com/broken'
+        with patch.object(Crawler, 'get_web_page', side_effect=self._get_web_page):
+            crawler = BatchCrawler(LogStorageOS(self.storage_path))
+            result = crawler.grab_prices(jobs)
+
+        self.assertEqual([item['status'] for item in result], [500, 200])
+        self.assertFalse(os.path.isfile(self.storage_path + 'job-0.json'))
+
+    def test_jobs_of_one_page_share_the_fetch(self):
+        jobs = self._jobs(4)
+        for job in jobs[1:]:
+            job['site_url'] = jobs[0]['site_url']
+        jobs[3]['html_query'] = "//div[@class='h-text h-color-black title-typo h-p-top-m']/text()"
+        with patch.object(Crawler, 'get_web_page', side_effect=self._get_web_page) as get_web_page:
+            crawler = BatchCrawler(LogStorageOS(self.storage_path), fetch_workers=4)
+            result = crawler.grab_prices(jobs)
+
+        get_web_page.assert_called_once_with(jobs[0]['site_url'], None)
+        self.assertEqual([item['price'] for item in result], ['105.00'] * 4)
+        for i in range(4):
+            self.assertTrue(os.path.isfile(self.storage_path + 'job-' + str(i) + '.json'))
+
+    def test_invoker_grab_batch(self):
+        with patch.object(Invoker, 'get_website_monitor_list', return_value={'sites': self._jobs(3)}), \
+                patch.object(Crawler, 'get_web_page', side_effect=self._get_web_page):
+            grabber = Invoker(JobStorageOS(self.storage_path))
+            result = json.loads(grabber.grab_batch(lambda bucket_name: LogStorageOS(self.storage_path)))
+
+        self.assertEqual(result, [{'job_name': 'job-' + str(i), 'status': 200} for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from source.grabber import BufferedLog, Log, LogStorageOS, LastExecutedStore, LAST_EXECUTED_FILENAME, \
+    CENTRAL_LOG_SHARDED, CENTRAL_LOG_SINGLE
+from mock import patch
+import tempfile
+import time
+
+
+class TestBufferedLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LogStorageOS(self.tmp.name + "/")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _central_saves(self, save):
+        return [call for call in save.call_args_list if call[0][1] == LAST_EXECUTED_FILENAME]
+
+    def test_flush_saves_central_log_once(self):
+        log = BufferedLog(self.storage, central_log_format=CENTRAL_LOG_SINGLE)
+        with patch.object(LogStorageOS, 'save_if', autospec=True, side_effect=LogStorageOS.save_if) as save:
+            for i in range(5):
+                log.latest_execution('job-%d' % i, '%d.00' % (90 + i))
+            self.assertEqual(save.call_count, 0)
+            self.assertEqual(log.flush(), {})
+        self.assertEqual(len(self._central_saves(save)), 1)
+        central = {job['job_name']: job['price'] for job in self.storage.load(LAST_EXECUTED_FILENAME)}
+        self.assertEqual(central, {'job-%d' % i: '%d.00' % (90 + i) for i in range(5)})
+        self.assertEqual([job['price'] for job in Log(self.storage).history('job-3')], ['93.00'])
+
+    def test_flush_keeps_every_execution_in_history(self):
+        log = BufferedLog(self.storage)
+        log.latest_execution('white-tshirt', '90.00')
+        log.latest_execution('white-tshirt', '91.00')
+        log.latest_execution('white-tshirt', '91.00', changed=False)
+        log.flush()
+        self.assertEqual([job['price'] for job in log.history('white-tshirt')], ['90.00', '91.00'])
+        self.assertEqual(log.latest('white-tshirt')['price'], '91.00')
+
+    def test_flushes_after_max_pending(self):
+        log = BufferedLog(self.storage, max_pending=3)
+        log.latest_execution('job-0', '90.00')
+        log.latest_execution('job-1', '91.00')
+        self.assertEqual(LastExecutedStore(self.storage).aggregate(), [])
+        log.latest_execution('job-2', '92.00')
+        self.assertEqual(len(LastExecutedStore(self.storage).aggregate()), 3)
+
+    def test_flushes_after_max_age(self):
+        log = BufferedLog(self.storage, max_age=0.05)
+        log.latest_execution('white-tshirt', '90.00')
+        for _ in range(100):
+            if LastExecutedStore(self.storage).aggregate():
+                break
+            time.sleep(0.02)
+        self.assertEqual(LastExecutedStore(self.storage).aggregate()[0]['price'], '90.00')
+
+    def test_exit_flushes_on_error(self):
+        with self.assertRaises(ValueError):
+            with BufferedLog(self.storage) as log:
+                log.latest_execution('white-tshirt', '90.00')
+                raise ValueError()
+        self.assertEqual(LastExecutedStore(self.storage).aggregate()[0]['price'], '90.00')
+
+    def test_failed_history_is_left_out_of_central_log(self):
+        log = BufferedLog(self.storage)
+        log.latest_execution('white-tshirt', '90.00')
+        log.latest_execution('black-tshirt', '80.00')
+        write_history = log._write_history
+
+        def fail_white(job_name, logs):
+            if job_name == 'white-tshirt':
+                raise IOError('disk full')
+            write_history(job_name, logs)
+
+        with patch.object(log, '_write_history', side_effect=fail_white):
+            failed = log.flush()
+        self.assertEqual(list(failed), ['white-tshirt'])
+        self.assertEqual([job['job_name'] for job in LastExecutedStore(self.storage).aggregate()], ['black-tshirt'])
+
+    def test_exit_raises_for_failed_jobs(self):
+        with patch.object(Log, '_write_history', side_effect=IOError('disk full')):
+            with self.assertRaises(Exception):
+                with BufferedLog(self.storage) as log:
+                    log.latest_execution('white-tshirt', '90.00')
+
+    def test_sharded_central_log(self):
+        log = BufferedLog(self.storage, central_log_format=CENTRAL_LOG_SHARDED)
+        log.latest_execution('white-tshirt', '90.00')
+        log.latest_execution('black-tshirt', '80.00')
+        self.assertEqual(log.flush(), {})
+        store = LastExecutedStore(self.storage)
+        self.assertEqual(store.get('white-tshirt')['price'], '90.00')
+        self.assertEqual(store.get('black-tshirt')['price'], '80.00')
+
+
+if __name__ == '__main__':
+    unittest.main()
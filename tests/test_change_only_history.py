@@ -0,0 +1,110 @@
+import unittest
+from source.grabber import Log, BufferedLog, LogStorageOS, LastExecutedStore, \
+    HISTORY_SEGMENTED, CENTRAL_LOG_SHARDED
+from mock import patch
+import tempfile
+
+
+class TestChangeOnlyHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LogStorageOS(self.tmp.name + "/")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _central(self, job_name):
+        return LastExecutedStore(self.storage).get(job_name)
+
+    def test_unchanged_price_is_only_counted(self):
+        log = Log(self.storage, change_only=True)
+        for _ in range(5):
+            log.latest_execution('white-tshirt', '90.00')
+
+        stored = self.storage.load('white-tshirt.json')
+        self.assertEqual([job['price'] for job in stored], ['90.00'])
+        central = self._central('white-tshirt')
+        self.assertEqual(central['count'], 5)
+        self.assertEqual(central['since'], stored[0]['executed'])
+        self.assertGreaterEqual(central['executed'], central['since'])
+
+    def test_history_writes_only_on_change(self):
+        log = Log(self.storage, change_only=True)
+        with patch.object(LogStorageOS, 'save', autospec=True, side_effect=LogStorageOS.save) as save:
+            for price in ('90.00', '90.00', '90.00', '90.00', '91.00'):
+                log.latest_execution('white-tshirt', price)
+
+        history_saves = [call for call in save.call_args_list if call[0][1] == 'white-tshirt.json']
+        self.assertEqual(len(history_saves), 2)
+
+    def test_change_closes_the_run(self):
+        log = Log(self.storage, change_only=True)
+        for price in ('90.00', '90.00', '90.00', '91.00'):
+            log.latest_execution('white-tshirt', price)
+
+        stored = self.storage.load('white-tshirt.json')
+        self.assertEqual([(job['price'], job.get('count')) for job in stored],
+                         [('90.00', None), ('90.00', 3), ('91.00', None)])
+        self.assertEqual(stored[1]['since'], stored[0]['executed'])
+        self.assertEqual(self._central('white-tshirt')['count'], 1)
+        self.assertEqual([job['price'] for job in log.history('white-tshirt', expand=True)],
+                         ['90.00', '90.00', '90.00', '91.00'])
+
+    def test_history_ends_with_current_run(self):
+        log = Log(self.storage, change_only=True)
+        for price in ('91.00', '90.00', '90.00', '90.00'):
+            log.latest_execution('white-tshirt', price)
+
+        history = log.history('white-tshirt')
+        self.assertEqual([(job['price'], job.get('count')) for job in history],
+                         [('91.00', None), ('90.00', None), ('90.00', 3)])
+        self.assertEqual(len(log.history('white-tshirt', expand=True)), 4)
+        self.assertEqual(log.latest('white-tshirt'),
+                         {'executed': history[-1]['executed'], 'price': '90.00'})
+
+    def test_expand_spreads_a_run(self):
+        records = [{'executed': '2018-12-01T00:00:00', 'price': '90.00'},
+                   {'executed': '2018-12-01T04:00:00', 'price': '90.00', 'count': 5, 'since': '2018-12-01T00:00:00'},
+                   {'executed': '2018-12-01T05:00:00', 'price': '91.00'}]
+
+        self.assertEqual(Log.expand(records),
+                         [{'executed': '2018-12-01T0%d:00:00' % hour, 'price': '90.00'} for hour in range(5)] +
+                         [{'executed': '2018-12-01T05:00:00', 'price': '91.00'}])
+        # the run start comes from since when the first record was cut off
+        self.assertEqual(len(Log.expand(records[1:])), 6)
+
+    def test_full_history_entry_starts_a_run(self):
+        Log(self.storage).latest_execution('white-tshirt', '90.00')
+        log = Log(self.storage, change_only=True)
+        log.latest_execution('white-tshirt', '90.00')
+
+        self.assertEqual(len(self.storage.load('white-tshirt.json')), 1)
+        self.assertEqual(self._central('white-tshirt')['count'], 2)
+
+    def test_segmented_sharded(self):
+        log = Log(self.storage, HISTORY_SEGMENTED, CENTRAL_LOG_SHARDED, change_only=True)
+        for price in ('90.00', '90.00', '91.00', '91.00'):
+            log.latest_execution('white-tshirt', price)
+
+        self.assertEqual(LastExecutedStore(self.storage).get('white-tshirt')['count'], 2)
+        self.assertEqual([job['price'] for job in log.history('white-tshirt', expand=True)],
+                         ['90.00', '90.00', '91.00', '91.00'])
+
+    def test_buffered_log(self):
+        log = BufferedLog(self.storage, change_only=True)
+        for price in ('90.00', '90.00', '90.00'):
+            log.latest_execution('white-tshirt', price)
+        log.latest_execution('black-tshirt', '80.00', changed=False)
+        self.assertEqual(log.flush(), {})
+        log.latest_execution('white-tshirt', '92.00')
+        log.flush()
+
+        self.assertEqual([(job['price'], job.get('count')) for job in self.storage.load('white-tshirt.json')],
+                         [('90.00', None), ('90.00', 3), ('92.00', None)])
+        self.assertEqual([job['price'] for job in self.storage.load('black-tshirt.json')], ['80.00'])
+        self.assertEqual(self._central('black-tshirt')['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from source.grabber import Compactor, LastExecutedStore, Log, LogStorageOS, HISTORY_SEGMENTED
+from datetime import datetime, timedelta
+from mock import patch
+import tempfile
+
+
+class TestCompactor(unittest.TestCase):
+    NOW = datetime(2018, 12, 20, 0, 0, 0)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _executions(self, days, every_hours=2):
+        start = self.NOW - timedelta(days=days)
+        logs = []
+        for i in range(days * 24 // every_hours):
+            executed = start + timedelta(hours=every_hours * i)
+            logs.append({'executed': Log._json_serial(executed), 'price': '%.2f' % (90 + i % 3)})
+        return logs
+
+    def test_rollup_and_retention(self):
+        self.storage.save('shirt.json', self._executions(40))
+        compactor = Compactor(self.storage, retention_days=30)
+
+        result = compactor.compact('shirt', now=self.NOW)
+
+        self.assertEqual(result, {'job_name': 'shirt', 'rolled_up': 480, 'dropped': 120})
+        rollup = compactor.rollup('shirt')
+        self.assertEqual(len(rollup['daily']['start']), 40)
+        self.assertEqual(len(rollup['hourly']['start']), 480)
+        self.assertEqual(rollup['daily']['count'][0], 12)
+        self.assertEqual(rollup['daily']['min'][0], 90.0)
+        self.assertEqual(rollup['daily']['max'][0], 92.0)
+        self.assertEqual(rollup['daily']['last'][-1], 92.0)
+        self.assertEqual(len(self.storage.load('shirt.json')), 360)
+
+    def test_compaction_is_incremental(self):
+        logs = self._executions(2)
+        self.storage.save('shirt.json', logs[:10])
+        compactor = Compactor(self.storage)
+        compactor.compact('shirt', now=self.NOW)
+
+        self.storage.save('shirt.json', logs)
+        result = compactor.compact('shirt', now=self.NOW)
+
+        self.assertEqual(result['rolled_up'], len(logs) - 10)
+        rollup = compactor.rollup('shirt')
+        self.assertEqual(sum(rollup['daily']['count']), len(logs))
+        self.assertEqual(rollup['watermark'], logs[-1]['executed'])
+
+        with patch.object(Compactor, '_add') as add:
+            self.assertEqual(compactor.compact('shirt', now=self.NOW)['rolled_up'], 0)
+            add.assert_not_called()
+
+    def _change_only_history(self, count):
+        """
+        20 hourly executions at 10.00, then count at 12.00 in the run still going on
+        """
+        def hour(i):
+            return Log._json_serial(self.NOW - timedelta(days=1) + timedelta(hours=i))
+        self.storage.save('shirt.json', [{'executed': hour(0), 'price': '10.00'},
+                                         {'executed': hour(19), 'price': '10.00', 'count': 20, 'since': hour(0)},
+                                         {'executed': hour(20), 'price': '12.00'}])
+        LastExecutedStore(self.storage).update('shirt', hour(19 + count), '12.00', count=count, since=hour(20))
+
+    def test_change_only_runs_are_rolled_up_per_execution(self):
+        self._change_only_history(4)
+        compactor = Compactor(self.storage, change_only=True)
+
+        self.assertEqual(compactor.compact('shirt', now=self.NOW)['rolled_up'], 24)
+
+        rollup = compactor.rollup('shirt')
+        self.assertEqual(rollup['daily']['count'], [24])
+        self.assertEqual((rollup['daily']['min'], rollup['daily']['max'], rollup['daily']['last']),
+                         ([10.0], [12.0], [12.0]))
+        self.assertEqual(len(rollup['hourly']['start']), 24)
+        self.assertEqual(set(rollup['hourly']['count']), {1})
+
+    def test_change_only_current_run_is_rolled_up_incrementally(self):
+        self._change_only_history(2)
+        compactor = Compactor(self.storage, change_only=True)
+        compactor.compact('shirt', now=self.NOW)
+
+        self._change_only_history(4)
+        self.assertEqual(compactor.compact('shirt', now=self.NOW)['rolled_up'], 2)
+        self.assertEqual(compactor.rollup('shirt')['daily']['count'], [24])
+
+    def test_change_only_irregular_crawls_are_counted_once(self):
+        log = Log(self.storage, change_only=True)
+        compactor = Compactor(self.storage, change_only=True)
+        start = self.NOW - timedelta(days=1)
+        crawls = [(minute, '10.00') for minute in (0, 7, 60, 61, 62, 200, 400)] + [(500, '11.00')]
+        for i, (minute, price) in enumerate(crawls):
+            executed = {'executed': Log._json_serial(start + timedelta(minutes=minute)), 'price': price}
+            with patch.object(Log, '_create_job_executed_log', return_value=executed):
+                log.latest_execution('shirt', price)
+            if i + 1 in (3, 5, 8):
+                compactor.compact('shirt', now=self.NOW)
+
+        rollup = compactor.rollup('shirt')
+        self.assertEqual(rollup['daily']['count'], [8])
+        self.assertEqual(sum(rollup['hourly']['count']), 8)
+        self.assertEqual(rollup['daily']['last'], [11.0])
+
+    def test_segmented_history_drops_old_segments(self):
+        for log in self._executions(5):
+            self.storage.append('shirt/' + log['executed'][:10] + '.jsonl', [log])
+        compactor = Compactor(self.storage, retention_days=2, history_format=HISTORY_SEGMENTED)
+
+        result = compactor.compact('shirt', now=self.NOW)
+
+        self.assertEqual(result['rolled_up'], 60)
+        self.assertEqual(self.storage.list_objects('shirt/'),
+                         ['shirt/2018-12-18.jsonl', 'shirt/2018-12-19.jsonl'])
+
+    def test_hourly_retention(self):
+        self.storage.save('shirt.json', self._executions(10))
+        compactor = Compactor(self.storage, hourly_retention_days=1)
+
+        compactor.compact('shirt', now=self.NOW)
+
+        rollup = compactor.rollup('shirt')
+        self.assertEqual(len(rollup['hourly']['start']), 12)
+        self.assertEqual(len(rollup['daily']['start']), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
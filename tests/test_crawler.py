@@ -1,5 +1,5 @@
 import unittest
-from source.grabber import Crawler, LogStorageOS
+from source.grabber import Crawler, LogStorageOS, compiled_xpath
 
 
 class TestCrawlerMethods(unittest.TestCase):
@@ -47,6 +47,33 @@ class TestCrawlerMethods(unittest.TestCase):
         with self.assertRaises(Exception):
             web.parse_html(page, "//div[@class='h-text h-color-black title-typo']/text()")
 
+    def test_parse_html_early_exit(self):
+        web = self._ctor_crawler()
+        page = self.test_get_shirt_html()
+        data = web.parse_html(page, "//div[contains(@class, 'h-product-price')]/div/text()", early_exit=True)
+        self.assertEqual(data, u'CHF\xa0105.00')
+
+    def test_parse_html_early_exit_failing(self):
+        web = self._ctor_crawler()
+        page = self.test_get_shirt_html()
+        with self.assertRaises(Exception):
+            web.parse_html(page, "//div[@class='h-text h-color-black title-typo']/text()", early_exit=True)
+
+    def test_parse_prices_evaluates_every_query(self):
+        web = self._ctor_crawler()
+        page = self.test_get_shirt_html()
+        queries = ["//div[@class='h-text h-color-black title-typo h-p-top-m']/text()",
+                   "//div[contains(@class, 'h-product-price')]/div/text()",
+                   "//div[@class='h-text h-color-black title-typo']/text()"]
+        prices = web.parse_prices(page, queries)
+        self.assertEqual(prices[queries[0]], '105.00')
+        self.assertEqual(prices[queries[1]], '105.00')
+        self.assertIsInstance(prices[queries[2]], Exception)
+
+    def test_compiled_xpath_is_cached(self):
+        query = "//div[contains(@class, 'h-product-price')]/div/text()"
+        self.assertIs(compiled_xpath(query), compiled_xpath(query))
+
 
 if __name__ == '__main__':
     unittest.main()
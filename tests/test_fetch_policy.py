@@ -0,0 +1,140 @@
+import unittest
+from source.grabber import Fetcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import threading
+import time
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /slow sleeps delay seconds, /flaky fails with 503 until failures are used up, /down always fails with 503,
+    /slow-once is slow for its first request only, /missing is a 404
+    """
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    requests = {}
+    delay = 0
+    failures = 0
+
+    def do_GET(self):
+        with self.lock:
+            count = StubHandler.requests[self.path] = StubHandler.requests.get(self.path, 0) + 1
+            failing = self.path == '/down' or self.path == '/flaky' and count <= StubHandler.failures
+        if self.path == '/slow' or self.path == '/slow-once' and count == 1:
+            time.sleep(self.delay)
+        status = 503 if failing else 404 if self.path == '/missing' else 200
+        body = b'<html>CHF 90.00</html>'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client timed out
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetchPolicy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.daemon_threads = True
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.requests = {}
+        StubHandler.delay = 0
+        StubHandler.failures = 0
+
+    def test_read_timeout(self):
+        StubHandler.delay = 0.5
+        fetcher = Fetcher(min_interval=0, read_timeout=0.1, retries=0)
+
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            fetcher.get(self.url + '/slow')
+
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_transient_errors_are_retried(self):
+        StubHandler.failures = 2
+        fetcher = Fetcher(min_interval=0, retries=2, backoff=0.01)
+
+        self.assertEqual(fetcher.get(self.url + '/flaky').status_code, 200)
+        self.assertEqual(StubHandler.requests['/flaky'], 3)
+
+    def test_retries_are_limited(self):
+        fetcher = Fetcher(min_interval=0, retries=2, backoff=0.01)
+
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(self.url + '/down')
+        self.assertEqual(StubHandler.requests['/down'], 3)
+
+    def test_no_retry_after_deadline(self):
+        fetcher = Fetcher(min_interval=0, retries=5, backoff=0.01, deadline=0)
+
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(self.url + '/down')
+        self.assertEqual(StubHandler.requests['/down'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        fetcher = Fetcher(min_interval=0, retries=2, backoff=0.01)
+
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(self.url + '/missing')
+        self.assertEqual(StubHandler.requests['/missing'], 1)
+
+    def test_circuit_opens_after_failures(self):
+        fetcher = Fetcher(min_interval=0, retries=0, threshold=2, cooldown=60)
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                fetcher.get(self.url + '/down')
+
+        with self.assertRaisesRegex(Exception, 'Circuit open'):
+            fetcher.get(self.url + '/flaky')
+        self.assertEqual(StubHandler.requests, {'/down': 2})
+
+    def test_circuit_closes_after_cooldown(self):
+        fetcher = Fetcher(min_interval=0, retries=0, threshold=1, cooldown=0.05)
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(self.url + '/down')
+        with self.assertRaisesRegex(Exception, 'Circuit open'):
+            fetcher.get(self.url + '/flaky')
+
+        time.sleep(0.06)
+        self.assertEqual(fetcher.get(self.url + '/flaky').status_code, 200)
+        self.assertEqual(fetcher.get(self.url + '/flaky').status_code, 200)
+
+    def test_slow_request_is_hedged(self):
+        fetcher = Fetcher(min_interval=0, hedge=True, hedge_percentile=50)
+        for _ in range(20):
+            fetcher.get(self.url + '/')
+        StubHandler.delay = 1
+
+        started = time.monotonic()
+        self.assertEqual(fetcher.get(self.url + '/slow-once').status_code, 200)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(StubHandler.requests['/slow-once'], 2)
+
+    def test_no_hedging_without_latencies(self):
+        fetcher = Fetcher(min_interval=0, hedge=True)
+        StubHandler.delay = 0.2
+
+        fetcher.get(self.url + '/slow-once')
+
+        self.assertEqual(StubHandler.requests['/slow-once'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
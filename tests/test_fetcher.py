@@ -0,0 +1,97 @@
+import unittest
+from source.grabber import Fetcher
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import threading
+import time
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    connections = set()
+    delay = 0
+
+    def do_GET(self):
+        with self.lock:
+            CountingHandler.connections.add(self.client_address)
+            CountingHandler.in_flight += 1
+            CountingHandler.max_in_flight = max(CountingHandler.max_in_flight, CountingHandler.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            CountingHandler.in_flight -= 1
+        body = b'missing' if self.path == '/missing' else b'<html>CHF 90.00</html>'
+        self.send_response(404 if self.path == '/missing' else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+        cls.url = 'http://127.0.0.1:%d/' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        CountingHandler.in_flight = 0
+        CountingHandler.max_in_flight = 0
+        CountingHandler.connections = set()
+        CountingHandler.delay = 0
+
+    def test_connections_are_kept_alive(self):
+        fetcher = Fetcher(min_interval=0)
+        for _ in range(3):
+            self.assertEqual(fetcher.get(self.url).content, b'<html>CHF 90.00</html>')
+
+        self.assertEqual(len(CountingHandler.connections), 1)
+
+    def test_concurrency_per_host_is_limited(self):
+        CountingHandler.delay = 0.05
+        fetcher = Fetcher(max_per_host=2, min_interval=0)
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda i: fetcher.get(self.url), range(6)))
+
+        self.assertEqual(CountingHandler.max_in_flight, 2)
+
+    def test_requests_to_a_host_are_spaced(self):
+        fetcher = Fetcher(min_interval=0.1)
+
+        started = time.time()
+        for _ in range(4):
+            fetcher.get(self.url)
+
+        self.assertGreaterEqual(time.time() - started, 0.3)
+
+    def test_http_errors_raise(self):
+        fetcher = Fetcher(min_interval=0)
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(self.url + 'missing')
+
+    def test_interleave_by_host(self):
+        jobs = [{'site_url': 'https://www.zalando.ch/1'}, {'site_url': 'https://www.zalando.ch/2'},
+                {'site_url': 'https://www.zalando.ch/3'}, {'site_url': 'https://shop.example.com/1'}]
+
+        result = Fetcher.interleave_by_host(jobs)
+
+        self.assertEqual([job['site_url'] for job in result],
+                         ['https://www.zalando.ch/1', 'https://shop.example.com/1', 'https://www.zalando.ch/2',
+                          'https://www.zalando.ch/3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
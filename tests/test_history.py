@@ -0,0 +1,59 @@
+import unittest
+from source.grabber import Log, LogStorageOS, HISTORY_SEGMENTED
+from datetime import datetime, timedelta
+from mock import patch
+import os
+import tempfile
+
+
+class TestSegmentedHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_writes_day_segment(self):
+        log = Log(self.storage, HISTORY_SEGMENTED)
+        log.latest_execution('white-tshirt', '90.00')
+        log.latest_execution('white-tshirt', '91.00')
+
+        segment = 'white-tshirt/' + datetime.utcnow().date().isoformat() + '.jsonl'
+        self.assertTrue(os.path.isfile(self.storage_path + segment))
+        self.assertFalse(os.path.isfile(self.storage_path + 'white-tshirt.json'))
+        self.assertEqual([job['price'] for job in self.storage.load_lines(segment)], ['90.00', '91.00'])
+        self.assertEqual([job['price'] for job in log.history('white-tshirt')], ['90.00', '91.00'])
+
+    def test_append_does_not_read_history(self):
+        log = Log(self.storage, HISTORY_SEGMENTED)
+        with patch.object(LogStorageOS, 'load_lines') as load_lines:
+            log._append_to_job_log('white-tshirt', '90.00')
+            load_lines.assert_not_called()
+
+    def test_history_since_only_reads_recent_segments(self):
+        today = datetime(2018, 12, 20, 12, 0, 0)
+        for days in range(10, -1, -1):
+            executed = (today - timedelta(days=days)).isoformat()
+            segment = 'white-tshirt/' + executed[:10] + '.jsonl'
+            self.storage.append(segment, [{'executed': executed, 'price': str(days)}])
+        log = Log(self.storage, HISTORY_SEGMENTED)
+
+        with patch.object(LogStorageOS, 'load_lines', wraps=self.storage.load_lines) as load_lines:
+            result = log.history('white-tshirt', since=today - timedelta(days=2, hours=1))
+
+        self.assertEqual([job['price'] for job in result], ['2', '1', '0'])
+        self.assertEqual(load_lines.call_count, 3)
+
+    def test_json_history(self):
+        log = Log(self.storage)
+        log.latest_execution('white-tshirt', '90.00')
+
+        self.assertEqual([job['price'] for job in log.history('white-tshirt')], ['90.00'])
+        self.assertEqual(log.history('white-tshirt', since=datetime.utcnow() + timedelta(hours=1)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
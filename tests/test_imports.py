@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import unittest
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source')
+
+
+class TestImports(unittest.TestCase):
+
+    @staticmethod
+    def loaded_after(statement):
+        script = statement + '; import sys; print(",".join(sorted(sys.modules)))'
+        return subprocess.check_output([sys.executable, '-c', script], cwd=SOURCE).decode().strip().split(',')
+
+    def test_invoke_handler_does_not_load_crawler_dependencies(self):
+        loaded = self.loaded_after('import lambda_invoke_grabber')
+        self.assertNotIn('lxml', loaded)
+        self.assertNotIn('requests', loaded)
+
+    def test_price_handler_does_not_load_yaml(self):
+        loaded = self.loaded_after('import lambda_price_grabber')
+        self.assertNotIn('yaml', loaded)
+        self.assertNotIn('boto3', loaded)
+
+    def test_grabber_still_exports_everything(self):
+        from source.grabber import Crawler, Invoker, Log, LogStorageOS, JobStorageOS, aws_clients, metrics
+        from source.pricegrabber.crawler import Crawler as PackageCrawler
+        self.assertIs(Crawler, PackageCrawler)
+        self.assertTrue(all((Invoker, Log, LogStorageOS, JobStorageOS, aws_clients, metrics)))
+
+
+if __name__ == '__main__':
+    unittest.main()
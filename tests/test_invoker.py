@@ -1,18 +1,29 @@
 import unittest
-from source.grabber import Invoker, JobStorageOS
+from source.grabber import Invoker, JobStorageOS, aws_clients
 from mock import patch
+from botocore.exceptions import ReadTimeoutError
+import io
 import json
+import time
 
 class TestInvokerMethods(unittest.TestCase):
     STORAGE_PATH = "./tests/test-data/"
 
-    def _ctor_invoker(self):
+    def _ctor_invoker(self, **kwargs):
         """
         construct Crawler class
         """
 
         storage = JobStorageOS(self.STORAGE_PATH)
-        return Invoker(storage)
+        return Invoker(storage, **kwargs)
+
+    @staticmethod
+    def _website_list(count):
+        sites = []
+        for i in range(count):
+            sites.append({'job_name': 'job-' + str(i), 'site_url': 'https://example.com/' + str(i),
+                          'html_query': '//div/text()', 'bucket_name': 'bucket'})
+        return {'sites': sites}
 
     def test_load_local_get_website_monitor_list(self):
         grabber = self._ctor_invoker()
@@ -40,3 +51,91 @@ class TestInvokerMethods(unittest.TestCase):
             for item in test_result:
                 self.assertTrue(item['job_name'] is not None, 'Missing job_name')
                 self.assertEqual(item['status'], "200", 'Missing status')
+
+    def test_concurrent_invoker_runs_in_parallel(self):
+        def slow_invoke(payload, timeout):
+            time.sleep(0.2)
+            return {'StatusCode': 200}
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=self._website_list(5)), \
+                patch.object(Invoker, '_invoke_lambda', side_effect=slow_invoke):
+            grabber = self._ctor_invoker(max_workers=5)
+
+            started = time.time()
+            result = json.loads(grabber.grab())
+            elapsed = time.time() - started
+
+            self.assertLess(elapsed, 0.6, 'Invocations did not run concurrently')
+            self.assertEqual([item['job_name'] for item in result], ['job-' + str(i) for i in range(5)])
+            for item in result:
+                self.assertEqual(item['status'], 200)
+
+    def test_jobs_of_one_page_share_an_invocation(self):
+        website_list = self._website_list(4)
+        for site in website_list['sites'][1:3]:
+            site['site_url'] = website_list['sites'][0]['site_url']
+        payloads = []
+
+        def invoke(payload, timeout):
+            payloads.append(json.loads(payload))
+            jobs = payloads[-1].get('jobs')
+            if jobs is None:
+                return {'StatusCode': 200}
+            body = {'jobs': [{'job_name': job['job_name'], 'status': 500 if job['job_name'] == 'job-2' else 200}
+                             for job in jobs]}
+            return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(json.dumps(body)).encode('utf-8'))}
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=website_list), \
+                patch.object(Invoker, '_invoke_lambda', side_effect=invoke):
+            result = json.loads(self._ctor_invoker(max_workers=2).grab())
+
+        self.assertEqual(2, len(payloads))
+        self.assertIn(['job-0', 'job-1', 'job-2'], [[job['job_name'] for job in payload.get('jobs', [])]
+                                                    for payload in payloads])
+        self.assertEqual([item['status'] for item in result], [200, 200, 500, 200])
+
+    def test_concurrent_invoker_reports_failed_jobs(self):
+        def failing_invoke(payload, timeout):
+            job_name = json.loads(payload)['job_name']
+            if job_name == 'job-1':
+                raise ReadTimeoutError(endpoint_url='https://lambda')
+            if job_name == 'job-2':
+                raise Exception('boom')
+            return {'StatusCode': 200}
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=self._website_list(3)), \
+                patch.object(Invoker, '_invoke_lambda', side_effect=failing_invoke):
+            grabber = self._ctor_invoker(max_workers=3)
+
+            result = json.loads(grabber.grab())
+
+            self.assertEqual([item['status'] for item in result], [200, 504, 500])
+
+    def test_pool_size_is_set_per_client(self):
+        before = aws_clients.max_pool_connections
+        grabber = self._ctor_invoker(max_workers=50)
+        self.assertEqual(aws_clients.max_pool_connections, before)
+
+        with patch.object(aws_clients, 'client') as client:
+            grabber._invoke_lambda('{}', 3)
+            grabber._dispatch_lambda('{}')
+
+        for call in client.call_args_list:
+            self.assertEqual(call[1]['max_pool_connections'], 50)
+
+    def test_function_errors_are_reported_as_errors(self):
+        def invoke(payload, timeout):
+            event = json.loads(payload)
+            if event.get('job_name') == 'job-1' or 'jobs' in event:
+                # lambda answers 200 and sets FunctionError when the handler raised
+                return {'StatusCode': 200, 'FunctionError': 'Unhandled',
+                        'Payload': io.BytesIO(b'{"errorMessage": "boom"}')}
+            return {'StatusCode': 200}
+
+        website_list = self._website_list(4)
+        website_list['sites'][3]['site_url'] = website_list['sites'][2]['site_url']
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=website_list), \
+                patch.object(Invoker, '_invoke_lambda', side_effect=invoke):
+            result = json.loads(self._ctor_invoker(max_workers=2).grab())
+
+        self.assertEqual([item['status'] for item in result], [200, 500, 500, 500])
@@ -0,0 +1,99 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from mock import patch
+from botocore.exceptions import ClientError
+from source.grabber import JobStorageOS, JobStorageS3, JOBS_FILENAME, aws_clients, manifest_name
+from source.pricegrabber import storage as storage_module
+
+JOBS = """sites:
+  -
+    job_name: %s
+    bucket_name: "bucket"
+    site_url: "https://example.com/shirt.html"
+    html_query: "//div/text()"
+"""
+
+
+class FakeS3:
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.calls.append(Key)
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        etag = '"%d"' % hash(self.objects[Key])
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key]), 'ETag': etag}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body.encode('utf-8')
+
+
+class TestJobManifest(unittest.TestCase):
+
+    def setUp(self):
+        storage_module._job_manifests.clear()
+        self.folder = tempfile.TemporaryDirectory()
+        self.storage_path = self.folder.name + '/'
+        self.write_jobs('white-shirt-1')
+
+    def tearDown(self):
+        storage_module._job_manifests.clear()
+        self.folder.cleanup()
+
+    def write_jobs(self, job_name):
+        with open(self.storage_path + JOBS_FILENAME, 'w') as outfile:
+            outfile.write(JOBS % job_name)
+
+    def test_warm_load_doesnt_parse_again(self):
+        storage = JobStorageOS(self.storage_path)
+        jobs = storage.load(JOBS_FILENAME)
+        with patch.object(storage_module, 'parse_jobs') as parse_jobs:
+            self.assertIs(jobs, storage.load(JOBS_FILENAME))
+            parse_jobs.assert_not_called()
+
+    def test_changed_job_list_is_parsed_again(self):
+        storage = JobStorageOS(self.storage_path)
+        storage.load(JOBS_FILENAME)
+        self.write_jobs('white-shirt-22')
+        self.assertEqual('white-shirt-22', storage.load(JOBS_FILENAME)['sites'][0]['job_name'])
+
+    def test_cold_load_uses_the_json_manifest(self):
+        JobStorageOS(self.storage_path, manifest=True).load(JOBS_FILENAME)
+        self.assertTrue(os.path.isfile(self.storage_path + manifest_name(JOBS_FILENAME)))
+        storage_module._job_manifests.clear()
+        with patch.object(storage_module, 'parse_jobs') as parse_jobs:
+            jobs = JobStorageOS(self.storage_path, manifest=True).load(JOBS_FILENAME)
+            parse_jobs.assert_not_called()
+        self.assertEqual('white-shirt-1', jobs['sites'][0]['job_name'])
+
+    def test_invalid_job_list_raises(self):
+        with open(self.storage_path + JOBS_FILENAME, 'w') as outfile:
+            outfile.write('sites:\n  -\n    job_name: no-url\n')
+        with self.assertRaises(Exception):
+            JobStorageOS(self.storage_path).load(JOBS_FILENAME)
+
+    def test_s3_revalidates_with_etag(self):
+        s3 = FakeS3({JOBS_FILENAME: (JOBS % 'white-shirt-1').encode('utf-8')})
+        with patch.object(aws_clients, 'client', return_value=s3):
+            jobs = JobStorageS3('bucket', manifest=True).load(JOBS_FILENAME)
+            self.assertIn(manifest_name(JOBS_FILENAME), s3.objects)
+            with patch.object(storage_module, 'parse_jobs') as parse_jobs:
+                self.assertIs(jobs, JobStorageS3('bucket').load(JOBS_FILENAME))
+                storage_module._job_manifests.clear()
+                from_manifest = JobStorageS3('bucket', manifest=True).load(JOBS_FILENAME)
+                parse_jobs.assert_not_called()
+            self.assertEqual(jobs, from_manifest)
+            manifest = json.loads(s3.objects[manifest_name(JOBS_FILENAME)].decode('utf-8'))
+            self.assertEqual(JOBS_FILENAME, manifest['source'])
+
+
+if __name__ == '__main__':
+    unittest.main()
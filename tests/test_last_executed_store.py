@@ -0,0 +1,96 @@
+import unittest
+from source.grabber import LastExecutedStore, Log, LogStorageOS, CENTRAL_LOG_SHARDED, CENTRAL_LOG_SINGLE, \
+    LAST_EXECUTED_FILENAME, CAS_DEADLINE
+from concurrent.futures import ThreadPoolExecutor
+from mock import patch
+import os
+import tempfile
+import time
+
+
+class TestLastExecutedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sharded_central_log(self):
+        log = Log(self.storage, central_log_format=CENTRAL_LOG_SHARDED)
+        log.latest_execution('december', '90.00')
+        log.latest_execution('january', '80.00')
+        log.latest_execution('december', '91.00')
+
+        store = LastExecutedStore(self.storage)
+        self.assertEqual(store.get('december')['price'], '91.00')
+        self.assertEqual(store.get('january')['price'], '80.00')
+        self.assertIsNone(store.get('february'))
+        self.assertFalse(os.path.isfile(self.storage_path + LAST_EXECUTED_FILENAME))
+
+    def test_aggregate(self):
+        store = LastExecutedStore(self.storage)
+        store.update('december', '2018-12-01T10:00:00', '90.00')
+        store.update('january', '2018-12-01T11:00:00', '80.00')
+
+        jobs = store.aggregate(save=True)
+
+        self.assertEqual([job['job_name'] for job in jobs], ['december', 'january'])
+        self.assertEqual(self.storage.load(LAST_EXECUTED_FILENAME), jobs)
+
+    def test_older_execution_does_not_overwrite_newer(self):
+        store = LastExecutedStore(self.storage)
+        store.update('december', '2018-12-02T10:00:00', '91.00')
+        store.update('december', '2018-12-01T10:00:00', '90.00')
+
+        self.assertEqual(store.get('december')['price'], '91.00')
+
+    def test_save_if_detects_concurrent_write(self):
+        self.storage.save_if('job.json', {'price': '1'}, None)
+        _, version = self.storage.load_versioned('job.json')
+
+        self.assertTrue(self.storage.save_if('job.json', {'price': '2'}, version))
+        self.assertFalse(self.storage.save_if('job.json', {'price': '3'}, version))
+        self.assertFalse(self.storage.save_if('job.json', {'price': '4'}, None))
+        self.assertEqual(self.storage.load('job.json'), {'price': '2'})
+
+    def test_concurrent_updates_are_not_lost(self):
+        store = LastExecutedStore(self.storage)
+        executions = ['2018-12-01T10:00:%02d' % i for i in range(40)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda executed: store.update('december', executed, executed), executions))
+
+        self.assertEqual(store.get('december')['executed'], executions[-1])
+
+    def test_concurrent_jobs_are_kept_in_single_central_log(self):
+        log = Log(self.storage, central_log_format=CENTRAL_LOG_SINGLE)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: log.latest_execution('job-%d' % i, '90.00'), range(40)))
+
+        self.assertEqual(len(self.storage.load(LAST_EXECUTED_FILENAME)), 40)
+
+    def test_conflicting_writes_stop_at_the_deadline(self):
+        started = time.monotonic()
+        with patch.object(LogStorageOS, 'save_if', return_value=False) as save_if:
+            with self.assertRaises(Exception):
+                LastExecutedStore(self.storage).update('december', '2018-12-01T10:00:00', '90.00')
+            with self.assertRaises(Exception):
+                Log(self.storage, central_log_format=CENTRAL_LOG_SINGLE).latest_execution('december', '90.00')
+
+        self.assertLess(time.monotonic() - started, 2 * CAS_DEADLINE + 0.2)
+        self.assertGreater(save_if.call_count, 2)
+
+    def test_lock_files_stay_in_storage_folder(self):
+        store = LastExecutedStore(self.storage)
+        store.update('december', '2018-12-01T10:00:00', '90.00')
+
+        self.assertTrue(any(name.endswith('.lock') for name in os.listdir(self.storage_path + 'last-executed')))
+        self.assertEqual(self.storage.list_objects('last-executed/'), ['last-executed/december.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
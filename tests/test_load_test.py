@@ -0,0 +1,51 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+
+LOAD_TEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'load_test.py')
+
+
+class TestLoadTest(unittest.TestCase):
+    """
+    Smoke runs of the load test harness, in a fresh interpreter because it imports the handlers like lambda does
+    """
+
+    def _run(self, *args) -> dict:
+        output = subprocess.check_output([sys.executable, LOAD_TEST, '--jobs', '20', '--shops', '3', '--latency', '0',
+                                          '--page-kb', '1'] + list(args), timeout=120)
+        return json.loads(output.decode('utf-8'))
+
+    def test_invoke(self):
+        report = self._run('--mode', 'invoke', '--max-workers', '4')
+
+        self.assertEqual(report['statuses'], {'200': 20})
+        self.assertEqual(report['lambda']['grab-price']['count'], 20)
+        self.assertEqual(report['page_statuses'], {'200': 20})
+        self.assertGreater(report['storage']['operations']['put_object'], 20)
+        self.assertGreater(report['jobs_per_second'], 0)
+
+    def test_concurrent_invocations_keep_every_central_log_entry(self):
+        report = self._run('--mode', 'invoke', '--max-workers', '20', '--s3-latency', '0.01')
+
+        self.assertEqual(report['statuses'], {'200': 20})
+        self.assertEqual(report['central_log_entries'], 20)
+
+    def test_sharded(self):
+        report = self._run('--mode', 'sharded', '--shard-size', '5')
+
+        self.assertEqual(report['statuses'], {'200': 20})
+        # 7, 7 and 6 jobs per shop, every shop is a chain of two shards
+        self.assertEqual(report['lambda']['grab-batch']['count'], 6)
+        self.assertEqual(report['central_log_entries'], 20)
+
+    def test_jobs_per_page(self):
+        report = self._run('--mode', 'batch', '--jobs-per-page', '4')
+
+        self.assertEqual(report['statuses'], {'200': 20})
+        self.assertEqual(report['pages']['count'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
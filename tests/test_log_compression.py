@@ -0,0 +1,98 @@
+import gzip
+import io
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from mock import patch
+from botocore.exceptions import ClientError
+from source.grabber import LogStorageOS, LogStorageS3, COMPRESSION_GZIP, GZIP_MAGIC, aws_clients
+
+
+class FakeS3:
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body, kwargs = self.objects[Key]
+        response = {'Body': io.BytesIO(body), 'ContentLength': len(body), 'ETag': '"%d"' % hash(body)}
+        if 'ContentEncoding' in kwargs:
+            response['ContentEncoding'] = kwargs['ContentEncoding']
+        return response
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = (Body, kwargs)
+
+
+class TestLogCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        start = datetime(2018, 12, 1)
+        self.history = [{'executed': (start + timedelta(hours=2 * i)).isoformat(), 'price': '105.00'}
+                        for i in range(1000)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _raw(self, name):
+        with open(self.storage_path + name, 'rb') as logfile:
+            return logfile.read()
+
+    def test_gzip_round_trip(self):
+        storage = LogStorageOS(self.storage_path, COMPRESSION_GZIP)
+        storage.save('shirt.json', self.history)
+        raw = self._raw('shirt.json')
+        self.assertEqual(raw[:2], GZIP_MAGIC)
+        self.assertLess(len(raw) * 10, len(gzip.decompress(raw)))
+        self.assertEqual(storage.load('shirt.json'), self.history)
+        self.assertEqual(LogStorageOS(self.storage_path).load('shirt.json'), self.history)
+
+    def test_plain_logs_are_still_read(self):
+        LogStorageOS(self.storage_path).save('shirt.json', self.history)
+        self.assertEqual(LogStorageOS(self.storage_path, COMPRESSION_GZIP).load('shirt.json'), self.history)
+
+    def test_append_keeps_the_format_of_the_file(self):
+        plain = LogStorageOS(self.storage_path)
+        compressed = LogStorageOS(self.storage_path, COMPRESSION_GZIP)
+        plain.append('plain/2018-12-01.jsonl', self.history[:2])
+        compressed.append('plain/2018-12-01.jsonl', self.history[2:4])
+        compressed.append('gzip/2018-12-01.jsonl', self.history[:2])
+        plain.append('gzip/2018-12-01.jsonl', self.history[2:4])
+
+        self.assertNotEqual(self._raw('plain/2018-12-01.jsonl')[:2], GZIP_MAGIC)
+        self.assertEqual(self._raw('gzip/2018-12-01.jsonl')[:2], GZIP_MAGIC)
+        for name in ('plain/2018-12-01.jsonl', 'gzip/2018-12-01.jsonl'):
+            self.assertEqual(plain.load_lines(name), self.history[:4])
+
+    def test_versioned_writes(self):
+        storage = LogStorageOS(self.storage_path, COMPRESSION_GZIP)
+        self.assertTrue(storage.save_if('last/shirt.json', {'price': '105.00'}, None))
+        logs, version = storage.load_versioned('last/shirt.json')
+        self.assertEqual(logs, {'price': '105.00'})
+        self.assertTrue(storage.save_if('last/shirt.json', {'price': '99.00'}, version))
+        self.assertFalse(storage.save_if('last/shirt.json', {'price': '98.00'}, version))
+
+    def test_s3_marks_gzip_with_content_encoding(self):
+        s3 = FakeS3()
+        with patch.object(aws_clients, 'client', return_value=s3):
+            LogStorageS3('bucket').save('plain.json', self.history)
+            storage = LogStorageS3('bucket', COMPRESSION_GZIP)
+            storage.save('shirt.json', self.history)
+            storage.append('shirt/2018-12-01.jsonl', self.history[:2])
+            storage.append('shirt/2018-12-01.jsonl', self.history[2:4])
+
+            body, kwargs = s3.objects['shirt.json']
+            self.assertEqual(kwargs['ContentEncoding'], 'gzip')
+            self.assertEqual(body[:2], GZIP_MAGIC)
+            self.assertEqual(storage.load('shirt.json'), self.history)
+            self.assertEqual(storage.load('plain.json'), self.history)
+            self.assertEqual(storage.load_lines('shirt/2018-12-01.jsonl'), self.history[:4])
+            self.assertEqual(storage.load('missing.json'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
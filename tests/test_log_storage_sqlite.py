@@ -0,0 +1,102 @@
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from source.grabber import Compactor, LastExecutedStore, Log, LogStorageSQLite, HISTORY_INDEXED
+
+
+class TestLogStorageSQLite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LogStorageSQLite(self.tmp.name + '/logs.db')
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_objects(self):
+        self.assertEqual(self.storage.load('shirt.json'), [])
+        self.assertFalse(self.storage.check_exists('shirt.json'))
+        self.storage.save('shirt.json', [{'price': '105.00'}])
+        self.storage.save('shirt.json', [{'price': '99.00'}])
+        self.assertTrue(self.storage.check_exists('shirt.json'))
+        self.assertEqual(self.storage.load('shirt.json'), [{'price': '99.00'}])
+        self.storage.delete('shirt.json')
+        self.assertFalse(self.storage.check_exists('shirt.json'))
+
+    def test_lines_and_list_objects(self):
+        self.storage.append('shirt/2018-12-01.jsonl', [{'price': '105.00'}, {'price': '104.00'}])
+        self.storage.append('shirt/2018-12-01.jsonl', [{'price': '103.00'}])
+        self.storage.append('shirt/2018-12-02.jsonl', [{'price': '102.00'}])
+        self.storage.save('shirt.json', [])
+        self.storage.save('shirts/2018-12-01.json', [])
+        self.assertEqual([log['price'] for log in self.storage.load_lines('shirt/2018-12-01.jsonl')],
+                         ['105.00', '104.00', '103.00'])
+        self.assertEqual(self.storage.list_objects('shirt/'), ['shirt/2018-12-01.jsonl', 'shirt/2018-12-02.jsonl'])
+        self.assertEqual(self.storage.list_objects('shirt/', 'shirt/2018-12-01'), ['shirt/2018-12-01.jsonl',
+                                                                                   'shirt/2018-12-02.jsonl'])
+        self.assertEqual(self.storage.list_objects('shirt/', 'shirt/2018-12-01.jsonl'), ['shirt/2018-12-02.jsonl'])
+        self.assertEqual(len(self.storage.list_objects('')), 4)
+
+    def test_compare_and_swap(self):
+        store = LastExecutedStore(self.storage)
+        store.update('shirt', '2018-12-01T10:00:00', '105.00')
+        _, version = self.storage.load_versioned('last-executed/shirt.json')
+        self.assertTrue(self.storage.save_if('last-executed/shirt.json', {'price': '99.00'}, version))
+        self.assertFalse(self.storage.save_if('last-executed/shirt.json', {'price': '98.00'}, version))
+        self.assertFalse(self.storage.save_if('last-executed/shirt.json', {'price': '98.00'}, None))
+
+    def test_log_uses_the_indexed_history(self):
+        log = Log(self.storage)
+        self.assertEqual(log.history_format, HISTORY_INDEXED)
+        since = datetime.utcnow()
+        for price in ('105.00', '99.00', '98.00'):
+            log.latest_execution('shirt', price)
+        log.latest_execution('pullover', '90.00')
+        self.assertEqual([job['price'] for job in log.history('shirt')], ['105.00', '99.00', '98.00'])
+        self.assertEqual(log.latest('shirt')['price'], '98.00')
+        self.assertEqual(len(log.history('shirt', since - timedelta(seconds=1))), 3)
+        self.assertEqual(log.history('shirt', since + timedelta(days=1)), [])
+        self.assertEqual(len(LastExecutedStore(self.storage).aggregate()), 2)
+        self.assertFalse(self.storage.check_exists('shirt.json'))
+
+    def test_history_range_uses_the_index(self):
+        plan = self.storage.connection().execute(
+            'EXPLAIN QUERY PLAN SELECT log FROM history WHERE job_name = ? AND executed >= ? ORDER BY executed',
+            ('shirt', '2018-12-01')).fetchall()
+        self.assertIn('history_job_executed', ' '.join(str(row) for row in plan))
+        mode, = self.storage.connection().execute('PRAGMA journal_mode').fetchone()
+        self.assertEqual(mode, 'wal')
+
+    def test_transaction_batches_and_rolls_back(self):
+        with self.storage.transaction():
+            self.storage.append_history('shirt', [{'executed': '2018-12-01T10:00:00', 'price': '105.00'}])
+            self.storage.append_history('shirt', [{'executed': '2018-12-01T12:00:00', 'price': '104.00'}])
+        with self.assertRaises(ValueError):
+            with self.storage.transaction():
+                self.storage.append_history('shirt', [{'executed': '2018-12-01T14:00:00', 'price': '103.00'}])
+                raise ValueError()
+        self.assertEqual(len(self.storage.load_history('shirt')), 2)
+        self.assertEqual(len(self.storage.load_history('shirt', until='2018-12-01T12:00:00')), 1)
+
+    def test_connection_per_thread(self):
+        self.storage.save('shirt.json', [{'price': '105.00'}])
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.storage.load('shirt.json')))
+        thread.start()
+        thread.join()
+        self.assertEqual(result, [[{'price': '105.00'}]])
+
+    def test_compactor_drops_old_rows(self):
+        now = datetime(2018, 12, 31)
+        self.storage.append_history('shirt', [{'executed': (now - timedelta(days=40 - i)).isoformat(),
+                                               'price': '105.00'} for i in range(40)])
+        result = Compactor(self.storage, retention_days=30).compact('shirt', now)
+        self.assertEqual(result['rolled_up'], 40)
+        self.assertEqual(result['dropped'], 10)
+        self.assertEqual(len(self.storage.load_history('shirt')), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from source.grabber import Log, LogStorageOS, LAST_EXECUTED_FILENAME
+from source.grabber import Log, LogStorageOS, LAST_EXECUTED_FILENAME, CENTRAL_LOG_SINGLE
 import random
 import os
 import json
@@ -12,7 +12,7 @@ class TestLogger(unittest.TestCase):
     def _ctor_logger(self):
         """construct Log class"""
         storage = LogStorageOS(self.STORAGE_PATH)
-        return Log(storage)
+        return Log(storage, central_log_format=CENTRAL_LOG_SINGLE)
 
     # def tearDown(self):
         # self._delete(self.LOGFILE_LAST_EXECUTED)
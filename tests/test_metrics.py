@@ -0,0 +1,78 @@
+import unittest
+from source.grabber import Crawler, Log, LogStorageOS, Metrics, metrics, run_profiled, timed
+from mock import patch
+import io
+import tempfile
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LogStorageOS(self.tmp.name + "/")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_timed(self):
+        @timed('work')
+        def work(value):
+            return value * 2
+
+        self.assertEqual(work(2), 4)
+        work(3)
+
+        timer = metrics.snapshot()['timers']['work']
+        self.assertEqual(timer['count'], 2)
+        self.assertGreaterEqual(timer['seconds'], 0)
+
+    def test_crawler_stages_are_timed(self):
+        with open('./tests/test-data/shirt.html', 'r') as my_file:
+            page = my_file.read()
+
+        data = Crawler.parse_html(page, "//div[contains(@class, 'h-product-price')]/div/text()")
+        Crawler.parse_price(data)
+
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(timers['parse_html']['count'], 1)
+        self.assertEqual(timers['parse_price']['count'], 1)
+
+    def test_storage_calls_and_bytes(self):
+        log = Log(self.storage)
+        log.latest_execution('shirt', '90.00')
+        log.latest_execution('shirt', '91.00')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['timers']['storage.save']['count'], 2)
+        self.assertEqual(snapshot['timers']['storage.load']['count'], 2)
+        self.assertEqual(snapshot['timers']['storage.save_if']['count'], 2)  # the central log
+        self.assertEqual(snapshot['timers']['storage.load_versioned']['count'], 2)
+        self.assertGreater(snapshot['counters']['storage.written_bytes'], 0)
+        self.assertGreater(snapshot['counters']['storage.read_bytes'], 0)
+        self.assertEqual(snapshot['counters']['history.entries_rewritten'], 3)
+
+    def test_emf(self):
+        local = Metrics()
+        local.add_time('fetch', 0.25)
+        local.count('fetch.bytes', 1024)
+
+        record = local.emf(dimensions={'FunctionName': 'grab-price'})
+
+        self.assertEqual(record['fetch'], 250)
+        self.assertEqual(record['fetch.bytes'], 1024)
+        self.assertEqual(record['FunctionName'], 'grab-price')
+        definition = record['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(definition['Dimensions'], [['FunctionName']])
+        self.assertIn({'Name': 'fetch', 'Unit': 'Milliseconds'}, definition['Metrics'])
+        self.assertIn({'Name': 'fetch.bytes', 'Unit': 'Bytes'}, definition['Metrics'])
+
+    def test_run_profiled(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(run_profiled(sorted, [3, 1, 2]), [1, 2, 3])
+
+        self.assertIn('function calls', stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
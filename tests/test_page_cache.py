@@ -0,0 +1,122 @@
+import unittest
+from source.grabber import Crawler, LastExecutedStore, Log, LogStorageOS, web_fetcher
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from mock import patch
+import os
+import tempfile
+import threading
+
+
+class ShopHandler(BaseHTTPRequestHandler):
+    page = b''
+    etag = None
+    requests = []
+
+    def do_GET(self):
+        ShopHandler.requests.append(dict(self.headers))
+        if self.etag is not None and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.etag is not None:
+            self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPageCache(unittest.TestCase):
+    QUERY = "//div[contains(@class, 'h-product-price')]/div/text()"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), ShopHandler)
+        cls.url = 'http://127.0.0.1:%d/shirt.html' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.min_interval = web_fetcher.min_interval
+        web_fetcher.min_interval = 0
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        web_fetcher.min_interval = cls.min_interval
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+        with open('./tests/test-data/shirt.html', 'rb') as my_file:
+            ShopHandler.page = my_file.read()
+        ShopHandler.etag = None
+        ShopHandler.requests = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_not_modified_skips_parse_and_history(self):
+        ShopHandler.etag = '"v1"'
+        crawler = Crawler(self.storage)
+        self.assertEqual(crawler.grab_price('shirt', self.url, self.QUERY), '105.00')
+
+        with patch.object(Crawler, 'parse_html') as parse_html:
+            self.assertEqual(crawler.grab_price('shirt', self.url, self.QUERY), '105.00')
+            parse_html.assert_not_called()
+
+        self.assertEqual(ShopHandler.requests[1].get('If-None-Match'), '"v1"')
+        self.assertEqual(len(Log(self.storage).history('shirt')), 1)
+        self.assertEqual(len(LastExecutedStore(self.storage).aggregate()), 1)
+
+    def test_same_content_hash_skips_parse(self):
+        crawler = Crawler(self.storage)
+        crawler.grab_price('shirt', self.url, self.QUERY)
+
+        with patch.object(Crawler, 'parse_html') as parse_html:
+            self.assertEqual(crawler.grab_price('shirt', self.url, self.QUERY), '105.00')
+            parse_html.assert_not_called()
+
+        self.assertEqual(len(Log(self.storage).history('shirt')), 1)
+
+    def test_changed_page_is_parsed(self):
+        crawler = Crawler(self.storage)
+        crawler.grab_price('shirt', self.url, self.QUERY)
+        ShopHandler.page = ShopHandler.page.replace(b'105.00', b'99.00')
+
+        self.assertEqual(crawler.grab_price('shirt', self.url, self.QUERY), '99.00')
+        self.assertEqual([job['price'] for job in Log(self.storage).history('shirt')], ['105.00', '99.00'])
+
+    def test_jobs_of_one_page_share_fetch_and_cache(self):
+        ShopHandler.etag = '"v1"'
+        crawler = Crawler(self.storage)
+        title = "//div[@class='h-text h-color-black title-typo h-p-top-m']/text()"
+        jobs = [{'job_name': 'shirt', 'html_query': self.QUERY}, {'job_name': 'shirt-title', 'html_query': title}]
+        result = crawler.grab_page(self.url, jobs)
+        self.assertEqual([item['price'] for item in result], ['105.00', '105.00'])
+        self.assertEqual(len(ShopHandler.requests), 1)
+
+        with patch.object(Crawler, 'parse_prices') as parse_prices:
+            result = crawler.grab_page(self.url, jobs)
+            parse_prices.assert_not_called()
+        self.assertEqual([item['price'] for item in result], ['105.00', '105.00'])
+        self.assertEqual(ShopHandler.requests[1].get('If-None-Match'), '"v1"')
+
+        # a query the cache doesn't know yet needs the page, not a 304
+        crawler.grab_page(self.url, jobs + [{'job_name': 'shirt-3', 'html_query': self.QUERY + '[1]'}])
+        self.assertIsNone(ShopHandler.requests[2].get('If-None-Match'))
+        self.assertEqual(len(LastExecutedStore(self.storage).aggregate()), 3)
+
+    def test_page_cache_disabled(self):
+        crawler = Crawler(self.storage, page_cache=False)
+        crawler.grab_price('shirt', self.url, self.QUERY)
+        crawler.grab_price('shirt', self.url, self.QUERY)
+
+        self.assertEqual(len(Log(self.storage).history('shirt')), 2)
+        self.assertFalse(os.path.isdir(self.storage_path + 'page-cache'))
+
+
+if __name__ == '__main__':
+    unittest.main()
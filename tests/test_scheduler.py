@@ -0,0 +1,126 @@
+import unittest
+from source.grabber import Crawler, Invoker, JobStorageOS, Log, LogStorageOS, Scheduler, SCHEDULE_FILENAME
+from datetime import datetime, timedelta
+from mock import patch
+import json
+import tempfile
+
+
+class TestScheduler(unittest.TestCase):
+    NOW = datetime(2018, 12, 20, 12, 0, 0)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage_path = self.tmp.name + "/"
+        self.storage = LogStorageOS(self.storage_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _history(self, job_name, prices, every_hours=2, now=NOW):
+        start = now - timedelta(hours=every_hours * len(prices))
+        logs = []
+        for i, price in enumerate(prices):
+            logs.append({'executed': Log._json_serial(start + timedelta(hours=every_hours * i)), 'price': price})
+        self.storage.save(job_name + '.json', logs)
+
+    @staticmethod
+    def _site(job_name, **kwargs):
+        site = {'job_name': job_name, 'site_url': 'https://example.com/' + job_name, 'html_query': '//div/text()',
+                'bucket_name': 'bucket'}
+        site.update(kwargs)
+        return site
+
+    def test_new_and_volatile_jobs_are_due(self):
+        self._history('volatile', ['10.00', '11.00', '10.00', '12.00'])
+        scheduler = Scheduler(self.storage)
+
+        due = scheduler.due([self._site('new'), self._site('volatile')], now=self.NOW)
+
+        self.assertEqual([site['job_name'] for site in due], ['new', 'volatile'])
+
+    def test_stable_job_backs_off(self):
+        self._history('stable', ['10.00'] * 24)
+        scheduler = Scheduler(self.storage)
+
+        self.assertEqual(scheduler.due([self._site('stable')], now=self.NOW), [])
+        interval = self.storage.load(SCHEDULE_FILENAME)['stable']['interval']
+        self.assertEqual(interval, 23 * 3600)
+
+    def test_unchanged_pages_back_off(self):
+        with open('./tests/test-data/shirt.html', 'rb') as my_file:
+            page = my_file.read()
+        crawler = Crawler(self.storage, page_cache=True)
+        site = self._site('shirt', html_query="//div[contains(@class, 'h-product-price')]/div/text()")
+        with patch.object(Crawler, 'get_conditional_web_page', return_value=(page, {})):
+            price = crawler.grab_price('shirt', site['site_url'], site['html_query'])
+            # the history ends a day ago, the page cache keeps the crawls since then out of it
+            now = datetime.utcnow()
+            self._history('shirt', [price] * 2, every_hours=12, now=now - timedelta(hours=24))
+            crawler.grab_price('shirt', site['site_url'], site['html_query'])
+        self.assertEqual(len(self.storage.load('shirt.json')), 2)
+
+        self.assertEqual(Scheduler(self.storage).due([site], now=now), [])
+        self.assertGreater(self.storage.load(SCHEDULE_FILENAME)['shirt']['interval'], 23 * 3600)
+
+    def test_not_due_jobs_do_not_read_history(self):
+        self._history('stable', ['10.00'] * 24)
+        scheduler = Scheduler(self.storage)
+        scheduler.due([self._site('stable')], now=self.NOW)
+
+        with patch.object(Log, 'history') as history:
+            self.assertEqual(scheduler.due([self._site('stable')], now=self.NOW + timedelta(hours=2)), [])
+            history.assert_not_called()
+
+        due = scheduler.due([self._site('stable')], now=self.NOW + timedelta(hours=21))
+        self.assertEqual(len(due), 1)
+
+    def test_only_successful_crawls_are_rescheduled(self):
+        self._history('ok', ['10.00', '11.00'])
+        self._history('failed', ['10.00', '11.00'])
+        scheduler = Scheduler(self.storage)
+        sites = [self._site('ok'), self._site('failed')]
+        self.assertEqual(len(scheduler.due(sites, now=self.NOW)), 2)
+
+        scheduler.done([{'job_name': 'ok', 'status': 200}, {'job_name': 'failed', 'status': 504}], now=self.NOW)
+
+        due = scheduler.due(sites, now=self.NOW + timedelta(hours=1))
+        self.assertEqual([site['job_name'] for site in due], ['failed'])
+
+    def test_yml_overrides(self):
+        self._history('fixed', ['10.00'] * 24)
+        self._history('floor', ['10.00', '11.00'])
+        scheduler = Scheduler(self.storage)
+
+        due = scheduler.due([self._site('fixed', interval=3600), self._site('floor', min_interval=86400)],
+                            now=self.NOW)
+
+        self.assertEqual([site['job_name'] for site in due], ['fixed'])
+        self.assertEqual(self.storage.load(SCHEDULE_FILENAME)['floor']['interval'], 86400)
+
+    def test_invoker_only_invokes_due_jobs(self):
+        self._history('stable', ['10.00'] * 24, now=datetime.utcnow())
+        website_list = {'sites': [self._site('new'), self._site('stable')]}
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=website_list), \
+                patch.object(Invoker, '_invoke_lambda', return_value={'StatusCode': 200}):
+            grabber = Invoker(JobStorageOS(self.storage_path), schedule=True,
+                              log_storage_factory=lambda bucket_name: self.storage)
+            result = json.loads(grabber.grab())
+
+        self.assertEqual(result, [{'job_name': 'new', 'status': 200}])
+        self.assertGreater(self.storage.load(SCHEDULE_FILENAME)['new']['next_due'], Log._json_serial(datetime.utcnow()))
+
+    def test_invoker_retries_failed_jobs_in_the_next_run(self):
+        website_list = {'sites': [self._site('new')]}
+        grabber = Invoker(JobStorageOS(self.storage_path), schedule=True,
+                          log_storage_factory=lambda bucket_name: self.storage)
+
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=website_list), \
+                patch.object(Invoker, '_invoke_lambda', return_value={'StatusCode': 500}):
+            self.assertEqual(json.loads(grabber.grab()), [{'job_name': 'new', 'status': 500}])
+            self.assertEqual(json.loads(grabber.grab()), [{'job_name': 'new', 'status': 500}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import io
+import json
+import tempfile
+import unittest
+from mock import patch
+from source.grabber import BatchCrawler, Invoker, JobStorageOS, LogStorageOS, aws_clients, STATUS_ACCEPTED, \
+    STATUS_OK, SHARD_FUNCTION
+
+
+class FakeLambda:
+    """
+    Runs the asynchronous grab-batch invocations in process, like the lambda service would later on
+    """
+
+    def __init__(self, invoker, run_storage, fail_shards=()):
+        self.invoker = invoker
+        self.run_storage = run_storage
+        self.fail_shards = fail_shards
+        self.events = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        assert FunctionName == SHARD_FUNCTION and InvocationType == 'Event'
+        event = json.loads(Payload)
+        self.events.append(event)
+        if event['shard'] in self.fail_shards:
+            raise Exception('Rate exceeded')
+        return {'StatusCode': STATUS_ACCEPTED, 'Payload': io.BytesIO(b'')}
+
+    def run(self, skip=()):
+        # events appended by a shard that dispatches the next one of its chain are run as well
+        for event in self.events:
+            if event['shard'] not in skip and event['shard'] not in self.fail_shards:
+                self.invoker.grab_shard(self.run_storage, event['run_id'], event['shard'])
+
+
+class TestShardedInvoker(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.storage = LogStorageOS(self.folder.name + '/')
+        self.invoker = Invoker(JobStorageOS(self.folder.name + '/'), max_workers=8,
+                               log_storage_factory=lambda bucket_name: self.storage)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    @staticmethod
+    def _website_list(count, shops):
+        return {'sites': [{'job_name': 'job-%d' % i, 'site_url': 'https://shop-%d.example.com/%d' % (i % shops, i),
+                           'html_query': '//div/text()', 'bucket_name': 'bucket-%d' % (i % 3)} for i in range(count)]}
+
+    @staticmethod
+    def _grab_prices(jobs):
+        return [{'job_name': job['job_name'], 'status': STATUS_OK} for job in jobs]
+
+    def _run(self, count, shard_size, shops, fail_shards=(), skip=()):
+        fake = FakeLambda(self.invoker, self.storage, fail_shards)
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=self._website_list(count, shops)), \
+                patch.object(aws_clients, 'client', return_value=fake), \
+                patch.object(BatchCrawler, 'grab_prices', side_effect=self._grab_prices):
+            run = json.loads(self.invoker.fan_out(self.storage, shard_size, {'bucket_name': 'jobs'}))
+            fake.run(skip)
+        return run, fake
+
+    def test_tens_of_thousands_of_jobs(self):
+        run, fake = self._run(20000, 500, 100)
+        # 200 jobs per shop, two shops fit in a shard
+        self.assertEqual(50, run['shards'])
+        self.assertEqual([], run['failed'])
+        self.assertTrue(all(event['bucket_name'] == 'jobs' for event in fake.events))
+        result = json.loads(self.invoker.aggregate(self.storage, run['run_id']))
+        self.assertTrue(result['complete'])
+        self.assertEqual(20000, len(result['jobs']))
+        self.assertEqual('job-19999', result['jobs'][-1]['job_name'])
+        self.assertTrue(all(job['status'] == STATUS_OK for job in result['jobs']))
+
+    def test_missing_shards_are_reported(self):
+        run, fake = self._run(10, 3, 10, fail_shards=(1,), skip=(2,))
+        self.assertEqual(4, run['shards'])
+        self.assertEqual([1], run['failed'])
+        result = json.loads(self.invoker.aggregate(self.storage, run['run_id']))
+        self.assertFalse(result['complete'])
+        self.assertEqual(2, result['done'])
+        statuses = [job['status'] for job in result['jobs']]
+        self.assertEqual([STATUS_OK] * 3 + [None] * 6 + [STATUS_OK], statuses)
+
+    def test_one_shop_is_crawled_by_a_chain_of_shards(self):
+        with patch('source.pricegrabber.invoker.SHARD_FETCH_BUDGET', 50):
+            run, fake = self._run(250, 500, 1)
+        # 100 pages of the shop per shard, the next one starts when the previous one is done
+        self.assertEqual(3, run['shards'])
+        self.assertEqual([0, 1, 2], [event['shard'] for event in fake.events])
+        self.assertTrue(all(event['bucket_name'] == 'jobs' for event in fake.events))
+        self.assertEqual([100, 100, 50], [len(self.storage.load(Invoker._run_object(run['run_id'], 'shard', shard)))
+                                          for shard in range(3)])
+        result = json.loads(self.invoker.aggregate(self.storage, run['run_id']))
+        self.assertTrue(result['complete'])
+
+    def test_only_the_first_shard_of_a_chain_is_dispatched(self):
+        fake = FakeLambda(self.invoker, self.storage)
+        with patch.object(Invoker, 'get_website_monitor_list', return_value=self._website_list(1100, 2)), \
+                patch.object(aws_clients, 'client', return_value=fake):
+            run = json.loads(self.invoker.fan_out(self.storage, 500, {'bucket_name': 'jobs'}))
+        # 550 pages per shop: 400 and 150 of the first shop, then 400 and 150 of the second
+        self.assertEqual(4, run['shards'])
+        self.assertEqual([0, 2], sorted(event['shard'] for event in fake.events))
+
+    def test_unknown_run(self):
+        with self.assertRaises(Exception):
+            self.invoker.aggregate(self.storage, 'nothing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from source.grabber import Fetcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import importlib.util
+import threading
+
+PAGE = b'<html><body><div class="price">CHF 90.00</div><!-- price-end -->' + b'<p>reviews</p>' * 20000 + \
+    b'</body></html>'
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    / serves PAGE, gzip compressed when the client accepts it, /br brotli compressed. /chunked sends it without a
+    Content-Length
+    """
+    protocol_version = 'HTTP/1.1'
+    accept_encoding = None
+
+    def do_GET(self):
+        PageHandler.accept_encoding = self.headers.get('Accept-Encoding')
+        body = PAGE
+        self.send_response(200)
+        if 'gzip' in (self.accept_encoding or '') and self.path == '/':
+            body = gzip.compress(PAGE)
+            self.send_header('Content-Encoding', 'gzip')
+        if 'br' in (self.accept_encoding or '') and self.path == '/br':
+            import brotli
+            body = brotli.compress(PAGE)
+            self.send_header('Content-Encoding', 'br')
+        if self.path == '/chunked':
+            self.send_header('Connection', 'close')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            for start in range(0, len(body), 4096):
+                self.wfile.write(body[start:start + 4096])
+        except OSError:
+            pass  # the client stopped reading
+        if self.path == '/chunked':
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class TestStreamingDownload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        cls.server.daemon_threads = True
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_port
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_gzip_is_requested_and_decoded(self):
+        response = Fetcher(min_interval=0).get(self.url + '/')
+
+        self.assertIn('gzip', PageHandler.accept_encoding)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, PAGE)
+
+    @unittest.skipIf(importlib.util.find_spec('brotli') is None, 'brotli is not installed')
+    def test_brotli_is_requested_and_decoded(self):
+        response = Fetcher(min_interval=0).get(self.url + '/br', stop_at='<!-- price-end -->')
+
+        self.assertIn('br', PageHandler.accept_encoding)
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertTrue(PAGE.startswith(response.content))
+        self.assertIn(b'CHF 90.00', response.content)
+
+    def test_pages_over_max_bytes_fail(self):
+        fetcher = Fetcher(min_interval=0, retries=0, max_bytes=len(PAGE) - 1)
+        for path in ('/', '/identity', '/chunked'):
+            with self.assertRaisesRegex(Exception, 'larger than'):
+                fetcher.get(self.url + path)
+
+    def test_max_bytes_counts_decompressed_bytes(self):
+        fetcher = Fetcher(min_interval=0, retries=0, max_bytes=len(gzip.compress(PAGE)) * 2)
+        with self.assertRaisesRegex(Exception, 'larger than'):
+            fetcher.get(self.url + '/')
+
+    def test_reading_stops_at_marker(self):
+        fetcher = Fetcher(min_interval=0)
+        for path in ('/', '/identity'):
+            content = fetcher.get(self.url + path, stop_at='<!-- price-end -->').content
+
+            self.assertTrue(PAGE.startswith(content))
+            self.assertIn(b'CHF 90.00', content)
+            self.assertLess(len(content), len(PAGE) // 4)
+
+    def test_marker_split_over_chunks(self):
+        fetcher = Fetcher(min_interval=0)
+        marker = PAGE[16380:16390]
+
+        content = fetcher.get(self.url + '/identity', stop_at=marker).content
+
+        self.assertEqual(content, PAGE[:len(content)])
+        self.assertLess(len(content), 16384 * 2 + 1)
+
+    def test_missing_marker_reads_everything(self):
+        content = Fetcher(min_interval=0).get(self.url + '/', stop_at=b'not on the page').content
+        self.assertEqual(content, PAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from source.grabber import BatchCrawler, Crawler, LogStorageOS, structured_price, SOURCE_JSON_LD, \
+    SOURCE_OPEN_GRAPH, SOURCE_ITEMPROP, SOURCE_XPATH
+from mock import patch
+import tempfile
+
+
+class TestStructuredPrice(unittest.TestCase):
+    QUERY = "//div[contains(@class, 'h-product-price')]/div/text()"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LogStorageOS(self.tmp.name + "/")
+        with open('./tests/test-data/shirt.html', 'rb') as my_file:
+            self.page = my_file.read()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_json_ld_offer(self):
+        self.assertEqual(structured_price(self.page), ('105.00', SOURCE_JSON_LD))
+
+    def test_json_ld_graph_and_price_specification(self):
+        page = b'<script type="application/ld+json">{"@graph": [{"@type": "WebPage"}, {"@type": "Product", ' \
+               b'"offers": {"priceSpecification": {"price": 1299.5}}}]}</script>'
+        self.assertEqual(structured_price(page), ('1299.50', SOURCE_JSON_LD))
+
+    def test_broken_json_ld_is_skipped(self):
+        page = b'<script type="application/ld+json">{"offers": </script>' \
+               b'<meta content="19,90" property="og:price:amount">'
+        self.assertEqual(structured_price(page), ('19.90', SOURCE_OPEN_GRAPH))
+
+    def test_itemprop(self):
+        page = '<span itemprop="price" content="1,049.00">CHF 1049.-</span>'
+        self.assertEqual(structured_price(page), ('1049.00', SOURCE_ITEMPROP))
+
+    def test_decimal_separator(self):
+        for content, price in (('1.299,00', '1299.00'), ('1,299.00', '1299.00'), ('1.299.000', '1299000.00'),
+                               ('12,5', '12.50'), ('1299', '1299.00'), ('1.299', None), ('1,299', None),
+                               ('1.299.00', None)):
+            page = '<span itemprop="price" content="%s"></span>' % content
+            self.assertEqual(structured_price(page), None if price is None else (price, SOURCE_ITEMPROP), content)
+
+    def test_no_structured_data(self):
+        self.assertIsNone(structured_price(b'<html><meta itemprop="price" content="n/a"><body>CHF 9.90</body></html>'))
+
+    def test_crawler_uses_structured_data_without_parsing(self):
+        with patch.object(Crawler, 'get_web_page', return_value=self.page), \
+                patch.object(Crawler, 'parse_html') as parse_html:
+            crawler = Crawler(self.storage, page_cache=False, structured=True)
+            result = crawler.grab_page('https://example.com/shirt', [{'job_name': 'shirt', 'html_query': self.QUERY}])
+            parse_html.assert_not_called()
+        self.assertEqual(result[0]['price'], '105.00')
+        self.assertEqual(result[0]['source'], SOURCE_JSON_LD)
+
+    def test_crawler_falls_back_to_xpath(self):
+        page = self.page.replace(b'application/ld+json', b'text/plain')
+        with patch.object(Crawler, 'get_web_page', return_value=page):
+            crawler = Crawler(self.storage, page_cache=False, structured=True)
+            result = crawler.grab_page('https://example.com/shirt', [{'job_name': 'shirt', 'html_query': self.QUERY}])
+        self.assertEqual(result[0]['price'], '105.00')
+        self.assertEqual(result[0]['source'], SOURCE_XPATH)
+
+    def test_batch_crawler_reports_source_per_job(self):
+        jobs = [{'job_name': 'shirt-' + str(i), 'site_url': 'https://example.com/shirt', 'html_query': self.QUERY,
+                 'structured': i == 0} for i in range(2)]
+        with patch.object(Crawler, 'get_web_page', return_value=self.page) as get_web_page:
+            result = BatchCrawler(self.storage).grab_prices(jobs)
+        self.assertEqual(get_web_page.call_count, 2)
+        self.assertEqual([item['source'] for item in result], [SOURCE_JSON_LD, SOURCE_XPATH])
+        self.assertEqual([item['price'] for item in result], ['105.00', '105.00'])
+
+    def test_structured_price_needs_a_single_query(self):
+        other_query = "//div[contains(@class, 'h-product-price')]/div[1]/text()"
+        jobs = [{'job_name': 'shirt', 'html_query': self.QUERY}, {'job_name': 'other', 'html_query': other_query}]
+        with patch.object(Crawler, 'get_web_page', return_value=self.page):
+            crawler = Crawler(self.storage, page_cache=False, structured=True)
+            result = crawler.grab_page('https://example.com/shirt', jobs)
+        self.assertEqual([item['source'] for item in result], [SOURCE_XPATH, SOURCE_XPATH])
+
+
+if __name__ == '__main__':
+    unittest.main()